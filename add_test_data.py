@@ -63,10 +63,18 @@ def add_test_data():
             count = random.randint(1, 10)
             
             try:
+                # One single-value submission per test measurement
+                for table, name in (("machines", machine), ("inspectors", inspector)):
+                    cursor.execute(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", (name,))
                 cursor.execute("""
-                    INSERT INTO measurements (product_id, dimension_id, measured_value, measurement_date, machine_number, count, inspector)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (product_id, dimension_id, measured_value, measurement_date.strftime('%Y-%m-%d'), machine, count, inspector))
+                    INSERT INTO measurement_submissions (product_id, machine_id, inspector_id, count, measured_at)
+                    VALUES (?, (SELECT id FROM machines WHERE name = ?), (SELECT id FROM inspectors WHERE name = ?), ?,
+                            CAST(strftime('%s', ?) AS INTEGER))
+                """, (product_id, machine, inspector, count, measurement_date.strftime('%Y-%m-%d')))
+                cursor.execute("""
+                    INSERT INTO measurement_values (submission_id, dimension_id, measured_value)
+                    VALUES (?, ?, ?)
+                """, (cursor.lastrowid, dimension_id, measured_value))
                 measurements_added += 1
             except Exception as e:
                 # print(f"Error adding measurement: {e}")
@@ -0,0 +1,129 @@
+"""admission.py
+Cross-worker admission control for the heavy endpoints.
+
+Each lane (export, report, upload) has a fixed number of slots shared by all
+gunicorn workers and threads. A slot is an exclusive flock() on a small file in
+ADMISSION_DIR, held for the duration of the request; the kernel drops it when
+the request ends or the worker dies, so a crashed worker never leaks a slot.
+
+A request that finds every slot of its lane busy waits up to ADMISSION_WAIT
+seconds for one to free up, then gets a 429 with Retry-After. Endpoints outside
+the lanes (/measurements, /get_dimensions, ...) are never limited, so a burst
+of exports can no longer occupy every worker.
+
+Limits come from ADMISSION_LIMITS, e.g. 'export=2,report=4,upload=2'; an empty
+value disables admission control. ADMISSION_DIR must be private to the app
+user (report_cache.ensure_private_dir): anyone else able to create the slot
+files there could hold every slot.
+"""
+
+import logging
+import math
+import os
+import time
+
+from flask import g, jsonify, request
+
+from report_cache import ensure_private_dir
+
+try:
+    import fcntl
+except ImportError:  # Windows development server: no cross-process locks
+    fcntl = None
+
+POLL_INTERVAL = 0.05  # seconds between attempts while waiting for a slot
+
+logger = logging.getLogger('admission')
+
+
+def parse_limits(value):
+    """'export=2,report=4' -> {'export': 2, 'report': 4}"""
+    limits = {}
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        lane, _, slots = item.partition('=')
+        limits[lane.strip()] = int(slots)
+    return limits
+
+
+def try_acquire(directory, lane, slots):
+    """Lock a free slot of the lane; returns its file descriptor or None."""
+    for slot in range(slots):
+        fd = os.open(os.path.join(directory, f'{lane}.{slot}.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError:
+            os.close(fd)
+    return None
+
+
+def release(fd):
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+
+
+def init_app(app, lanes):
+    """Limit the endpoints in lanes ({endpoint: lane or (lane, methods)})."""
+    limits = app.config.get('ADMISSION_LIMITS') or {}
+    if not limits:
+        return
+    if fcntl is None:
+        logger.warning("Admission control needs fcntl (POSIX); heavy endpoints are not limited")
+        return
+    directory = app.config['ADMISSION_DIR']
+    if not ensure_private_dir(directory):
+        logger.warning("Admission directory is not private; heavy endpoints are not limited")
+        return
+    wait = app.config.get('ADMISSION_WAIT', 2.0)
+    retry_after = app.config.get('ADMISSION_RETRY_AFTER', 5)
+
+    def lane_for_request():
+        entry = lanes.get(request.endpoint)
+        if entry is None:
+            return None
+        lane, methods = entry if isinstance(entry, tuple) else (entry, None)
+        if methods and request.method not in methods:
+            return None
+        return lane if lane in limits else None
+
+    @app.before_request
+    def admit_request():
+        lane = lane_for_request()
+        if lane is None:
+            return None
+        started = time.monotonic()
+        deadline = started + wait
+        while True:
+            fd = try_acquire(directory, lane, limits[lane])
+            if fd is not None:
+                g._admission_slot = fd
+                break
+            if time.monotonic() >= deadline:
+                return reject(lane)
+            time.sleep(POLL_INTERVAL)
+        registry = app.extensions.get('metrics')
+        if registry is not None:
+            registry.observe('qc_admission_wait_seconds', (lane,), time.monotonic() - started)
+        return None
+
+    def reject(lane):
+        registry = app.extensions.get('metrics')
+        if registry is not None:
+            registry.inc('qc_admission_rejected_total', (lane,))
+        logger.warning(f"Rejected {request.endpoint}: all {limits[lane]} '{lane}' slots busy")
+        message = f'Сървърът е зает с други справки и експорти. Моля, опитайте отново след {retry_after} секунди.'
+        if request.accept_mimetypes.best == 'application/json' or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            response = jsonify({'status': 'error', 'message': message})
+        else:
+            response = app.response_class(message, mimetype='text/plain')
+        response.status_code = 429
+        response.headers['Retry-After'] = str(math.ceil(retry_after))
+        return response
+
+    @app.teardown_request
+    def release_slot(exc):
+        fd = g.pop('_admission_slot', None)
+        if fd is not None:
+            release(fd)
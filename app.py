@@ -1,20 +1,29 @@
 import sqlite3
 import hashlib
+import json
+import socket
 import os
+import stat
 import uuid
 import time
+import random
+import threading
 from datetime import datetime, timedelta, timezone
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, send_file, send_from_directory
-import pandas as pd
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify, session, send_file, send_from_directory
+from jinja2 import FileSystemBytecodeCache, TemplateError
 import re
 import logging
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
-from openpyxl.worksheet.worksheet import Worksheet
+import mimetypes
 import io
 from werkzeug.utils import secure_filename
-from openpyxl.drawing.image import Image as XLImage
+from sqlite_session import SQLiteSessionInterface
+import admission
+import downsample
+import memory_profile
+import metrics
+import report_cache
+import slow_queries
+import tabular_import
 
 app = Flask(__name__)
 
@@ -25,6 +34,69 @@ app.config['DEBUG'] = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
 
 # Session configuration
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=30)  # 30 minutes timeout
+# Only re-issue the session cookie when the session actually changes
+app.config['SESSION_REFRESH_EACH_REQUEST'] = False
+# Seconds between last_activity refreshes; activity within this window does not touch the session
+app.config['SESSION_ACTIVITY_GRANULARITY'] = int(os.environ.get('SESSION_ACTIVITY_GRANULARITY', 60))
+# 'cookie' (signed cookie, default) or 'sqlite' (server-side store, cookie holds only the id)
+app.config['SESSION_STORE'] = os.environ.get('SESSION_STORE', 'cookie')
+
+# Metrics: per-worker files merged by /metrics (see metrics.py); scrapers
+# authenticate with 'Authorization: Bearer <METRICS_TOKEN>', admins via session
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR') or report_cache.default_cache_dir(app.config['DATABASE'], 'metrics')
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+metrics.init_app(app)
+
+# Memory diagnostics (see memory_profile.py): RSS growth per endpoint is always
+# recorded; MEMORY_PROFILE_FRAMES > 0 also runs tracemalloc with that many frames
+app.config['MEMORY_PROFILE_FRAMES'] = int(os.environ.get('MEMORY_PROFILE_FRAMES', 0))
+app.config['MEMORY_PROFILE_DIR'] = os.environ.get('MEMORY_PROFILE_DIR') or report_cache.default_cache_dir(app.config['DATABASE'], 'memory')
+memory_profile.init_app(app)
+
+# Slow-query log: statements slower than SLOW_QUERY_MS (0 = off) are logged with
+# their query plan to SLOW_QUERY_LOG and listed on /slow_queries
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 0))
+app.config['SLOW_QUERY_LOG'] = os.environ.get('SLOW_QUERY_LOG', os.path.join('logs', 'slow_queries.log'))
+
+# Reporting replica: reports and exports read a snapshot refreshed by
+# 'backup_db.py --replica' (started by gunicorn) instead of the live database.
+# Older than REPORT_REPLICA_MAX_AGE seconds (refresher stopped) -> live database.
+app.config['REPORT_REPLICA_PATH'] = os.environ.get('REPORT_REPLICA_PATH', '')
+app.config['REPORT_REPLICA_MAX_AGE'] = int(os.environ.get('REPORT_REPLICA_MAX_AGE', 900))
+
+# Admission control: concurrent slots per lane of heavy endpoints, shared by all
+# workers (see admission.py); over budget -> wait ADMISSION_WAIT s, then 429
+app.config['ADMISSION_LIMITS'] = admission.parse_limits(os.environ.get('ADMISSION_LIMITS', 'export=2,report=4,upload=2'))
+app.config['ADMISSION_DIR'] = os.environ.get('ADMISSION_DIR') or report_cache.default_cache_dir(app.config['DATABASE'], 'admission')
+app.config['ADMISSION_WAIT'] = float(os.environ.get('ADMISSION_WAIT', 2))
+app.config['ADMISSION_RETRY_AFTER'] = 5
+admission.init_app(app, lanes={
+    'export_excel': 'export',
+    'reports': ('report', {'POST'}),
+    'dimension_series': 'report',
+    'tolerance_tables': ('upload', {'POST'}),
+    'upload_drawing': 'upload',
+    'replace_drawing': 'upload',
+    'add_drawing_to_product': 'upload',
+    'upload_mold_specifications': 'upload',
+    'import_dimensions': 'upload',
+    'import_products': 'upload',
+})
+
+# Report result cache shared by all workers (see report_cache.py); 0 MB disables it
+app.config['REPORT_CACHE_DIR'] = os.environ.get('REPORT_CACHE_DIR') or report_cache.default_cache_dir(app.config['DATABASE'], 'reports')
+app.config['REPORT_CACHE_MAX_MB'] = float(os.environ.get('REPORT_CACHE_MAX_MB', 256))
+REPORT_CACHE = report_cache.ReportCache(app.config['REPORT_CACHE_DIR'],
+                                        int(app.config['REPORT_CACHE_MAX_MB'] * 1024 * 1024),
+                                        app.extensions['metrics'])
+
+# Compiled templates are cached on disk, shared by all workers and restarts
+# (Jinja re-compiles a template whose source changed); empty disables. Jinja
+# loads these files with marshal, so the directory must be private to the app
+# (see report_cache.ensure_private_dir); otherwise templates compile in memory.
+app.config['JINJA_CACHE_DIR'] = os.environ.get('JINJA_CACHE_DIR', report_cache.default_cache_dir(app.config['DATABASE'], 'templates'))
+if app.config['JINJA_CACHE_DIR'] and report_cache.ensure_private_dir(app.config['JINJA_CACHE_DIR']):
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_CACHE_DIR'])
 
 # Set up logging
 if app.config['DEBUG']:
@@ -34,15 +106,216 @@ else:
 logger = logging.getLogger(__name__)
 
 DATABASE = app.config['DATABASE']
+slow_queries.init_app(app, DATABASE)
+
+# Molds within this many cycles of their threshold are 'due_soon' (part of the
+# molds.maintenance_status generated column; init_db rebuilds it on a change)
+MAINTENANCE_DUE_SOON_MARGIN = 5000
 
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
+    conn = sqlite3.connect(DATABASE, factory=metrics.InstrumentedConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
+def get_report_connection():
+    """Return (connection, data_as_of) for read-only reporting queries.
+
+    Uses the reporting replica when one is configured and fresh; data_as_of is
+    its snapshot time in plant time ('YYYY-MM-DD HH:MM:SS'), or None for the live database.
+    """
+    replica_path = app.config['REPORT_REPLICA_PATH']
+    if replica_path and os.path.exists(replica_path):
+        conn = None
+        try:
+            conn = sqlite3.connect(f"file:{os.path.abspath(replica_path)}?mode=ro", uri=True,
+                                   factory=metrics.InstrumentedConnection)
+            conn.row_factory = sqlite3.Row
+            snapshot_at = conn.execute("SELECT snapshot_at FROM replica_info").fetchone()[0]
+            age = (get_bulgarian_time() - datetime.strptime(snapshot_at, '%Y-%m-%d %H:%M:%S')).total_seconds()
+            if age <= app.config['REPORT_REPLICA_MAX_AGE']:
+                return conn, snapshot_at
+            logger.warning(f"Reporting replica is {age:.0f}s old; reading the live database")
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Reporting replica unavailable ({e}); reading the live database")
+        # Not used: close it before falling back (also when replica_info was unreadable)
+        if conn is not None:
+            conn.close()
+    return get_db_connection(), None
+
+if app.config['SESSION_STORE'] == 'sqlite':
+    app.session_interface = SQLiteSessionInterface(get_db_connection)
+
+# Measurements are stored as one header row per submission (product, machine,
+# inspector, shift, count and time) plus one narrow value row per dimension,
+# clustered by submission. measured_at is the plant's wall-clock time counted
+# in seconds from 1970-01-01 as if it were UTC ("local epoch"), so
+# datetime(measured_at, 'unixepoch') gives back the entered 'YYYY-MM-DD HH:MM:SS'.
+# Archive databases (archive_measurements.py) use the same tables.
+MEASUREMENT_TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.measurement_submissions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        machine_id INTEGER,
+        inspector_id INTEGER,
+        shift_id INTEGER,
+        count INTEGER,
+        measured_at INTEGER NOT NULL,
+        FOREIGN KEY (product_id) REFERENCES products(id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.measurement_values (
+        submission_id INTEGER NOT NULL,
+        dimension_id INTEGER NOT NULL,
+        measured_value REAL NOT NULL,
+        PRIMARY KEY (submission_id, dimension_id),
+        FOREIGN KEY (submission_id) REFERENCES measurement_submissions(id),
+        FOREIGN KEY (dimension_id) REFERENCES dimensions(id)
+    ) WITHOUT ROWID
+    ''',
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_measurement_submissions_product_time ON measurement_submissions(product_id, measured_at)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_measurement_submissions_time ON measurement_submissions(measured_at)",
+]
+# Interned names: measurements column -> lookup table (always in main)
+MEASUREMENT_LOOKUP_TABLES = {'machine_number': 'machines', 'inspector': 'inspectors', 'shift': 'shifts'}
+# Submission headers joined to their values, in the old measurements row shape
+MEASUREMENT_ROWS = '''
+    SELECT s.id AS submission_id, s.product_id, v.dimension_id, v.measured_value, s.measured_at,
+           datetime(s.measured_at, 'unixepoch') AS measurement_date,
+           mc.name AS machine_number, s.count, i.name AS inspector, sh.name AS shift
+    FROM {prefix}measurement_submissions s
+    JOIN {prefix}measurement_values v ON v.submission_id = s.id
+    LEFT JOIN machines mc ON mc.id = s.machine_id
+    LEFT JOIN inspectors i ON i.id = s.inspector_id
+    LEFT JOIN shifts sh ON sh.id = s.shift_id
+'''
+LOCAL_EPOCH = datetime(1970, 1, 1)
+
+def local_epoch(iso_date):
+    """'YYYY-MM-DD[ HH:MM:SS]' plant time -> measured_at seconds"""
+    date_format = "%Y-%m-%d %H:%M:%S" if len(iso_date) > 10 else "%Y-%m-%d"
+    return int((datetime.strptime(iso_date, date_format) - LOCAL_EPOCH).total_seconds())
+
+def local_epoch_day_range(iso_start_date, iso_end_date):
+    """[start, end) measured_at bounds covering two ISO dates inclusively"""
+    return local_epoch(iso_start_date[:10]), local_epoch(iso_end_date[:10]) + 86400
+
+def lookup_id(cursor, table, name):
+    """Id of name in a lookup table, added on first use (None stays None)"""
+    if name is None:
+        return None
+    cursor.execute(f"SELECT id FROM {table} WHERE name = ?", (name,))
+    row = cursor.fetchone()
+    if row:
+        return row[0]
+    cursor.execute(f"INSERT INTO {table} (name) VALUES (?)", (name,))
+    return cursor.lastrowid
+
+def migrate_measurements_layout(cursor, schema='main'):
+    """Convert an old one-row-per-value measurements table in schema, if any.
+
+    Rows of one submission (same submission_id or, for rows older than that
+    column, same product, machine, time, inspector, shift and count) become
+    one header that keeps the id of its first row, so ids stay unique across
+    the hot database and the archives. Submissions whose date cannot be read
+    are kept at measured_at 0 and logged. Returns the number of rows converted.
+    """
+    cursor.execute(f"SELECT type FROM {schema}.sqlite_master WHERE name = 'measurements'")
+    row = cursor.fetchone()
+    if not row or row[0] != 'table':
+        return 0
+    # Columns older databases may still lack
+    cursor.execute(f"PRAGMA {schema}.table_info(measurements)")
+    columns = [info[1] for info in cursor.fetchall()]
+    if 'batch_number' in columns and 'machine_number' not in columns:
+        cursor.execute(f"ALTER TABLE {schema}.measurements RENAME COLUMN batch_number TO machine_number")
+    for column, column_type in (('count', 'INTEGER'), ('shift', 'TEXT'), ('submission_id', 'TEXT')):
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE {schema}.measurements ADD COLUMN {column} {column_type}")
+
+    for column, table in MEASUREMENT_LOOKUP_TABLES.items():
+        cursor.execute(f"INSERT OR IGNORE INTO main.{table} (name) SELECT DISTINCT {column} FROM {schema}.measurements WHERE {column} IS NOT NULL")
+    # A dimension measured twice in one legacy group is split into a second header
+    cursor.execute("DROP TABLE IF EXISTS temp.measurement_migration")
+    cursor.execute(f'''
+    CREATE TEMP TABLE measurement_migration AS
+    SELECT *, MIN(id) OVER (PARTITION BY submission_key, repeat) AS header_id
+    FROM (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY submission_key, dimension_id ORDER BY id) AS repeat
+        FROM (
+            SELECT id, product_id, dimension_id, measured_value, measurement_date, machine_number, count, inspector, shift,
+                   COALESCE(submission_id, json_array(product_id, machine_number, measurement_date, inspector, shift, count)) AS submission_key
+            FROM {schema}.measurements
+        )
+    )
+    ''')
+    # Dates SQLite cannot read keep their rows but land on measured_at 0
+    # (1970-01-01); say so, so they can be found and corrected
+    cursor.execute('''
+    SELECT COUNT(*), MIN(id) FROM temp.measurement_migration
+    WHERE id = header_id AND strftime('%s', measurement_date) IS NULL
+    ''')
+    unreadable, first_id = cursor.fetchone()
+    if unreadable:
+        logger.warning(f"{unreadable} submission(s) in {schema} have an unreadable measurement_date (first id {first_id}); "
+                       f"they are stored with measured_at 0 (1970-01-01 00:00:00)")
+    cursor.execute(f'''
+    INSERT INTO {schema}.measurement_submissions (id, product_id, machine_id, inspector_id, shift_id, count, measured_at)
+    SELECT t.id, t.product_id, mc.id, i.id, sh.id, t.count, COALESCE(CAST(strftime('%s', t.measurement_date) AS INTEGER), 0)
+    FROM temp.measurement_migration t
+    LEFT JOIN main.machines mc ON mc.name = t.machine_number
+    LEFT JOIN main.inspectors i ON i.name = t.inspector
+    LEFT JOIN main.shifts sh ON sh.name = t.shift
+    WHERE t.id = t.header_id
+    ORDER BY t.id
+    ''')
+    cursor.execute(f'''
+    INSERT INTO {schema}.measurement_values (submission_id, dimension_id, measured_value)
+    SELECT header_id, dimension_id, measured_value FROM temp.measurement_migration ORDER BY header_id, dimension_id
+    ''')
+    converted = cursor.rowcount
+    if schema == 'main':
+        cursor.execute('''
+        UPDATE machine_last_product SET last_submission_id = (
+            SELECT header_id FROM temp.measurement_migration t WHERE t.id = machine_last_product.last_submission_id
+        )
+        ''')
+    # Deleted rows' ids are never handed out again, as before
+    cursor.execute(f"SELECT seq FROM {schema}.sqlite_sequence WHERE name = 'measurements'")
+    row = cursor.fetchone()
+    if row:
+        cursor.execute(f"UPDATE {schema}.sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'measurement_submissions'", (row[0],))
+        if cursor.rowcount == 0:
+            cursor.execute(f"INSERT INTO {schema}.sqlite_sequence (name, seq) VALUES ('measurement_submissions', ?)", (row[0],))
+    cursor.execute("DROP TABLE temp.measurement_migration")
+    cursor.execute(f"DROP TABLE {schema}.measurements")
+    logger.info(f"Converted {converted} measurements in {schema} to submission headers and values")
+    return converted
+
+def migrate_measurement_archives(conn):
+    """Convert archive databases written before the submission-header layout"""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return
+    for name in sorted(os.listdir(ARCHIVE_DIR)):
+        if not (name.startswith('measurements_') and name.endswith('.db')):
+            continue
+        conn.execute("ATTACH DATABASE ? AS legacy_archive", (os.path.join(ARCHIVE_DIR, name),))
+        try:
+            with conn:
+                cursor = conn.cursor()
+                for statement in MEASUREMENT_TABLES:
+                    cursor.execute(statement.format(schema='legacy_archive'))
+                migrate_measurements_layout(cursor, 'legacy_archive')
+        finally:
+            conn.execute("DETACH DATABASE legacy_archive")
+
 def init_db():
     with get_db_connection() as conn:
         cursor = conn.cursor()
+        # WAL (persistent): readers - reports, online backups - never block
+        # measurement writes, and backup_db.py can copy from a pinned snapshot
+        cursor.execute("PRAGMA journal_mode=WAL")
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -141,31 +414,12 @@ def init_db():
             UNIQUE(product_id, dimension_name)
         )
         ''')
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS measurements (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            product_id INTEGER NOT NULL,
-            dimension_id INTEGER NOT NULL,
-            measured_value REAL NOT NULL,
-            measurement_date TEXT NOT NULL,
-            machine_number TEXT,
-            count INTEGER,
-            inspector TEXT,
-            FOREIGN KEY (product_id) REFERENCES products(id),
-            FOREIGN KEY (dimension_id) REFERENCES dimensions(id)
-        )
-        ''')
-        # Migration: Check if batch_number exists and rename to machine_number, add count, and add shift
-        cursor.execute("PRAGMA table_info(measurements)")
-        columns = [info[1] for info in cursor.fetchall()]
-        if 'batch_number' in columns and 'machine_number' not in columns:
-            cursor.execute("ALTER TABLE measurements RENAME COLUMN batch_number TO machine_number")
-        if 'count' not in columns:
-            cursor.execute("ALTER TABLE measurements ADD COLUMN count INTEGER")
-        if 'shift' not in columns:
-            cursor.execute("ALTER TABLE measurements ADD COLUMN shift TEXT")
-        if 'submission_id' not in columns:
-            cursor.execute("ALTER TABLE measurements ADD COLUMN submission_id TEXT")
+        # Measurements: one header row per submission, one value row per dimension
+        # (see MEASUREMENT_TABLES); machine, inspector and shift names are interned
+        for lookup_table in MEASUREMENT_LOOKUP_TABLES.values():
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {lookup_table} (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+        for statement in MEASUREMENT_TABLES:
+            cursor.execute(statement.format(schema='main'))
         cursor.execute("SELECT COUNT(*) FROM users WHERE username='admin'")
         if cursor.fetchone()[0] == 0:
             # Use environment variable for admin password or generate a secure default
@@ -181,7 +435,7 @@ def init_db():
             machine_number TEXT PRIMARY KEY,
             last_product_id INTEGER,
             last_count INTEGER,
-            last_measurement_id INTEGER,
+            last_submission_id INTEGER,
             last_update TEXT
         )
         ''')
@@ -218,6 +472,21 @@ def init_db():
         columns = [info[1] for info in cursor.fetchall()]
         if 'drawing_path_2' not in columns:
             cursor.execute("ALTER TABLE products ADD COLUMN drawing_path_2 TEXT")
+        # Migration: normalized identity of each product (see product_key), so
+        # the duplicate check is one unique index lookup instead of a scan
+        if 'product_key' not in columns:
+            cursor.execute("ALTER TABLE products ADD COLUMN product_key TEXT")
+            cursor.execute("SELECT id, product_name, drawing_number FROM products ORDER BY id")
+            keys = {}
+            for row in cursor.fetchall():
+                key = product_key(row['product_name'], row['drawing_number'])
+                if key in keys:
+                    # Older rows that differ only in case or spacing keep a NULL key
+                    logger.warning(f"Product {row['id']} duplicates product {keys[key]} ({row['product_name']} / {row['drawing_number']})")
+                    continue
+                keys[key] = row['id']
+            cursor.executemany("UPDATE products SET product_key=? WHERE id=?", list(keys.items()))
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_products_key ON products(product_key)")
         
         # Migration: Check if specifications_pdf column exists in molds table
         cursor.execute("PRAGMA table_info(molds)")
@@ -236,8 +505,177 @@ def init_db():
         rework_columns = [info[1] for info in cursor.fetchall()]
         if 'completed_date' not in rework_columns:
             cursor.execute("ALTER TABLE rework_history ADD COLUMN completed_date TEXT")
+
+        # Migration: Add denormalized problem_count to molds and backfill it
+        cursor.execute("PRAGMA table_info(molds)")
+        mold_columns = [info[1] for info in cursor.fetchall()]
+        if 'problem_count' not in mold_columns:
+            cursor.execute("ALTER TABLE molds ADD COLUMN problem_count INTEGER DEFAULT 0")
+            cursor.execute('''
+            UPDATE molds
+            SET problem_count = (SELECT COUNT(*) FROM mold_problems mp WHERE mp.mold_id = molds.id)
+            ''')
+        
+        # Migration: Compute maintenance status in SQL as generated columns, with a partial
+        # index so the overdue / due-soon lists are index lookups (table_xinfo lists generated columns)
+        cursor.execute("PRAGMA table_xinfo(molds)")
+        mold_columns = [info[1] for info in cursor.fetchall()]
+        if 'cycles_remaining' not in mold_columns:
+            cursor.execute("ALTER TABLE molds ADD COLUMN cycles_remaining INTEGER GENERATED ALWAYS AS (maintenance_threshold - total_cycles) VIRTUAL")
+        # The margin is part of the column's definition: rebuild it (virtual,
+        # so nothing is rewritten) when MAINTENANCE_DUE_SOON_MARGIN has changed
+        maintenance_status_due_soon = f"WHEN maintenance_threshold - total_cycles <= {MAINTENANCE_DUE_SOON_MARGIN} THEN 'due_soon'"
+        if 'maintenance_status' in mold_columns:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'molds'")
+            if maintenance_status_due_soon not in cursor.fetchone()[0]:
+                cursor.execute("DROP INDEX IF EXISTS idx_molds_maintenance_attention")
+                cursor.execute("ALTER TABLE molds DROP COLUMN maintenance_status")
+                mold_columns.remove('maintenance_status')
+        if 'maintenance_status' not in mold_columns:
+            cursor.execute(f'''
+            ALTER TABLE molds ADD COLUMN maintenance_status TEXT GENERATED ALWAYS AS (
+                CASE
+                    WHEN maintenance_threshold - total_cycles <= 0 THEN 'overdue'
+                    {maintenance_status_due_soon}
+                    ELSE 'ok'
+                END
+            ) VIRTUAL
+            ''')
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_molds_maintenance_attention
+        ON molds(maintenance_status, cycles_remaining)
+        WHERE maintenance_status != 'ok'
+        ''')
+        
+        # Add data_versions table; writers bump a version so readers can reuse cached results
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+
+        # Add sessions table for the optional server-side session store
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            sid TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expiry INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expiry ON sessions(expiry)")
         
+        # Add change_log table feeding the /live_feed event stream
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_type TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_date TEXT NOT NULL
+        )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_log_created ON change_log(created_date)")
+
+        # Add append-only mold cycle ledger; molds.total_cycles is derived from it
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='mold_cycle_events'")
+        ledger_exists = cursor.fetchone() is not None
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS mold_cycle_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            mold_id INTEGER NOT NULL,
+            machine_number TEXT,
+            delta INTEGER NOT NULL DEFAULT 0,
+            source TEXT NOT NULL,
+            event_date TEXT NOT NULL,
+            FOREIGN KEY (mold_id) REFERENCES molds(id)
+        )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mold_cycle_events_mold ON mold_cycle_events(mold_id, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mold_cycle_events_machine_date ON mold_cycle_events(machine_number, event_date)")
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS mold_cycle_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            mold_id INTEGER NOT NULL,
+            last_event_id INTEGER NOT NULL,
+            lifetime_cycles INTEGER NOT NULL,
+            cycles_since_maintenance INTEGER NOT NULL,
+            snapshot_date TEXT NOT NULL,
+            FOREIGN KEY (mold_id) REFERENCES molds(id)
+        )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mold_cycle_snapshots_mold ON mold_cycle_snapshots(mold_id, last_event_id)")
+
+        # Add mold_forecasts table holding the projected maintenance date per mold
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS mold_forecasts (
+            mold_id INTEGER PRIMARY KEY,
+            cycles_per_day REAL NOT NULL,
+            cycles_remaining INTEGER NOT NULL,
+            days_until_due REAL,
+            forecast_date TEXT,
+            computed_at TEXT NOT NULL,
+            FOREIGN KEY (mold_id) REFERENCES molds(id)
+        )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mold_forecasts_days ON mold_forecasts(days_until_due)")
+
+        # Add product_deletions table: deleted products whose measurement history
+        # purge_products.py is still removing in the background
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS product_deletions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            product_name TEXT NOT NULL,
+            mold_ids TEXT NOT NULL,
+            files TEXT NOT NULL,
+            requested_by TEXT,
+            requested_at TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            submissions_total INTEGER NOT NULL DEFAULT 0,
+            submissions_deleted INTEGER NOT NULL DEFAULT 0,
+            finished_at TEXT,
+            error TEXT
+        )
+        ''')
+
+        # Migration: seed the ledger with the existing counters so no history is lost
+        if not ledger_exists:
+            cursor.execute('''
+            INSERT INTO mold_cycle_events (mold_id, machine_number, delta, source, event_date)
+            SELECT id, NULL, total_cycles, 'baseline', ?
+            FROM molds
+            WHERE total_cycles > 0
+            ''', (get_bulgarian_time_string(),))
+
+        # Migration: at most one active mold assignment per machine, so the
+        # measurement write path can upsert it. Older racing inserts may have
+        # left duplicates behind; keep the newest one active.
+        cursor.execute('''
+        UPDATE machine_mold_assignments SET status = 'replaced'
+        WHERE status = 'active' AND id NOT IN (
+            SELECT MAX(id) FROM machine_mold_assignments
+            WHERE status = 'active'
+            GROUP BY machine_number
+        )
+        ''')
+        cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_machine_mold_assignments_active
+        ON machine_mold_assignments(machine_number) WHERE status = 'active'
+        ''')
+
+        # Migration: one-row-per-value measurements become submission headers
+        # and values; the measurements view keeps the old row shape for
+        # ad-hoc queries and scripts
+        cursor.execute("PRAGMA table_info(machine_last_product)")
+        if 'last_measurement_id' in [info[1] for info in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE machine_last_product RENAME COLUMN last_measurement_id TO last_submission_id")
+        migrate_measurements_layout(cursor)
+        cursor.execute("CREATE VIEW IF NOT EXISTS measurements AS " + MEASUREMENT_ROWS.format(prefix=''))
+
         conn.commit()
+        migrate_measurement_archives(conn)
+    # Closed now: bulk loaders switch the journal mode right after init_db
+    conn.close()
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
@@ -265,6 +703,17 @@ def get_bulgarian_time_string():
     """Get current Bulgarian time as string for database storage"""
     return get_bulgarian_time().strftime("%Y-%m-%d %H:%M:%S")
 
+def normalize_name(name):
+    """Identity of a name: case and runs of whitespace do not matter"""
+    return ' '.join(str(name).split()).casefold()
+
+def product_key(product_name, drawing_number):
+    """products.product_key: name and drawing number, normalized.
+
+    Computed in Python because SQLite's LOWER() folds ASCII letters only.
+    """
+    return normalize_name(product_name) + '\n' + normalize_name(drawing_number)
+
 def convert_to_local_date(iso_date):
     try:
         # Try to parse with time first
@@ -277,27 +726,274 @@ def convert_to_local_date(iso_date):
         except ValueError:
             return iso_date
 
+# Change versions for cached pages; bumped inside the writing transaction
+MOLDS_DATA_VERSION = 'molds'
+# Per product: measurements and the dimensions they are reported against
+MEASUREMENTS_DATA_VERSION = 'measurements:{}'
+
+def get_data_version(cursor, name):
+    """Return the current change version for name (0 if never bumped)"""
+    cursor.execute("SELECT version FROM data_versions WHERE name = ?", (name,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def bump_data_version(cursor, name):
+    """Increment the change version for name so cached readers rebuild"""
+    cursor.execute('''
+    INSERT INTO data_versions (name, version) VALUES (?, 1)
+    ON CONFLICT(name) DO UPDATE SET version = version + 1
+    ''', (name,))
+
+def get_measurements_data_version(cursor, product_id=None):
+    """Version of one product's report data; without a product, a sum that moves with any of them"""
+    if product_id:
+        return get_data_version(cursor, MEASUREMENTS_DATA_VERSION.format(product_id))
+    cursor.execute("SELECT COALESCE(SUM(version), 0) FROM data_versions WHERE name LIKE 'measurements:%'")
+    return cursor.fetchone()[0]
+
+# Live feed change log; rows older than CHANGE_LOG_RETENTION are pruned as new ones arrive
+CHANGE_LOG_RETENTION = timedelta(days=7)
+CHANGE_LOG_PRUNE_EVERY = 500
+
+def log_change(cursor, event_type, payload):
+    """Append an event for /live_feed listeners inside the writing transaction"""
+    now = get_bulgarian_time()
+    cursor.execute(
+        "INSERT INTO change_log (event_type, payload, created_date) VALUES (?, ?, ?)",
+        (event_type, json.dumps(payload, ensure_ascii=False), now.strftime('%Y-%m-%d %H:%M:%S'))
+    )
+    if cursor.lastrowid % CHANGE_LOG_PRUNE_EVERY == 0:
+        cursor.execute("DELETE FROM change_log WHERE created_date < ?",
+                       ((now - CHANGE_LOG_RETENTION).strftime('%Y-%m-%d %H:%M:%S'),))
+
+# Mold cycle ledger: events are only ever appended, a snapshot is written every
+# CYCLE_SNAPSHOT_INTERVAL events per mold so totals never fold more than that.
+CYCLE_SNAPSHOT_INTERVAL = 200
+CYCLE_RESET_SOURCES = ('rework', 'maintenance')
+
+def get_mold_cycle_totals(cursor, mold_id):
+    """Return lifetime and since-maintenance cycle totals for a mold from the ledger"""
+    cursor.execute('''
+    SELECT last_event_id, lifetime_cycles, cycles_since_maintenance
+    FROM mold_cycle_snapshots
+    WHERE mold_id = ?
+    ORDER BY last_event_id DESC LIMIT 1
+    ''', (mold_id,))
+    snapshot = cursor.fetchone()
+    last_event_id = snapshot['last_event_id'] if snapshot else 0
+    lifetime_cycles = snapshot['lifetime_cycles'] if snapshot else 0
+    cycles_since_maintenance = snapshot['cycles_since_maintenance'] if snapshot else 0
+
+    cursor.execute('''
+    SELECT id, delta, source FROM mold_cycle_events
+    WHERE mold_id = ? AND id > ?
+    ORDER BY id
+    ''', (mold_id, last_event_id))
+    pending_events = 0
+    for event in cursor.fetchall():
+        pending_events += 1
+        last_event_id = event['id']
+        lifetime_cycles += event['delta']
+        if event['source'] in CYCLE_RESET_SOURCES:
+            cycles_since_maintenance = 0
+        else:
+            cycles_since_maintenance += event['delta']
+
+    return {
+        'last_event_id': last_event_id,
+        'lifetime_cycles': lifetime_cycles,
+        'cycles_since_maintenance': cycles_since_maintenance,
+        'pending_events': pending_events
+    }
+
+def record_mold_cycles(cursor, mold_id, delta, source, machine_number=None, event_date=None):
+    """Append a cycle event for a mold and refresh its derived total_cycles counter.
+
+    Reset sources (rework, maintenance) are recorded with a zero delta and mark
+    the point from which cycles since last maintenance are counted.
+    """
+    event_date = event_date or get_bulgarian_time_string()
+    cursor.execute("SELECT mold_name, mold_number, total_cycles, maintenance_threshold FROM molds WHERE id = ?", (mold_id,))
+    mold = cursor.fetchone()
+    cursor.execute('''
+    INSERT INTO mold_cycle_events (mold_id, machine_number, delta, source, event_date)
+    VALUES (?, ?, ?, ?, ?)
+    ''', (mold_id, machine_number, delta, source, event_date))
+
+    totals = get_mold_cycle_totals(cursor, mold_id)
+    if totals['pending_events'] >= CYCLE_SNAPSHOT_INTERVAL:
+        cursor.execute('''
+        INSERT INTO mold_cycle_snapshots (mold_id, last_event_id, lifetime_cycles, cycles_since_maintenance, snapshot_date)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (mold_id, totals['last_event_id'], totals['lifetime_cycles'],
+              totals['cycles_since_maintenance'], event_date))
+
+    cursor.execute("UPDATE molds SET total_cycles = ? WHERE id = ?", (totals['cycles_since_maintenance'], mold_id))
+
+    if (mold and mold['maintenance_threshold'] and source not in CYCLE_RESET_SOURCES
+            and (mold['total_cycles'] or 0) < mold['maintenance_threshold'] <= totals['cycles_since_maintenance']):
+        log_change(cursor, 'threshold_crossed', {
+            'mold_id': mold_id,
+            'mold_name': mold['mold_name'],
+            'mold_number': mold['mold_number'],
+            'machine_number': machine_number,
+            'total_cycles': totals['cycles_since_maintenance'],
+            'maintenance_threshold': mold['maintenance_threshold'],
+            'event_date': convert_to_local_date(event_date)
+        })
+    return totals
+
+def get_last_maintenance_event(cursor, mold_id):
+    """Return the most recent reset event (rework or maintenance) for a mold, if any"""
+    cursor.execute('''
+    SELECT id, source, event_date FROM mold_cycle_events
+    WHERE mold_id = ? AND source IN ({})
+    ORDER BY id DESC LIMIT 1
+    '''.format(', '.join('?' * len(CYCLE_RESET_SOURCES))), (mold_id, *CYCLE_RESET_SOURCES))
+    return cursor.fetchone()
+
+# Maintenance forecasts are recomputed for all molds at once and cached in
+# mold_forecasts; pages only read them and trigger a refresh when stale.
+FORECAST_WINDOW_DAYS = 30
+FORECAST_MAX_AGE = timedelta(hours=1)
+
+def refresh_mold_forecasts(conn, window_days=FORECAST_WINDOW_DAYS):
+    """Project the date each mold crosses its maintenance threshold.
+
+    Cycles/day is derived from cycles credited in the ledger over the last
+    window_days plus the count still running on machines that last produced
+    the mold's product (not yet credited until the machine switches product).
+    """
+    import numpy as np  # Loaded on first use; keeps worker start-up light
+    cursor = conn.cursor()
+    now = get_bulgarian_time()
+    window_start = (now - timedelta(days=window_days)).strftime('%Y-%m-%d %H:%M:%S')
+
+    cursor.execute('''
+    SELECT m.id, m.total_cycles, m.maintenance_threshold,
+           COALESCE(credited.cycles, 0) AS credited_cycles,
+           COALESCE(running.cycles, 0) AS running_cycles,
+           COALESCE(running.recent_cycles, 0) AS recent_running_cycles
+    FROM molds m
+    LEFT JOIN (
+        SELECT mold_id, SUM(delta) AS cycles
+        FROM mold_cycle_events
+        WHERE source = 'measurement' AND event_date >= ?
+        GROUP BY mold_id
+    ) credited ON credited.mold_id = m.id
+    LEFT JOIN (
+        SELECT last_product_id,
+               SUM(last_count) AS cycles,
+               SUM(CASE WHEN last_update >= ? THEN last_count ELSE 0 END) AS recent_cycles
+        FROM machine_last_product
+        GROUP BY last_product_id
+    ) running ON running.last_product_id = m.product_id
+    ''', (window_start, window_start))
+    rows = cursor.fetchall()
+    if not rows:
+        cursor.execute("DELETE FROM mold_forecasts")
+        conn.commit()
+        return 0
+
+    mold_ids = np.array([row['id'] for row in rows], dtype=np.int64)
+    total_cycles = np.array([row['total_cycles'] or 0 for row in rows], dtype=np.float64)
+    thresholds = np.array([row['maintenance_threshold'] or 0 for row in rows], dtype=np.float64)
+    credited = np.array([row['credited_cycles'] for row in rows], dtype=np.float64)
+    running = np.array([row['running_cycles'] for row in rows], dtype=np.float64)
+    recent_running = np.array([row['recent_running_cycles'] for row in rows], dtype=np.float64)
+
+    cycles_per_day = (credited + recent_running) / float(window_days)
+    cycles_remaining = thresholds - (total_cycles + running)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_until_due = np.where(
+            cycles_remaining <= 0,
+            0.0,
+            np.where(cycles_per_day > 0, cycles_remaining / cycles_per_day, np.inf)
+        )
+
+    computed_at = now.strftime('%Y-%m-%d %H:%M:%S')
+    forecasts = []
+    for mold_id, rate, remaining, days in zip(mold_ids.tolist(), cycles_per_day.tolist(),
+                                              cycles_remaining.tolist(), days_until_due.tolist()):
+        if np.isfinite(days):
+            forecast_date = (now + timedelta(days=days)).strftime('%Y-%m-%d')
+            days_value = round(days, 1)
+        else:
+            forecast_date = None
+            days_value = None
+        forecasts.append((mold_id, rate, int(remaining), days_value, forecast_date, computed_at))
+
+    cursor.execute("DELETE FROM mold_forecasts")
+    cursor.executemany('''
+    INSERT INTO mold_forecasts (mold_id, cycles_per_day, cycles_remaining, days_until_due, forecast_date, computed_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ''', forecasts)
+    bump_data_version(cursor, MOLDS_DATA_VERSION)
+    conn.commit()
+    logger.info(f"Mold forecasts refreshed for {len(forecasts)} molds")
+    return len(forecasts)
+
+def mold_forecasts_fresh(cursor):
+    """Whether mold_forecasts exist and are younger than FORECAST_MAX_AGE"""
+    cursor.execute("SELECT MAX(computed_at) FROM mold_forecasts")
+    computed_at = cursor.fetchone()[0]
+    if not computed_at:
+        return False
+    return get_bulgarian_time() - datetime.strptime(computed_at, '%Y-%m-%d %H:%M:%S') < FORECAST_MAX_AGE
+
+def ensure_mold_forecasts(conn):
+    """Refresh mold forecasts only when they are missing or older than FORECAST_MAX_AGE"""
+    cursor = conn.cursor()
+    if mold_forecasts_fresh(cursor):
+        return
+    # Requests that found them stale at the same time queue up on the write
+    # lock; only the first recomputes, the rest see its result and go on
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        if mold_forecasts_fresh(cursor):
+            conn.rollback()
+            return
+        refresh_mold_forecasts(conn)
+    except Exception:
+        conn.rollback()
+        raise
+
+def get_last_activity():
+    """Return the session's last activity as a Unix timestamp (None if unknown)"""
+    last_activity = session.get('last_activity')
+    if isinstance(last_activity, str):
+        # Sessions issued before timestamps were stored as epoch seconds
+        try:
+            return (datetime.fromisoformat(last_activity) - timedelta(hours=1)).timestamp()
+        except ValueError:
+            return None
+    return last_activity
+
 def check_session_timeout():
     """Check if session has expired due to inactivity"""
     if 'user' in session:
+        now = time.time()
+        last_activity = get_last_activity()
         # Check if last_activity exists and if session has expired
-        if 'last_activity' in session:
-            last_activity = datetime.fromisoformat(session['last_activity'])
-            if get_bulgarian_time() - last_activity > app.config['PERMANENT_SESSION_LIFETIME']:
+        if last_activity is not None:
+            if now - last_activity > app.config['PERMANENT_SESSION_LIFETIME'].total_seconds():
                 session.clear()
                 flash('Your session has expired due to inactivity. Please log in again.', 'warning')
                 return True
         
-        # Update last activity time
-        session['last_activity'] = get_bulgarian_time().isoformat()
-        session.permanent = True
+        # Update last activity time only once per granularity window, so the
+        # session (and its cookie) is not rewritten on every request
+        if last_activity is None or now - last_activity >= app.config['SESSION_ACTIVITY_GRANULARITY']:
+            session['last_activity'] = int(now)
+        if not session.permanent:
+            session.permanent = True
     
     return False
 
 @app.before_request
 def require_login():
     # Skip timeout check for static files, login page, and session status
-    if request.endpoint in ['login', 'static', 'serve_drawing', 'get_drawings', 'serve_pdfjs', 'session_status']:
+    if request.endpoint in ['login', 'static', 'serve_drawing', 'get_drawings', 'serve_pdfjs', 'session_status', 'metrics_endpoint']:
         return
     
     # Check session timeout
@@ -305,7 +1001,7 @@ def require_login():
         return redirect(url_for('login'))
     
     # Check if user is logged in
-    if request.endpoint not in ['login', 'static', 'get_product', 'serve_drawing', 'get_drawings', 'serve_pdfjs', 'debug_pdf', 'debug_pdf_viewer', 'upload_drawing', 'add_drawing_to_product', 'view_tolerance_table', 'session_status'] and 'user' not in session:
+    if request.endpoint not in ['login', 'static', 'get_product', 'serve_drawing', 'get_drawings', 'serve_pdfjs', 'debug_pdf', 'debug_pdf_viewer', 'upload_drawing', 'add_drawing_to_product', 'view_tolerance_table', 'session_status', 'metrics_endpoint'] and 'user' not in session:
         return redirect(url_for('login'))
 
 @app.route('/')
@@ -327,9 +1023,14 @@ def login():
             cursor.execute("SELECT password_hash, role FROM users WHERE username=?", (username,))
             user = cursor.fetchone()
             if user and user['password_hash'] == hash_password(password):
+                # A fresh session, and with server-side sessions a fresh id,
+                # so an id planted before login is worth nothing afterwards
+                session.clear()
+                if hasattr(session, 'regenerate'):
+                    session.regenerate()
                 session['user'] = username
                 session['role'] = user['role']
-                session['last_activity'] = get_bulgarian_time().isoformat()
+                session['last_activity'] = int(time.time())
                 session.permanent = True
                 return redirect(url_for('dashboard'))
             flash('Невалидно потребителско име или парола', 'error')
@@ -348,9 +1049,9 @@ def session_status():
         return jsonify({'status': 'expired', 'message': 'Session expired'})
     
     # Check if session has expired
-    if 'last_activity' in session:
-        last_activity = datetime.fromisoformat(session['last_activity'])
-        time_left = app.config['PERMANENT_SESSION_LIFETIME'] - (get_bulgarian_time() - last_activity)
+    last_activity = get_last_activity()
+    if last_activity is not None:
+        time_left = app.config['PERMANENT_SESSION_LIFETIME'] - timedelta(seconds=time.time() - last_activity)
         
         if time_left.total_seconds() <= 0:
             session.clear()
@@ -364,10 +1065,85 @@ def session_status():
     
     return jsonify({'status': 'active', 'time_left_minutes': 30})
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics aggregated across all workers"""
+    token = app.config['METRICS_TOKEN']
+    authorized = session.get('role') == 'admin' or (token and request.headers.get('Authorization') == f'Bearer {token}')
+    if not authorized:
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+    return Response(metrics.render_latest(app), mimetype='text/plain; version=0.0.4')
+
+@app.route('/slow_queries')
+def slow_queries_view():
+    """Admin list of the most recent slow SQL statements"""
+    if session.get('role') != 'admin':
+        flash('Достъп отказан. Необходими са администраторски права.', 'error')
+        return redirect(url_for('dashboard'))
+    entries = slow_queries.read_recent(app.config['SLOW_QUERY_LOG'])
+    endpoint = request.args.get('endpoint', '')
+    if endpoint:
+        entries = [entry for entry in entries if entry.get('endpoint') == endpoint]
+    return render_template('slow_queries.html', entries=entries, endpoint=endpoint,
+                           threshold_ms=app.config['SLOW_QUERY_MS'])
+
+@app.route('/diagnostics/memory')
+def memory_diagnostics():
+    """Admin memory report of the worker serving this request (and the last SIGUSR2 reports of all workers)"""
+    if session.get('role') != 'admin':
+        return jsonify({'status': 'error', 'message': 'Достъп отказан. Необходими са администраторски права.'}), 403
+    profiler = app.extensions['memory_profile']
+    limit = request.args.get('limit', memory_profile.TOP_SITES, type=int)
+    result = {'status': 'success', 'worker': profiler.report(limit)}
+    if request.args.get('all'):
+        result['workers'] = memory_profile.latest_dumps(app.config['MEMORY_PROFILE_DIR'])
+    return jsonify(result)
+
 @app.route('/dashboard')
 def dashboard():
     return render_template('dashboard.html', user=session.get('user'), role=session.get('role'))
 
+def detach_product(cursor, product_id, requested_by):
+    """Delete a product and its small dependent rows; return the purge job id (None if not found).
+
+    Every page reaches products, molds and their history through the products
+    row, so the product is gone for users as soon as this commits. Its
+    measurement submissions (live and archived) and mold cycle ledger can run
+    into millions of rows; they are left to purge_products.py, which deletes them in batches
+    together with drawing files nothing else uses. Ids are AUTOINCREMENT and
+    never reused, so the leftover rows cannot attach to anything new.
+    """
+    cursor.execute("SELECT product_name, drawing_path, drawing_path_2 FROM products WHERE id=?", (product_id,))
+    product = cursor.fetchone()
+    if not product:
+        return None
+    cursor.execute("SELECT id, specifications_pdf FROM molds WHERE product_id=?", (product_id,))
+    molds = cursor.fetchall()
+    mold_ids = [mold['id'] for mold in molds]
+    files = sorted({os.path.basename(path) for path in
+                    [product['drawing_path'], product['drawing_path_2'], *(mold['specifications_pdf'] for mold in molds)]
+                    if path})
+    cursor.execute("SELECT COUNT(*) FROM measurement_submissions WHERE product_id=?", (product_id,))
+    submissions_total = cursor.fetchone()[0] + count_archived_submissions(product_id)
+
+    if mold_ids:
+        placeholders = ','.join('?' * len(mold_ids))
+        for table in ('mold_problems', 'rework_history', 'maintenance_schedule', 'machine_mold_assignments', 'mold_forecasts'):
+            cursor.execute(f"DELETE FROM {table} WHERE mold_id IN ({placeholders})", mold_ids)
+        cursor.execute("DELETE FROM molds WHERE product_id=?", (product_id,))
+    cursor.execute("DELETE FROM machine_last_product WHERE last_product_id=?", (product_id,))
+    cursor.execute("DELETE FROM dimensions WHERE product_id=?", (product_id,))
+    cursor.execute("DELETE FROM products WHERE id=?", (product_id,))
+    cursor.execute('''
+    INSERT INTO product_deletions (product_id, product_name, mold_ids, files, requested_by, requested_at, submissions_total)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (product_id, product['product_name'], json.dumps(mold_ids), json.dumps(files), requested_by,
+          get_bulgarian_time_string(), submissions_total))
+    job_id = cursor.lastrowid
+    bump_data_version(cursor, MOLDS_DATA_VERSION)
+    bump_data_version(cursor, MEASUREMENTS_DATA_VERSION.format(product_id))
+    return job_id
+
 @app.route('/products', methods=['GET', 'POST'])
 def products():
     # Check if user is admin
@@ -434,11 +1210,9 @@ def products():
                 if not product_name or not drawing_number:
                     flash('Името на продукта и номерът на чертежа са задължителни', 'error')
                 else:
-                    # Check for case-insensitive duplicates before inserting (with whitespace trimming)
-                    cursor.execute(
-                        "SELECT id, product_name, drawing_number FROM products WHERE LOWER(TRIM(product_name)) = LOWER(TRIM(?)) AND LOWER(TRIM(drawing_number)) = LOWER(TRIM(?))",
-                        (product_name, drawing_number)
-                    )
+                    # Check for case- and whitespace-insensitive duplicates before inserting
+                    key = product_key(product_name, drawing_number)
+                    cursor.execute("SELECT id, product_name, drawing_number FROM products WHERE product_key = ?", (key,))
                     existing_product = cursor.fetchone()
                     
                     if existing_product:
@@ -453,8 +1227,8 @@ def products():
                             drawing_path_2 = f'drawings/{drawing_path_2}' if not drawing_path_2.startswith('drawings/') else drawing_path_2
                         try:
                             cursor.execute(
-                                "INSERT INTO products (product_name, drawing_number, drawing_path, drawing_path_2) VALUES (?, ?, ?, ?)",
-                                (product_name, drawing_number, drawing_path, drawing_path_2)
+                                "INSERT INTO products (product_name, drawing_number, drawing_path, drawing_path_2, product_key) VALUES (?, ?, ?, ?, ?)",
+                                (product_name, drawing_number, drawing_path, drawing_path_2, key)
                             )
                             product_id = cursor.lastrowid
                             # Automatically create a mold for the new product
@@ -465,6 +1239,7 @@ def products():
                                 "INSERT INTO molds (product_id, mold_name, mold_number, created_date) VALUES (?, ?, ?, ?)",
                                 (product_id, mold_name, mold_number, current_date)
                             )
+                            bump_data_version(cursor, MOLDS_DATA_VERSION)
                             conn.commit()
                             flash('Продуктът и неговата матрица са добавени успешно', 'success')
                             logger.info(f"New product created: {product_name} with drawing number: {drawing_number}")
@@ -472,11 +1247,14 @@ def products():
                             flash('Продукт с това име и номер на чертеж вече съществува', 'error')
             elif action == 'delete_product':
                 product_id = request.form['product_id']
-                cursor.execute("DELETE FROM measurements WHERE dimension_id IN (SELECT id FROM dimensions WHERE product_id=?)", (product_id,))
-                cursor.execute("DELETE FROM dimensions WHERE product_id=?", (product_id,))
-                cursor.execute("DELETE FROM products WHERE id=?", (product_id,))
+                # Measurements and the mold cycle ledger are purged in the background (purge_products.py)
+                job_id = detach_product(cursor, product_id, session.get('user'))
                 conn.commit()
-                flash('Продуктът е изтрит успешно', 'success')
+                if job_id:
+                    logger.info(f"Product {product_id} deleted; history purge queued as job {job_id}")
+                    flash('Продуктът е изтрит; историята на измерванията му се изчиства на заден план', 'success')
+                else:
+                    flash('Продуктът не е намерен', 'error')
                 
         # After POST operations, recalculate products with pagination
         if request.method == 'POST':
@@ -540,6 +1318,27 @@ def get_product(product_id):
             return jsonify(dict(product))
         return jsonify({'error': 'Продуктът не е намерен'}), 404
 
+@app.route('/product_deletions')
+def product_deletions():
+    """Progress of the background purges of deleted products (newest first)"""
+    if session.get('role') != 'admin':
+        return jsonify({'status': 'error', 'message': 'Достъп отказан. Необходими са администраторски права.'}), 403
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT id, product_id, product_name, requested_by, requested_at, status,
+               submissions_total, submissions_deleted, finished_at, error
+        FROM product_deletions
+        ORDER BY id DESC
+        LIMIT ?
+        ''', (request.args.get('limit', 20, type=int),))
+        jobs = [dict(row) for row in cursor.fetchall()]
+    for job in jobs:
+        job['requested_at'] = convert_to_local_date(job['requested_at'])
+        if job['finished_at']:
+            job['finished_at'] = convert_to_local_date(job['finished_at'])
+    return jsonify({'status': 'success', 'jobs': jobs})
+
 @app.route('/drawings/<filename>')
 def serve_drawing(filename):
     logger.debug(f"Attempting to serve drawing: {filename}")
@@ -633,9 +1432,11 @@ def update_dimension():
         cursor = conn.cursor()
         try:
             cursor.execute(
-                "UPDATE dimensions SET dimension_name=?, nominal_value=?, tolerance_minus=?, tolerance_plus=? WHERE id=?",
+                "UPDATE dimensions SET dimension_name=?, nominal_value=?, tolerance_minus=?, tolerance_plus=? WHERE id=? RETURNING product_id",
                 (dimension_name, nominal_value, tolerance_minus, tolerance_plus, dimension_id)
             )
+            for row in cursor.fetchall():
+                bump_data_version(cursor, MEASUREMENTS_DATA_VERSION.format(row['product_id']))
             conn.commit()
             return jsonify({'status': 'success', 'message': 'Размерът е актуализиран успешно'})
         except Exception as e:
@@ -649,11 +1450,260 @@ def delete_dimension():
     dimension_id = request.form['dimension_id']
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("DELETE FROM measurements WHERE dimension_id=?", (dimension_id,))
-        cursor.execute("DELETE FROM dimensions WHERE id=?", (dimension_id,))
+        cursor.execute("DELETE FROM dimensions WHERE id=? RETURNING product_id", (dimension_id,))
+        for row in cursor.fetchall():
+            # Through the product's submissions: values are keyed by submission
+            cursor.execute(
+                "DELETE FROM measurement_values WHERE submission_id IN (SELECT id FROM measurement_submissions WHERE product_id=?) AND dimension_id=?",
+                (row['product_id'], dimension_id)
+            )
+            cursor.execute(
+                "DELETE FROM measurement_submissions WHERE product_id=? AND NOT EXISTS (SELECT 1 FROM measurement_values v WHERE v.submission_id = measurement_submissions.id)",
+                (row['product_id'],)
+            )
+            bump_data_version(cursor, MEASUREMENTS_DATA_VERSION.format(row['product_id']))
         conn.commit()
     return jsonify({'status': 'success', 'message': 'Размерът е изтрит успешно'})
 
+# Header aliases of the columns in customer characteristic lists
+DIMENSION_IMPORT_COLUMNS = {
+    'dimension_name': ('name', 'dimension', 'characteristic', 'размер', 'име на размер', 'характеристика'),
+    'nominal_value': ('nominal', 'номинал', 'номинална стойност'),
+    'tolerance_minus': ('tol-', 'tolerance -', 'lower tolerance', 'толеранс -', 'долен толеранс'),
+    'tolerance_plus': ('tol+', 'tolerance +', 'upper tolerance', 'толеранс +', 'горен толеранс'),
+    # Symmetric tolerance, used where a row has no separate - / +
+    'tolerance': ('tol', '+/-', '±', 'tolerance +/-', 'толеранс', 'толеранс +/-'),
+}
+
+def diff_dimension_import(cursor, product_id, rows):
+    """Compare imported rows with the product's dimensions, matched by name.
+
+    Returns insert and update lists, the number of unchanged rows, the
+    existing dimensions the file does not mention (reported, never deleted)
+    and per-line errors.
+    """
+    cursor.execute("SELECT id, dimension_name, nominal_value, tolerance_minus, tolerance_plus FROM dimensions WHERE product_id=?", (product_id,))
+    existing = {normalize_name(row['dimension_name']): dict(row) for row in cursor.fetchall()}
+    diff = {'insert': [], 'update': [], 'unchanged': 0, 'missing': [], 'errors': []}
+    seen = {}
+    for row in rows:
+        name = ' '.join(str(row.get('dimension_name') or '').split())
+        if not name:
+            diff['errors'].append({'line': row['line'], 'message': 'Липсва име на размер'})
+            continue
+        key = normalize_name(name)
+        if key in seen:
+            diff['errors'].append({'line': row['line'], 'message': f'„{name}“ се повтаря (ред {seen[key]})'})
+            continue
+        seen[key] = row['line']
+        try:
+            nominal_value = tabular_import.parse_number(row.get('nominal_value'))
+            symmetric = row.get('tolerance')
+            tolerance_minus = abs(tabular_import.parse_number(row.get('tolerance_minus') if row.get('tolerance_minus') not in (None, '') else symmetric))
+            tolerance_plus = abs(tabular_import.parse_number(row.get('tolerance_plus') if row.get('tolerance_plus') not in (None, '') else symmetric))
+        except ValueError:
+            diff['errors'].append({'line': row['line'], 'message': f'„{name}“: номиналът и толерансите трябва да бъдат числа'})
+            continue
+        imported = {'dimension_name': name, 'nominal_value': nominal_value,
+                    'tolerance_minus': tolerance_minus, 'tolerance_plus': tolerance_plus}
+        current = existing.get(key)
+        if current is None:
+            diff['insert'].append(imported)
+        elif any(abs(current[column] - imported[column]) > 1e-9 for column in ('nominal_value', 'tolerance_minus', 'tolerance_plus')):
+            diff['update'].append({**imported, 'id': current['id'], 'dimension_name': current['dimension_name'], 'old': current})
+        else:
+            diff['unchanged'] += 1
+    diff['missing'] = [row['dimension_name'] for key, row in existing.items() if key not in seen]
+    return diff
+
+@app.route('/import_dimensions', methods=['POST'])
+def import_dimensions():
+    """Preview (action=preview) or apply (action=apply) a characteristic list.
+
+    The preview returns the diff and a token over it; apply recomputes the
+    diff inside the write transaction and refuses if it no longer matches the
+    token, so what is written is exactly what the admin reviewed.
+    """
+    if session.get('role') != 'admin':
+        return jsonify({'status': 'error', 'message': 'Достъп отказан. Необходими са администраторски права.'})
+    product_id = request.form.get('product_id', type=int)
+    file = request.files.get('file')
+    if not product_id or not file or not file.filename:
+        return jsonify({'status': 'error', 'message': 'Изберете продукт и файл'})
+    try:
+        rows = tabular_import.read_table(file, DIMENSION_IMPORT_COLUMNS, required=('dimension_name', 'nominal_value'))
+    except tabular_import.TabularImportError as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+    apply = request.form.get('action') == 'apply'
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        if apply:
+            # Hold the write lock from the diff to the commit
+            cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT 1 FROM products WHERE id=?", (product_id,))
+        if cursor.fetchone() is None:
+            return jsonify({'status': 'error', 'message': 'Продуктът не е намерен'})
+        diff = diff_dimension_import(cursor, product_id, rows)
+        warning = None
+        if diff['errors'] and not (diff['insert'] or diff['update'] or diff['unchanged']):
+            warning = 'Нито един ред не може да бъде импортиран. Проверете колоните и стойностите.'
+        token = hashlib.sha256(json.dumps([product_id, diff['insert'], diff['update']], sort_keys=True).encode()).hexdigest()
+        if not apply:
+            return jsonify({'status': 'success', 'preview': diff, 'token': token, 'message': warning})
+        if diff['errors']:
+            return jsonify({'status': 'error', 'message': 'Файлът съдържа грешки; поправете ги и прегледайте отново'})
+        if request.form.get('token') != token:
+            return jsonify({'status': 'error', 'message': 'Размерите са променени след прегледа. Моля, прегледайте отново.'})
+        cursor.executemany(
+            "INSERT INTO dimensions (product_id, dimension_name, nominal_value, tolerance_minus, tolerance_plus) VALUES (?, ?, ?, ?, ?)",
+            [(product_id, row['dimension_name'], row['nominal_value'], row['tolerance_minus'], row['tolerance_plus']) for row in diff['insert']]
+        )
+        cursor.executemany(
+            "UPDATE dimensions SET nominal_value=?, tolerance_minus=?, tolerance_plus=? WHERE id=?",
+            [(row['nominal_value'], row['tolerance_minus'], row['tolerance_plus'], row['id']) for row in diff['update']]
+        )
+        if diff['update']:
+            bump_data_version(cursor, MEASUREMENTS_DATA_VERSION.format(product_id))
+        conn.commit()
+        logger.info(f"Imported dimensions for product {product_id}: {len(diff['insert'])} added, {len(diff['update'])} updated")
+        return jsonify({'status': 'success',
+                        'message': f"Добавени размери: {len(diff['insert'])}, обновени: {len(diff['update'])}"})
+    except sqlite3.Error as e:
+        return jsonify({'status': 'error', 'message': f'Неуспешен импорт на размери: {e}'})
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.close()
+
+# New products listed in an import preview (all others are always listed)
+IMPORT_PREVIEW_NEW_ROWS = 200
+# Header aliases of the columns in product lists for /import_products
+PRODUCT_IMPORT_COLUMNS = {
+    'product_name': ('product', 'name', 'продукт', 'име на продукт', 'име на продукта'),
+    'drawing_number': ('drawing', 'drawing no', 'чертеж', 'номер на чертеж', 'номер на чертежа'),
+    'comments': ('comment', 'коментар', 'коментари'),
+    'mold_name': ('mold', 'матрица', 'име на матрица'),
+    'mold_number': ('mold no', 'номер на матрица'),
+    'maintenance_threshold': ('threshold', 'праг', 'праг за поддръжка'),
+}
+
+def classify_product_import(cursor, rows):
+    """Load the rows into temp.product_import and classify them in one query.
+
+    Each row is 'new', 'exists' (same product_key already in products, skipped),
+    'duplicate' (repeats an earlier line of the file) or 'invalid'.
+    Returns the classified rows in file order.
+    """
+    cursor.execute("DROP TABLE IF EXISTS temp.product_import")
+    cursor.execute('''
+    CREATE TEMP TABLE product_import (
+        line INTEGER PRIMARY KEY, product_name TEXT, drawing_number TEXT, comments TEXT,
+        mold_name TEXT, mold_number TEXT, maintenance_threshold INTEGER, product_key TEXT, problem TEXT
+    )
+    ''')
+    loaded = []
+    for row in rows:
+        product_name = ' '.join(str(row.get('product_name') or '').split())
+        drawing_number = ' '.join(str(row.get('drawing_number') or '').split())
+        problem = None if product_name and drawing_number else 'Липсва име на продукт или номер на чертеж'
+        threshold = None
+        if row.get('maintenance_threshold') not in (None, ''):
+            try:
+                threshold = int(tabular_import.parse_number(row['maintenance_threshold']))
+            except ValueError:
+                problem = 'Прагът за поддръжка трябва да бъде число'
+        loaded.append((row['line'], product_name, drawing_number, str(row.get('comments') or '') or None,
+                       str(row.get('mold_name') or '') or None, str(row.get('mold_number') or '') or None,
+                       threshold, product_key(product_name, drawing_number), problem))
+    cursor.executemany("INSERT INTO temp.product_import VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", loaded)
+    cursor.execute('''
+    SELECT t.line, t.product_name, t.drawing_number, t.mold_name, t.mold_number, t.problem,
+           CASE WHEN t.problem IS NOT NULL THEN 'invalid'
+                WHEN p.id IS NOT NULL THEN 'exists'
+                WHEN f.first_line < t.line THEN 'duplicate'
+                ELSE 'new' END AS outcome,
+           p.product_name AS existing_name, p.drawing_number AS existing_drawing, f.first_line
+    FROM temp.product_import t
+    LEFT JOIN main.products p ON p.product_key = t.product_key
+    LEFT JOIN (SELECT product_key, MIN(line) AS first_line FROM temp.product_import
+               WHERE problem IS NULL GROUP BY product_key) f ON f.product_key = t.product_key
+    ORDER BY t.line
+    ''')
+    return [dict(row) for row in cursor.fetchall()]
+
+@app.route('/import_products', methods=['POST'])
+def import_products():
+    """Preview or apply a product list; every new product gets its mold.
+
+    Like /import_dimensions: the preview returns a token over the new rows and
+    apply re-classifies under the write lock and refuses a changed result.
+    Products that already exist are skipped, never changed.
+    """
+    if session.get('role') != 'admin':
+        return jsonify({'status': 'error', 'message': 'Достъп отказан. Необходими са администраторски права.'})
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({'status': 'error', 'message': 'Не е избран файл'})
+    try:
+        rows = tabular_import.read_table(file, PRODUCT_IMPORT_COLUMNS, required=('product_name', 'drawing_number'))
+    except tabular_import.TabularImportError as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+    apply = request.form.get('action') == 'apply'
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        if apply:
+            # Hold the write lock from the classification to the commit
+            cursor.execute("BEGIN IMMEDIATE")
+        classified = classify_product_import(cursor, rows)
+        counts = {outcome: sum(1 for row in classified if row['outcome'] == outcome)
+                  for outcome in ('new', 'exists', 'duplicate', 'invalid')}
+        new_lines = [row['line'] for row in classified if row['outcome'] == 'new']
+        token = hashlib.sha256(json.dumps(new_lines).encode()).hexdigest()
+        if not apply:
+            listed = [row for row in classified if row['outcome'] != 'new']
+            listed += [row for row in classified if row['outcome'] == 'new'][:IMPORT_PREVIEW_NEW_ROWS]
+            return jsonify({'status': 'success', 'token': token, 'counts': counts, 'rows': listed})
+        if counts['duplicate'] or counts['invalid']:
+            return jsonify({'status': 'error', 'message': 'Файлът съдържа грешки; поправете ги и прегледайте отново'})
+        if request.form.get('token') != token:
+            return jsonify({'status': 'error', 'message': 'Продуктите са променени след прегледа. Моля, прегледайте отново.'})
+
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM products")
+        last_id = cursor.fetchone()[0]
+        cursor.execute('''
+        INSERT INTO products (product_name, drawing_number, comments, product_key)
+        SELECT t.product_name, t.drawing_number, t.comments, t.product_key
+        FROM temp.product_import t
+        WHERE NOT EXISTS (SELECT 1 FROM main.products p WHERE p.product_key = t.product_key)
+        ORDER BY t.line
+        ''')
+        added = cursor.rowcount
+        # Same defaults as a product added by hand
+        cursor.execute('''
+        INSERT INTO molds (product_id, mold_name, mold_number, maintenance_threshold, created_date)
+        SELECT p.id, COALESCE(t.mold_name, 'Mold for ' || p.product_name), COALESCE(t.mold_number, printf('M%04d', p.id)),
+               COALESCE(t.maintenance_threshold, 50000), ?
+        FROM main.products p
+        JOIN temp.product_import t ON t.product_key = p.product_key
+        WHERE p.id > ?
+        ''', (get_bulgarian_time_string(), last_id))
+        if added:
+            bump_data_version(cursor, MOLDS_DATA_VERSION)
+        conn.commit()
+        logger.info(f"Imported {added} products with molds ({counts['exists']} already existed)")
+        return jsonify({'status': 'success',
+                        'message': f"Добавени продукти: {added} (с матрици), пропуснати съществуващи: {counts['exists']}"})
+    except sqlite3.Error as e:
+        return jsonify({'status': 'error', 'message': f'Неуспешен импорт на продукти: {e}'})
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.close()
+
 @app.route('/update_product_comments', methods=['POST'])
 def update_product_comments():
     if session.get('role') != 'admin':
@@ -671,142 +1721,374 @@ def update_product_comments():
         except Exception as e:
             return jsonify({'status': 'error', 'message': f'Неуспешно актуализиране на коментари: {e}'})
 
+# BEGIN IMMEDIATE retries once the connection's busy timeout has run out
+WRITE_LOCK_RETRIES = 5
+WRITE_LOCK_BACKOFF = 0.05  # seconds, doubled on every attempt
+
+def apply_measurement_submission(cursor, submission):
+    """Write one validated measurement submission using the caller's transaction.
+
+    submission holds product_id, machine_number, count, iso_date, shift,
+    inspector and values (a list of [dimension_id, measured_value] pairs).
+    Returns a result dict with status 'saved' or 'duplicate'.
+    """
+    product_id = submission['product_id']
+    machine_number = submission['machine_number']
+    count = submission['count']
+    iso_date = submission['iso_date']
+    shift = submission['shift']
+    inspector = submission['inspector']
+    values = submission['values']
+    measured_at = local_epoch(iso_date)
+    # The caller holds the write lock, so interning cannot race
+    machine_id = lookup_id(cursor, 'machines', machine_number)
+    inspector_id = lookup_id(cursor, 'inspectors', inspector)
+    shift_id = lookup_id(cursor, 'shifts', shift)
+    
+    # Check if a submission with similar parameters already exists that day (duplicate prevention)
+    day_start, day_end = local_epoch_day_range(iso_date, iso_date)
+    cursor.execute("""
+        SELECT MAX(measured_at) FROM measurement_submissions
+        WHERE product_id = ? AND measured_at >= ? AND measured_at < ? AND machine_id = ? AND inspector_id = ?
+    """, (product_id, day_start, day_end, machine_id, inspector_id))
+    last_measured_at = cursor.fetchone()[0]
+    
+    # If last measurement was within 5 minutes, likely a duplicate
+    if last_measured_at is not None and measured_at - last_measured_at < 300:
+        return {'status': 'duplicate'}
+    
+    # 1. Check last product for this machine (the caller holds the write lock,
+    # so nobody can change it between this read and the upsert below)
+    cursor.execute("SELECT last_product_id, last_count FROM machine_last_product WHERE machine_number=?", (machine_number,))
+    last_row = cursor.fetchone()
+    if last_row and last_row['last_product_id'] is not None and last_row['last_product_id'] != product_id:
+        # Credit last_count to the previous product's molds in the cycle ledger
+        cursor.execute("SELECT id FROM molds WHERE product_id = ?", (last_row['last_product_id'],))
+        for previous_mold in cursor.fetchall():
+            record_mold_cycles(cursor, previous_mold['id'], last_row['last_count'], 'measurement',
+                               machine_number=machine_number, event_date=iso_date)
+    # 2. Insert the submission header and its values
+    cursor.execute(
+        "INSERT INTO measurement_submissions (product_id, machine_id, inspector_id, shift_id, count, measured_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (product_id, machine_id, inspector_id, shift_id, count, measured_at)
+    )
+    submission_id = cursor.lastrowid
+    cursor.executemany(
+        "INSERT INTO measurement_values (submission_id, dimension_id, measured_value) VALUES (?, ?, ?)",
+        [(submission_id, dimension_id, measured_value) for dimension_id, measured_value in values]
+    )
+    bump_data_version(cursor, MEASUREMENTS_DATA_VERSION.format(product_id))
+    # 3. Update machine_last_product
+    cursor.execute("""
+        INSERT INTO machine_last_product (machine_number, last_product_id, last_count, last_submission_id, last_update)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(machine_number) DO UPDATE SET
+            last_product_id = excluded.last_product_id,
+            last_count = excluded.last_count,
+            last_submission_id = excluded.last_submission_id,
+            last_update = excluded.last_update
+    """, (machine_number, product_id, count, submission_id, iso_date))
+    
+    # Update machine-mold assignments (one active row per machine)
+    cursor.execute("""
+        INSERT INTO machine_mold_assignments (machine_number, mold_id, assigned_date, assigned_by)
+        SELECT ?, id, ?, ? FROM molds WHERE product_id = ? ORDER BY id LIMIT 1
+        ON CONFLICT(machine_number) WHERE status = 'active' DO UPDATE SET
+            mold_id = excluded.mold_id,
+            assigned_date = excluded.assigned_date,
+            assigned_by = excluded.assigned_by
+    """, (machine_number, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), inspector, product_id))
+    
+    # Publish the submission to live feed listeners
+    cursor.execute('''
+    SELECT d.id, d.dimension_name, d.nominal_value, d.tolerance_plus, d.tolerance_minus, p.product_name
+    FROM dimensions d
+    JOIN products p ON d.product_id = p.id
+    WHERE d.product_id = ?
+    ''', (product_id,))
+    dimensions = {str(row['id']): row for row in cursor.fetchall()}
+    product_name = next(iter(dimensions.values()))['product_name'] if dimensions else ''
+    feed_rows = []
+    for dimension_id, measured in values:
+        dimension = dimensions.get(str(dimension_id))
+        if not dimension:
+            continue
+        feed_rows.append({
+            'dimension_name': dimension['dimension_name'],
+            'measured_value': measured,
+            'nominal_value': dimension['nominal_value'],
+            'tolerance_plus': dimension['tolerance_plus'],
+            'tolerance_minus': dimension['tolerance_minus'],
+            'in_tolerance': (dimension['nominal_value'] - dimension['tolerance_minus']) <= measured <= (dimension['nominal_value'] + dimension['tolerance_plus'])
+        })
+    log_change(cursor, 'measurement', {
+        'submission_id': submission_id,
+        'product_id': product_id,
+        'product_name': product_name,
+        'machine_number': machine_number,
+        'count': count,
+        'shift': shift,
+        'inspector': inspector,
+        'measurement_date': convert_to_local_date(iso_date),
+        'out_of_tolerance': sum(1 for row in feed_rows if not row['in_tolerance']),
+        'rows': feed_rows
+    })
+    
+    return {'status': 'saved', 'saved': len(values), 'submission_id': submission_id}
+
+def is_database_locked(error):
+    """True for SQLITE_BUSY / SQLITE_LOCKED errors that are worth retrying."""
+    return isinstance(error, sqlite3.OperationalError) and (
+        'database is locked' in str(error) or 'database is busy' in str(error)
+    )
+
+def save_measurement_submissions(conn, submissions):
+    """Write a batch of submissions in one transaction, one savepoint each.
+
+    The write lock is taken up front with BEGIN IMMEDIATE, so the reads inside
+    the transaction can never be invalidated by another writer. If the lock
+    cannot be obtained, the whole batch is retried with jittered backoff.
+    A failing submission is rolled back to its savepoint without affecting the
+    rest of the batch. Returns one result dict per submission, in order.
+    """
+    conn.isolation_level = None  # Explicit transaction control below
+    cursor = conn.cursor()
+    for attempt in range(WRITE_LOCK_RETRIES + 1):
+        results = []
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for submission in submissions:
+                cursor.execute("SAVEPOINT submission")
+                try:
+                    results.append(apply_measurement_submission(cursor, submission))
+                    cursor.execute("RELEASE submission")
+                except (sqlite3.Error, KeyError, TypeError, ValueError) as e:
+                    if is_database_locked(e):
+                        raise
+                    cursor.execute("ROLLBACK TO submission")
+                    cursor.execute("RELEASE submission")
+                    logger.error(f"Error saving measurement submission: {e}")
+                    results.append({'status': 'error', 'message': str(e)})
+            if any(result['status'] == 'saved' for result in results):
+                bump_data_version(cursor, MOLDS_DATA_VERSION)
+            cursor.execute("COMMIT")
+            return results
+        except Exception as e:
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            if not is_database_locked(e) or attempt == WRITE_LOCK_RETRIES:
+                raise
+            delay = random.uniform(0, WRITE_LOCK_BACKOFF * (2 ** attempt))
+            logger.warning(f"Database locked while saving measurements, retrying in {delay:.3f}s")
+            time.sleep(delay)
+
+# Group-commit writer (measurement_writer.py); when the socket is configured,
+# workers hand validated submissions to it instead of writing themselves.
+# gunicorn.conf.py enables it at the default path, in a directory private to
+# the app user: whoever answers on the socket decides what happens to the data.
+MEASUREMENT_WRITER_SOCKET = os.environ.get('MEASUREMENT_WRITER_SOCKET', '')
+DEFAULT_MEASUREMENT_WRITER_SOCKET = os.path.join(report_cache.default_cache_dir(app.config['DATABASE'], 'writer'),
+                                                 'measurement_writer.sock')
+MEASUREMENT_WRITER_TIMEOUT = 15  # seconds
+
+def check_writer_socket(path):
+    """Raise OSError unless path is this user's socket in a directory nobody else can write to"""
+    directory = os.lstat(os.path.dirname(os.path.abspath(path)))
+    info = os.lstat(path)
+    if not (stat.S_ISDIR(directory.st_mode) and report_cache.private_to_user(directory)
+            and stat.S_ISSOCK(info.st_mode) and info.st_uid == os.getuid()):
+        raise PermissionError(f"{path} is not a private socket of this user")
+
+def submit_measurement_submission(submission):
+    """Save a validated submission through the writer process, or directly if it is not running"""
+    if MEASUREMENT_WRITER_SOCKET:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(MEASUREMENT_WRITER_TIMEOUT)
+        try:
+            check_writer_socket(MEASUREMENT_WRITER_SOCKET)
+            sock.connect(MEASUREMENT_WRITER_SOCKET)
+        except OSError as e:
+            sock.close()
+            logger.warning(f"Measurement writer unavailable ({e}), writing directly")
+        else:
+            try:
+                sock.sendall(json.dumps(submission).encode() + b'\n')
+                reply = sock.makefile('rb').readline()
+                if reply:
+                    return json.loads(reply)
+                return {'status': 'error', 'message': 'Measurement writer closed the connection'}
+            except socket.timeout:
+                return {'status': 'error', 'message': 'Measurement writer did not respond in time'}
+            except OSError as e:
+                return {'status': 'error', 'message': f'Measurement writer connection failed: {e}'}
+            finally:
+                sock.close()
+    
+    conn = get_db_connection()
+    try:
+        return save_measurement_submissions(conn, [submission])[0]
+    finally:
+        conn.close()
+
 @app.route('/measurements', methods=['GET', 'POST'])
 def measurements():
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT id, product_name, drawing_path, drawing_path_2, comments FROM products")
         products = [dict(row) for row in cursor.fetchall()]
-        current_date = get_bulgarian_time().strftime('%d-%m-%Y')
-        if request.method == 'POST':
-            product_id = int(request.form['product_id'])
-            machine_number = request.form['machine_number']
-            count = int(request.form['count'])
-            measurement_date = request.form['measurement_date']
-            shift = request.form.get('shift', '')
-            if not re.match(r"\d{2}-\d{2}-\d{4}", measurement_date):
-                flash('Невалиден формат на датата (използвайте ДД-ММ-ГГГГ)', 'error')
-                return render_template('measurements.html', products=products, role=session.get('role'), current_date=current_date)
-            try:
-                iso_date = datetime.strptime(measurement_date, "%d-%m-%Y").strftime("%Y-%m-%d")
-                iso_date = f"{iso_date} {get_bulgarian_time().strftime('%H:%M:%S')}"
-            except ValueError:
-                flash('Невалиден формат на датата (използвайте ДД-ММ-ГГГГ)', 'error')
-                return render_template('measurements.html', products=products, role=session.get('role'), current_date=current_date)
-            if count <= 0:
-                flash('Броят трябва да бъде положително цяло число', 'error')
-                return render_template('measurements.html', products=products, role=session.get('role'), current_date=current_date)
-            if not machine_number:
-                flash('Номерът на машината е задължителен', 'error')
-                return render_template('measurements.html', products=products, role=session.get('role'), current_date=current_date)
-            measurements = []
-            for key in request.form:
-                if key.startswith('measured_value_'):
-                    dimension_id = key.split('_')[-1]
-                    measured_value = request.form[key]
-                    if measured_value:
-                        try:
-                            measured_value = float(measured_value)
-                            measurements.append((product_id, dimension_id, measured_value, iso_date, machine_number, count, session['user'], shift))
-                        except ValueError:
-                            flash(f'Невалидна стойност на измерване за размер ID {dimension_id}', 'error')
-                            return render_template('measurements.html', products=products, role=session.get('role'), current_date=current_date)
-            if not measurements:
-                flash('Няма въведени измервания', 'error')
+    current_date = get_bulgarian_time().strftime('%d-%m-%Y')
+    if request.method == 'POST':
+        product_id = int(request.form['product_id'])
+        machine_number = request.form['machine_number']
+        count = int(request.form['count'])
+        measurement_date = request.form['measurement_date']
+        shift = request.form.get('shift', '')
+        if not re.match(r"\d{2}-\d{2}-\d{4}", measurement_date):
+            flash('Невалиден формат на датата (използвайте ДД-ММ-ГГГГ)', 'error')
+            return render_template('measurements.html', products=products, role=session.get('role'), current_date=current_date)
+        try:
+            iso_date = datetime.strptime(measurement_date, "%d-%m-%Y").strftime("%Y-%m-%d")
+            iso_date = f"{iso_date} {get_bulgarian_time().strftime('%H:%M:%S')}"
+        except ValueError:
+            flash('Невалиден формат на датата (използвайте ДД-ММ-ГГГГ)', 'error')
+            return render_template('measurements.html', products=products, role=session.get('role'), current_date=current_date)
+        if count <= 0:
+            flash('Броят трябва да бъде положително цяло число', 'error')
+            return render_template('measurements.html', products=products, role=session.get('role'), current_date=current_date)
+        if not machine_number:
+            flash('Номерът на машината е задължителен', 'error')
+            return render_template('measurements.html', products=products, role=session.get('role'), current_date=current_date)
+        values = []
+        for key in request.form:
+            if key.startswith('measured_value_'):
+                dimension_id = key.split('_')[-1]
+                measured_value = request.form[key]
+                if measured_value:
+                    try:
+                        values.append([dimension_id, float(measured_value)])
+                    except ValueError:
+                        flash(f'Невалидна стойност на измерване за размер ID {dimension_id}', 'error')
+                        return render_template('measurements.html', products=products, role=session.get('role'), current_date=current_date)
+        if not values:
+            flash('Няма въведени измервания', 'error')
+        else:
+            result = submit_measurement_submission({
+                'product_id': product_id,
+                'machine_number': machine_number,
+                'count': count,
+                'iso_date': iso_date,
+                'shift': shift,
+                'inspector': session['user'],
+                'values': values
+            })
+            if result['status'] == 'duplicate':
+                flash('Възможно дублиране! Измервания за този продукт, машина и дата вече са записани преди малко. Моля, проверете дали не се опитвате да запишете същите данни отново.', 'warning')
+            elif result['status'] == 'saved':
+                flash(f'{result["saved"]} измервания са запазени успешно', 'success')
             else:
-                # Generate unique submission ID to prevent duplicates
-                submission_id = f"{product_id}_{machine_number}_{iso_date.replace(' ', '_').replace(':', '')}_{uuid.uuid4().hex[:8]}"
-                
-                # Check if measurements with similar parameters already exist (duplicate prevention)
-                cursor.execute("""
-                    SELECT COUNT(*) FROM measurements 
-                    WHERE product_id = ? AND machine_number = ? AND date(measurement_date) = date(?) AND inspector = ?
-                """, (product_id, machine_number, iso_date, session['user']))
-                existing_count = cursor.fetchone()[0]
-                
-                if existing_count > 0:
-                    # Check if this might be a duplicate submission
-                    cursor.execute("""
-                        SELECT measurement_date FROM measurements 
-                        WHERE product_id = ? AND machine_number = ? AND date(measurement_date) = date(?) AND inspector = ?
-                        ORDER BY measurement_date DESC LIMIT 1
-                    """, (product_id, machine_number, iso_date, session['user']))
-                    last_measurement = cursor.fetchone()
-                    
-                    if last_measurement:
-                        last_time = datetime.strptime(last_measurement[0], "%Y-%m-%d %H:%M:%S")
-                        current_time = datetime.strptime(iso_date, "%Y-%m-%d %H:%M:%S")
-                        time_diff = (current_time - last_time).total_seconds()
-                        
-                        # If last measurement was within 5 minutes, likely a duplicate
-                        if time_diff < 300:  # 5 minutes
-                            flash('Възможно дублиране! Измервания за този продукт, машина и дата вече са записани преди малко. Моля, проверете дали не се опитвате да запишете същите данни отново.', 'warning')
-                            return render_template('measurements.html', products=products, role=session.get('role'), current_date=current_date)
-                
-                # Add submission_id to each measurement
-                measurements_with_id = []
-                for measurement in measurements:
-                    measurements_with_id.append(measurement + (submission_id,))
-                
-                # 1. Check last product for this machine
-                cursor.execute("SELECT last_product_id, last_count FROM machine_last_product WHERE machine_number=?", (machine_number,))
-                last_row = cursor.fetchone()
-                if last_row and last_row['last_product_id'] is not None and last_row['last_product_id'] != product_id:
-                    # Add last_count to the previous product's mold cycle count
-                    cursor.execute("UPDATE molds SET total_cycles = total_cycles + ? WHERE product_id = ?", (last_row['last_count'], last_row['last_product_id']))
-                # 2. Insert measurements with submission_id
-                cursor.executemany(
-                    "INSERT INTO measurements (product_id, dimension_id, measured_value, measurement_date, machine_number, count, inspector, shift, submission_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                    measurements_with_id
-                )
-                # 3. Update machine_last_product
-                # Get the last inserted measurement id
-                cursor.execute("SELECT id FROM measurements WHERE product_id=? AND machine_number=? ORDER BY id DESC LIMIT 1", (product_id, machine_number))
-                last_measurement_id = cursor.fetchone()
-                last_measurement_id = last_measurement_id['id'] if last_measurement_id else None
-                cursor.execute("REPLACE INTO machine_last_product (machine_number, last_product_id, last_count, last_measurement_id, last_update) VALUES (?, ?, ?, ?, ?)",
-                    (machine_number, product_id, count, last_measurement_id, iso_date))
-                
-                # Update machine-mold assignments
-                # First, get the mold for this product
-                cursor.execute("SELECT id FROM molds WHERE product_id = ? LIMIT 1", (product_id,))
-                mold_result = cursor.fetchone()
-                if mold_result:
-                    mold_id = mold_result['id']
-                    current_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    inspector = session.get('user', 'Unknown')
-                    
-                    # Check if there's already an active assignment for this machine
-                    cursor.execute(
-                        "SELECT id FROM machine_mold_assignments WHERE machine_number = ? AND status = 'active'",
-                        (machine_number,)
-                    )
-                    existing_assignment = cursor.fetchone()
-                    
-                    if existing_assignment:
-                        # Update existing assignment
-                        cursor.execute(
-                            "UPDATE machine_mold_assignments SET mold_id = ?, assigned_date = ?, assigned_by = ? WHERE id = ?",
-                            (mold_id, current_date, inspector, existing_assignment['id'])
-                        )
-                    else:
-                        # Create new assignment
-                        cursor.execute(
-                            "INSERT INTO machine_mold_assignments (machine_number, mold_id, assigned_date, assigned_by) VALUES (?, ?, ?, ?)",
-                            (machine_number, mold_id, current_date, inspector)
-                        )
-                
-                conn.commit()
-                flash(f'{len(measurements)} измервания са запазени успешно', 'success')
+                flash(f'Грешка при запазване на измерванията: {result.get("message", "")}', 'error')
     return render_template('measurements.html', products=products, role=session.get('role'), current_date=current_date)
 
+# Measurements older than the archive horizon live in per-year archive files
+# (archive_measurements.py); reports attach the years a date range touches
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive')
+ARCHIVE_HORIZON_DAYS = int(os.environ.get('ARCHIVE_HORIZON_DAYS', 365))
+# SQLite attaches at most 10 databases by default; keep one free
+MAX_ATTACHED_ARCHIVES = 9
+
+
+class TooManyArchivePartitions(Exception):
+    pass
+
+
+def measurement_archive_path(year):
+    return os.path.join(ARCHIVE_DIR, f'measurements_{year}.db')
+
+def measurement_archive_paths():
+    """Every per-year archive file, oldest year first"""
+    try:
+        names = sorted(os.listdir(ARCHIVE_DIR))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(ARCHIVE_DIR, name) for name in names
+            if name.startswith('measurements_') and name.endswith('.db')]
+
+def count_archived_submissions(product_id):
+    """Submissions of a product in all archive files (read-only, no ATTACH inside a transaction)"""
+    total = 0
+    for path in measurement_archive_paths():
+        archive = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+        try:
+            total += archive.execute("SELECT COUNT(*) FROM measurement_submissions WHERE product_id=?",
+                                     (product_id,)).fetchone()[0]
+        finally:
+            archive.close()
+    return total
+
+def measurement_source(conn, iso_start_date, iso_end_date, product_id=None):
+    """Return (source, params) for measurement rows between two ISO dates.
+
+    source is a subquery in the MEASUREMENT_ROWS shape, already filtered on
+    measured_at (and product_id, if given) through the submission indexes.
+    Archive years inside the range are attached to conn and added as
+    UNION ALL branches filtered the same way.
+    """
+    years = [year for year in range(int(iso_start_date[:4]), int(iso_end_date[:4]) + 1)
+             if os.path.exists(measurement_archive_path(year))]
+    if len(years) > MAX_ATTACHED_ARCHIVES:
+        raise TooManyArchivePartitions(len(years))
+    attached = {row[1] for row in conn.execute("PRAGMA database_list")}
+    prefixes = ['main.']
+    for year in years:
+        schema = f'archive_{year}'
+        if schema not in attached:
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (measurement_archive_path(year),))
+        prefixes.append(f'{schema}.')
+    condition = "WHERE s.measured_at >= ? AND s.measured_at < ?"
+    branch_params = list(local_epoch_day_range(iso_start_date, iso_end_date))
+    if product_id:
+        condition += " AND s.product_id = ?"
+        branch_params.append(product_id)
+    branches = [MEASUREMENT_ROWS.format(prefix=prefix) + condition for prefix in prefixes]
+    return '(' + ' UNION ALL '.join(branches) + ')', branch_params * len(branches)
+
+def query_report_rows(conn, product_id, iso_start_date, iso_end_date, report_type):
+    """Rows for the /reports table; raises TooManyArchivePartitions for too long ranges"""
+    source, params = measurement_source(conn, iso_start_date, iso_end_date, product_id)
+    query = f'''
+    SELECT p.product_name, d.dimension_name, m.measured_value, d.nominal_value, d.tolerance_plus, d.tolerance_minus,
+           m.measurement_date, m.inspector, m.machine_number, m.count, m.shift
+    FROM {source} m
+    JOIN dimensions d ON m.dimension_id = d.id
+    JOIN products p ON m.product_id = p.id
+    ORDER BY p.product_name, d.dimension_name, m.measured_at DESC
+    '''
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    report_data = [dict(row) for row in cursor.fetchall()]
+    for row in report_data:
+        row['measurement_date'] = convert_to_local_date(row['measurement_date'])
+    if report_type == 'detailed':
+        # Add in_tolerance field for each row
+        for row in report_data:
+            nominal = row['nominal_value']
+            minus = row['tolerance_minus']
+            plus = row['tolerance_plus']
+            measured = row['measured_value']
+            row['in_tolerance'] = (nominal - minus) <= measured <= (nominal + plus)
+    return report_data
+
 @app.route('/reports', methods=['GET', 'POST'])
 def reports():
-    with get_db_connection() as conn:
+    conn, data_as_of = get_report_connection()
+    if data_as_of:
+        data_as_of = datetime.strptime(data_as_of, '%Y-%m-%d %H:%M:%S').strftime('%d-%m-%Y %H:%M:%S')
+    with conn:
         cursor = conn.cursor()
         cursor.execute("SELECT id, product_name FROM products")
         products = [dict(row) for row in cursor.fetchall()]
-        cursor.execute("SELECT DISTINCT machine_number FROM measurements")
+        # One row per machine that ever submitted; avoids a full measurements scan
+        cursor.execute("SELECT machine_number FROM machine_last_product ORDER BY machine_number")
         machines = [row['machine_number'] for row in cursor.fetchall() if row['machine_number']]
         report_data = []
         headers = []
@@ -819,56 +2101,148 @@ def reports():
             end_date = request.form['end_date']
             if not product_id:
                 flash('Моля, изберете продукт, преди да генерирате справка.', 'error')
-                return render_template('reports.html', products=products, machines=machines, report_data=report_data, headers=headers, role=session.get('role'), start_date=start_date, end_date=end_date)
+                return render_template('reports.html', products=products, machines=machines, report_data=report_data, headers=headers, role=session.get('role'), start_date=start_date, end_date=end_date, data_as_of=data_as_of)
             if not re.match(r"\d{2}-\d{2}-\d{4}", start_date) or not re.match(r"\d{2}-\d{2}-\d{4}", end_date):
                 flash('Невалиден формат на датата (използвайте ДД-ММ-ГГГГ)', 'error')
-                return render_template('reports.html', products=products, machines=machines, report_data=report_data, headers=headers, role=session.get('role'), start_date=start_date, end_date=end_date)
+                return render_template('reports.html', products=products, machines=machines, report_data=report_data, headers=headers, role=session.get('role'), start_date=start_date, end_date=end_date, data_as_of=data_as_of)
             try:
                 iso_start_date = convert_to_iso_date(start_date)
                 iso_end_date = convert_to_iso_date(end_date)
             except ValueError:
                 flash('Невалиден формат на датата (използвайте ДД-ММ-ГГГГ)', 'error')
-                return render_template('reports.html', products=products, machines=machines, report_data=report_data, headers=headers, role=session.get('role'), start_date=start_date, end_date=end_date)
+                return render_template('reports.html', products=products, machines=machines, report_data=report_data, headers=headers, role=session.get('role'), start_date=start_date, end_date=end_date, data_as_of=data_as_of)
             
-            query = '''
-            SELECT p.product_name, d.dimension_name, m.measured_value, d.nominal_value, d.tolerance_plus, d.tolerance_minus,
-                   m.measurement_date, m.inspector, m.machine_number, m.count, m.shift
-            FROM measurements m
-            JOIN dimensions d ON m.dimension_id = d.id
-            JOIN products p ON m.product_id = p.id
-            WHERE date(m.measurement_date) BETWEEN ? AND ?
-            {} 
-            ORDER BY p.product_name, d.dimension_name, m.measurement_date DESC
-            '''
-            conditions = []
-            params = [iso_start_date, iso_end_date]
-            if product_id:
-                conditions.append("m.product_id = ?")
-                params.append(product_id)
-            query = query.format("AND " + " AND ".join(conditions) if conditions else "")
-            cursor.execute(query, params)
-            report_data = [dict(row) for row in cursor.fetchall()]
-            for row in report_data:
-                row['measurement_date'] = convert_to_local_date(row['measurement_date'])
+            # Cached per parameters and product data version; unchanged data is never re-queried
+            cache_key = REPORT_CACHE.key('report', product_id, iso_start_date, iso_end_date, report_type,
+                                         get_measurements_data_version(cursor, product_id))
+            report_data = REPORT_CACHE.get_json(cache_key)
+            if report_data is None:
+                try:
+                    report_data = query_report_rows(conn, product_id, iso_start_date, iso_end_date, report_type)
+                except TooManyArchivePartitions:
+                    flash(f'Периодът е твърде дълъг (над {MAX_ATTACHED_ARCHIVES} архивни години). Моля, изберете по-кратък период.', 'error')
+                    return render_template('reports.html', products=products, machines=machines, report_data=[], headers=headers, role=session.get('role'), start_date=start_date, end_date=end_date, data_as_of=data_as_of)
+                REPORT_CACHE.put_json(cache_key, report_data)
             if report_type == 'detailed':
-                # Add in_tolerance field for each row
-                for row in report_data:
-                    nominal = row['nominal_value']
-                    minus = row['tolerance_minus']
-                    plus = row['tolerance_plus']
-                    measured = row['measured_value']
-                    row['in_tolerance'] = (nominal - minus) <= measured <= (nominal + plus)
                 headers = ["Product", "Dimension", "Measured Value", "Nominal", "Tolerance (+/-)", "Measurement Date", "Inspector", "Machine", "Count", "Shift", "Tol. check"]
             else:
                 headers = ["Product", "Dimension", "Measured Value", "Nominal", "Tolerance (+/-)", "Measurement Date", "Inspector", "Machine", "Count", "Shift"]
-        return render_template('reports.html', products=products, machines=machines, report_data=report_data, headers=headers, role=session.get('role'), start_date=start_date, end_date=end_date)
+        return render_template('reports.html', products=products, machines=machines, report_data=report_data, headers=headers, role=session.get('role'), start_date=start_date, end_date=end_date, data_as_of=data_as_of)
+
+# Trend charts: a series never carries more than this many points, whatever the range
+SERIES_MAX_POINTS = 2000
+
+def query_dimension_series(conn, dimension, iso_start_date, iso_end_date, max_points, method):
+    """Measured values of one dimension over a date range, downsampled to max_points.
+
+    Points are [measured_at, value] pairs in time order; measured_at is plant
+    time in seconds since 1970 (see local_epoch), so charts show it as UTC.
+    Raises TooManyArchivePartitions for too long ranges.
+    """
+    import numpy as np  # Loaded on first use; keeps worker start-up light
+
+    source, params = measurement_source(conn, iso_start_date, iso_end_date, dimension['product_id'])
+    cursor = conn.cursor()
+    cursor.row_factory = None  # Plain tuples straight into the array
+    cursor.execute(f"SELECT m.measured_at, m.measured_value FROM {source} m WHERE m.dimension_id = ? ORDER BY m.measured_at",
+                   params + [dimension['id']])
+    series = np.fromiter(cursor, dtype=[('t', np.int64), ('v', np.float64)])
+
+    lower = dimension['nominal_value'] - dimension['tolerance_minus']
+    upper = dimension['nominal_value'] + dimension['tolerance_plus']
+    if len(series) > max_points:
+        if method == 'min_max':
+            keep = downsample.min_max(series['v'], max_points)
+        else:
+            keep = downsample.lttb(series['t'], series['v'], max_points)
+        points = series[keep]
+    else:
+        method = None
+        points = series
+    return {
+        'dimension': {
+            'id': dimension['id'],
+            'name': dimension['dimension_name'],
+            'nominal': dimension['nominal_value'],
+            'tolerance_minus': dimension['tolerance_minus'],
+            'tolerance_plus': dimension['tolerance_plus'],
+            'lower_limit': lower,
+            'upper_limit': upper,
+        },
+        'total_points': len(series),
+        # Counted over every point, so downsampling cannot hide how many were out of tolerance
+        'out_of_tolerance': int(((series['v'] < lower) | (series['v'] > upper)).sum()),
+        'downsampled': method,
+        'points': [[int(t), float(v)] for t, v in zip(points['t'], points['v'])],
+    }
+
+@app.route('/dimension_series/<int:dimension_id>')
+def dimension_series(dimension_id):
+    """Trend chart data for one dimension; start_date/end_date as DD-MM-YYYY (default: last 30 days)"""
+    if not session.get('user'):
+        return jsonify({'status': 'error', 'message': 'Необходимо е влизане в системата'}), 401
+    end_date = request.args.get('end_date') or datetime.now().strftime('%d-%m-%Y')
+    start_date = request.args.get('start_date') or (datetime.now() - timedelta(days=30)).strftime('%d-%m-%Y')
+    method = request.args.get('method', 'lttb')
+    max_points = min(max(request.args.get('max_points', SERIES_MAX_POINTS, type=int), 10), SERIES_MAX_POINTS)
+    if method not in downsample.METHODS:
+        return jsonify({'status': 'error', 'message': f"Невалиден метод (използвайте {' или '.join(downsample.METHODS)})"}), 400
+    try:
+        iso_start_date = convert_to_iso_date(start_date)
+        iso_end_date = convert_to_iso_date(end_date)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Невалиден формат на датата (използвайте ДД-ММ-ГГГГ)'}), 400
+
+    conn, data_as_of = get_report_connection()
+    with conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, product_id, dimension_name, nominal_value, tolerance_minus, tolerance_plus FROM dimensions WHERE id=?",
+                       (dimension_id,))
+        dimension = cursor.fetchone()
+        if not dimension:
+            return jsonify({'status': 'error', 'message': 'Размерът не е намерен'}), 404
+        # Cached like the reports: per parameters and the product's data version
+        cache_key = REPORT_CACHE.key('series', dimension_id, iso_start_date, iso_end_date, max_points, method,
+                                     get_measurements_data_version(cursor, dimension['product_id']))
+        series = REPORT_CACHE.get_json(cache_key)
+        if series is None:
+            try:
+                series = query_dimension_series(conn, dimension, iso_start_date, iso_end_date, max_points, method)
+            except TooManyArchivePartitions:
+                return jsonify({'status': 'error', 'message': f'Периодът е твърде дълъг (над {MAX_ATTACHED_ARCHIVES} архивни години). Моля, изберете по-кратък период.'}), 400
+            REPORT_CACHE.put_json(cache_key, series)
+    return jsonify({'status': 'success', 'start_date': start_date, 'end_date': end_date, 'data_as_of': data_as_of, **series})
+
+# Cell B3 of an export ("Exported: ... | Data as of: ...") differs per download,
+# so the cached workbook holds this placeholder instead; openpyxl writes it
+# into the sheet as an inline string (older versions: shared strings)
+EXPORT_STAMP_PLACEHOLDER = 'QC-EXPORT-STAMP'
+EXPORT_STAMP_PARTS = ('xl/worksheets/sheet1.xml', 'xl/sharedStrings.xml')
+
+def stamp_export(xlsx_bytes, data_as_of):
+    """Workbook bytes with the export time (and replica snapshot time) in place of the placeholder"""
+    import zipfile
+    from xml.sax.saxutils import escape
+
+    stamp = f"Exported: {get_bulgarian_time().strftime('%d-%m-%Y %H:%M')}"
+    if data_as_of:
+        stamp += f" | Data as of: {datetime.strptime(data_as_of, '%Y-%m-%d %H:%M:%S').strftime('%d-%m-%Y %H:%M')}"
+    stamped = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(xlsx_bytes)) as source, zipfile.ZipFile(stamped, 'w', zipfile.ZIP_DEFLATED) as target:
+        for item in source.infolist():
+            data = source.read(item)
+            if item.filename in EXPORT_STAMP_PARTS:
+                data = data.replace(EXPORT_STAMP_PLACEHOLDER.encode(), escape(stamp).encode('utf-8'), 1)
+            target.writestr(item, data)
+    return stamped.getvalue()
 
 @app.route('/export_excel', methods=['POST'])
 def export_excel():
     if not session.get('user'):
         return redirect(url_for('login'))
     
-    with get_db_connection() as conn:
+    conn, data_as_of = get_report_connection()
+    with conn:
         cursor = conn.cursor()
         
         # Get form data
@@ -889,6 +2263,26 @@ def export_excel():
             flash('Невалиден формат на датата (използвайте ДД-ММ-ГГГГ)', 'error')
             return redirect(url_for('reports'))
         
+        filename = f"detailed_measurements_{start_date}_to_{end_date}.xlsx"
+
+        # An unchanged export (same parameters and data version) is served from the cache
+        cache_key = REPORT_CACHE.key('export', product_id, iso_start_date, iso_end_date,
+                                     get_measurements_data_version(cursor, product_id))
+        cached = REPORT_CACHE.get(cache_key)
+        if cached is not None:
+            return send_file(
+                io.BytesIO(stamp_export(cached, data_as_of)),
+                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                as_attachment=True,
+                download_name=filename
+            )
+        
+        # openpyxl (and Pillow, for the logo) are loaded on the first export only
+        from openpyxl import Workbook
+        from openpyxl.drawing.image import Image as XLImage
+        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+        from openpyxl.utils import get_column_letter
+
         # Create workbook
         wb = Workbook()
         ws = wb.active
@@ -913,23 +2307,20 @@ def export_excel():
         ws.title = "Detailed Measurements Report"
         
         # Query data
-        query = '''
+        try:
+            source, params = measurement_source(conn, iso_start_date, iso_end_date, product_id)
+        except TooManyArchivePartitions:
+            flash(f'Периодът е твърде дълъг (над {MAX_ATTACHED_ARCHIVES} архивни години). Моля, изберете по-кратък период.', 'error')
+            return redirect(url_for('reports'))
+        query = f'''
         SELECT p.product_name, d.dimension_name, ROUND(m.measured_value, 3) as measured_value, 
                d.nominal_value, d.tolerance_plus, d.tolerance_minus,
                m.measurement_date, m.inspector, m.machine_number, m.count, m.shift
-        FROM measurements m
+        FROM {source} m
         JOIN dimensions d ON m.dimension_id = d.id
         JOIN products p ON m.product_id = p.id
-        WHERE date(m.measurement_date) BETWEEN ? AND ?
-        {}
-        ORDER BY p.product_name, d.dimension_name, m.measurement_date DESC
+        ORDER BY p.product_name, d.dimension_name, m.measured_at DESC
         '''
-        conditions = []
-        params = [iso_start_date, iso_end_date]
-        if product_id:
-            conditions.append("m.product_id = ?")
-            params.append(product_id)
-        query = query.format("AND " + " AND ".join(conditions) if conditions else "")
         
         cursor.execute(query, params)
         report_data = [dict(row) for row in cursor.fetchall()]
@@ -942,7 +2333,6 @@ def export_excel():
         headers = ["Product", "Dimension", "Measured Value", "Nominal", "Tolerance (+/-)", "Measurement Date", "Inspector", "Machine", "Count", "Shift"]
         
         # --- Custom Excel Header ---
-        from openpyxl.utils import get_column_letter
         last_col_letter = get_column_letter(len(headers))
         # Place the logo image in the left corner (A1) and match header height
         logo_path = os.path.join('static', 'images', 'nav-logo-impuls.png')
@@ -963,8 +2353,7 @@ def export_excel():
         ws['B2'].alignment = Alignment(horizontal="center", vertical="center")
         # Export date/time
         ws.merge_cells(f'B3:{last_col_letter}3')
-        from datetime import datetime as dt
-        ws['B3'] = f"Exported: {dt.now().strftime('%d-%m-%Y %H:%M')}"
+        ws['B3'] = EXPORT_STAMP_PLACEHOLDER  # Filled in per download by stamp_export
         ws['B3'].font = Font(size=10, italic=True, color="FFFFFF")
         ws['B3'].alignment = Alignment(horizontal="right", vertical="center")
         # Fill blue background for header rows (A1 to last_col_letter3)
@@ -1014,15 +2403,13 @@ def export_excel():
                 adjusted_width = min(max_length + 2, 50)
             ws.column_dimensions[column_letter].width = adjusted_width
         
-        filename = f"detailed_measurements_{start_date}_to_{end_date}.xlsx"
-        
         # Save to memory
         excel_file = io.BytesIO()
         wb.save(excel_file)
-        excel_file.seek(0)
+        REPORT_CACHE.put(cache_key, excel_file.getvalue())
         
         return send_file(
-            excel_file,
+            io.BytesIO(stamp_export(excel_file.getvalue(), data_as_of)),
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
             as_attachment=True,
             download_name=filename
@@ -1427,7 +2814,8 @@ def recent_measurements():
         FROM measurements m
         JOIN dimensions d ON m.dimension_id = d.id
         JOIN products p ON m.product_id = p.id
-        ORDER BY m.measurement_date DESC
+        WHERE m.submission_id IN (SELECT id FROM measurement_submissions ORDER BY measured_at DESC LIMIT 10)
+        ORDER BY m.measured_at DESC
         LIMIT 10
         '''
         cursor.execute(query)
@@ -1446,33 +2834,128 @@ def recent_measurements():
         ]
     return render_template('recent_measurements.html', report_data=report_data, headers=headers, role=session.get('role'))
 
+# Live feed streaming: each listener polls change_log by primary key, so it
+# should be served by threaded workers (see gunicorn.conf.py)
+LIVE_FEED_POLL_SECONDS = 0.5
+LIVE_FEED_HEARTBEAT_SECONDS = 15
+LIVE_FEED_MAX_SECONDS = 300  # Browsers reconnect with Last-Event-ID afterwards
+LIVE_FEED_RETRY_MS = 2000
+
+@app.route('/live_feed')
+def live_feed():
+    """Server-Sent Events stream of measurements, mold problems and threshold crossings"""
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('last_id', type=int)
+    if last_id is None:
+        with get_db_connection() as conn:
+            last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM change_log").fetchone()[0]
+    
+    def stream(last_id):
+        deadline = time.monotonic() + LIVE_FEED_MAX_SECONDS
+        last_write = time.monotonic()
+        yield f"retry: {LIVE_FEED_RETRY_MS}\n\n"
+        while time.monotonic() < deadline:
+            conn = get_db_connection()
+            try:
+                rows = conn.execute(
+                    "SELECT id, event_type, payload FROM change_log WHERE id > ? ORDER BY id LIMIT 100",
+                    (last_id,)
+                ).fetchall()
+            finally:
+                conn.close()
+            for row in rows:
+                last_id = row['id']
+                yield f"id: {row['id']}\nevent: {row['event_type']}\ndata: {row['payload']}\n\n"
+            if rows:
+                last_write = time.monotonic()
+                continue
+            if time.monotonic() - last_write >= LIVE_FEED_HEARTBEAT_SECONDS:
+                last_write = time.monotonic()
+                yield ": keep-alive\n\n"
+            time.sleep(LIVE_FEED_POLL_SECONDS)
+    
+    return Response(stream(last_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/molds')
 def molds():
+    page = request.args.get('page', 1, type=int)
+    status = request.args.get('status', '', type=str)
+    product_id = request.args.get('product_id', type=int)
+    machine = request.args.get('machine', '', type=str).strip()
+    per_page = 50  # Molds per page
+    
+    conditions = []
+    params = []
+    order_by = "m.created_date DESC"
+    if status in ('overdue', 'due_soon'):
+        # The literal != 'ok' term lets SQLite use the partial index idx_molds_maintenance_attention
+        conditions.append("m.maintenance_status != 'ok' AND m.maintenance_status = ?")
+        params.append(status)
+        order_by = "m.cycles_remaining"
+    elif status == 'ok':
+        conditions.append("m.maintenance_status = 'ok'")
+    if product_id:
+        conditions.append("m.product_id = ?")
+        params.append(product_id)
+    if machine:
+        conditions.append('''EXISTS (
+            SELECT 1 FROM machine_mold_assignments mma
+            WHERE mma.mold_id = m.id AND mma.machine_number = ? AND mma.status = 'active'
+        )''')
+        params.append(machine)
+    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+    
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute('''
+        
+        cursor.execute(f"SELECT COUNT(*) FROM molds m {where}", params)
+        total = cursor.fetchone()[0]
+        
+        # Calculate pagination info
+        total_pages = (total + per_page - 1) // per_page
+        has_prev = page > 1
+        has_next = page < total_pages
+        offset = (page - 1) * per_page
+        
+        cursor.execute(f'''
         SELECT m.id, m.mold_name, m.mold_number, m.total_cycles, m.maintenance_threshold, 
-               m.last_maintenance_date, m.status, m.created_date, p.product_name
+               m.last_maintenance_date, m.status, m.created_date, p.product_name,
+               m.cycles_remaining, m.maintenance_status,
+               CASE m.maintenance_status WHEN 'overdue' THEN 'red' WHEN 'due_soon' THEN 'orange' ELSE 'green' END AS status_color
         FROM molds m
         JOIN products p ON m.product_id = p.id
-        ORDER BY m.created_date DESC
-        ''')
+        {where}
+        ORDER BY {order_by}
+        LIMIT ? OFFSET ?
+        ''', params + [per_page, offset])
         molds = [dict(row) for row in cursor.fetchall()]
         
-        # Calculate maintenance status for each mold
-        for mold in molds:
-            cycles_remaining = mold['maintenance_threshold'] - mold['total_cycles']
-            if cycles_remaining <= 0:
-                mold['maintenance_status'] = 'overdue'
-                mold['status_color'] = 'red'
-            elif cycles_remaining <= 5000:
-                mold['maintenance_status'] = 'due_soon'
-                mold['status_color'] = 'orange'
-            else:
-                mold['maintenance_status'] = 'ok'
-                mold['status_color'] = 'green'
-    
-    return render_template('molds.html', molds=molds, role=session.get('role'))
+        # Filter choices
+        cursor.execute('''
+        SELECT DISTINCT p.id, p.product_name
+        FROM products p
+        JOIN molds m ON m.product_id = p.id
+        ORDER BY p.product_name
+        ''')
+        products = [dict(row) for row in cursor.fetchall()]
+        cursor.execute("SELECT DISTINCT machine_number FROM machine_mold_assignments WHERE status = 'active' ORDER BY machine_number")
+        machines = [row['machine_number'] for row in cursor.fetchall()]
+    
+    return render_template('molds.html',
+                         molds=molds,
+                         products=products,
+                         machines=machines,
+                         status=status,
+                         product_id=product_id,
+                         machine=machine,
+                         role=session.get('role'),
+                         page=page,
+                         total_pages=total_pages,
+                         has_prev=has_prev,
+                         has_next=has_next,
+                         total=total)
 
 @app.route('/mold/<int:mold_id>')
 def mold_detail(mold_id):
@@ -1566,12 +3049,9 @@ def add_rework():
             VALUES (?, ?, ?, ?, ?, ?, ?)
             ''', (mold_id, rework_type, current_date, technician, description, parts_replaced, cost))
             
-            # Reset total cycles to 0 after rework
-            cursor.execute('''
-            UPDATE molds 
-            SET total_cycles = 0
-            WHERE id = ?
-            ''', (mold_id,))
+            # Reset cycles since maintenance after rework (history stays in the ledger)
+            record_mold_cycles(cursor, mold_id, 0, 'rework', event_date=current_date)
+            bump_data_version(cursor, MOLDS_DATA_VERSION)
             
             conn.commit()
             return jsonify({'status': 'success', 'message': 'Ремонтът е записан успешно'})
@@ -1635,12 +3115,14 @@ def complete_maintenance():
             cursor.execute('SELECT mold_id FROM maintenance_schedule WHERE id = ?', (maintenance_id,))
             mold_id = cursor.fetchone()['mold_id']
             
-            # Update mold's last maintenance date and reset total cycles
+            # Update mold's last maintenance date and reset cycles since maintenance
             cursor.execute('''
-            UPDATE molds 
-            SET last_maintenance_date = ?, total_cycles = 0
+            UPDATE molds
+            SET last_maintenance_date = ?
             WHERE id = ?
             ''', (current_date, mold_id))
+            record_mold_cycles(cursor, mold_id, 0, 'maintenance', event_date=current_date)
+            bump_data_version(cursor, MOLDS_DATA_VERSION)
             
             conn.commit()
             return jsonify({'status': 'success', 'message': 'Поддръжката е завършена успешно'})
@@ -1673,6 +3155,7 @@ def update_mold_threshold():
             SET maintenance_threshold = ?
             WHERE id = ?
             ''', (threshold, mold_id))
+            bump_data_version(cursor, MOLDS_DATA_VERSION)
             conn.commit()
             return jsonify({'status': 'success', 'message': 'Прагът за поддръжка е актуализиран успешно'})
         except Exception as e:
@@ -1701,6 +3184,26 @@ def add_mold_problem():
             INSERT INTO mold_problems (mold_id, problem_type, description, inspector, report_date, comments)
             VALUES (?, ?, ?, ?, ?, ?)
             ''', (mold_id, problem_type, description, inspector, current_date, comments))
+            cursor.execute('UPDATE molds SET problem_count = problem_count + 1 WHERE id = ?', (mold_id,))
+            cursor.execute('''
+            SELECT m.mold_name, m.mold_number, p.product_name
+            FROM molds m
+            JOIN products p ON m.product_id = p.id
+            WHERE m.id = ?
+            ''', (mold_id,))
+            mold_info = cursor.fetchone()
+            if mold_info:
+                log_change(cursor, 'mold_problem', {
+                    'id': int(mold_id),
+                    'mold_name': mold_info['mold_name'],
+                    'mold_number': mold_info['mold_number'],
+                    'product_name': mold_info['product_name'],
+                    'problem_type': problem_type,
+                    'description': description,
+                    'inspector': inspector,
+                    'report_date': convert_to_local_date(current_date)
+                })
+            bump_data_version(cursor, MOLDS_DATA_VERSION)
             conn.commit()
             return jsonify({'status': 'success', 'message': 'Проблемът е записан успешно'})
         except Exception as e:
@@ -1741,6 +3244,7 @@ def edit_mold_problem():
             SET problem_type = ?, description = ?, comments = ?
             WHERE id = ?
             ''', (problem_type, description, comments, problem_id))
+            bump_data_version(cursor, MOLDS_DATA_VERSION)
             conn.commit()
             return jsonify({'status': 'success', 'message': 'Проблемът е обновен успешно'})
         except Exception as e:
@@ -1759,7 +3263,7 @@ def delete_mold_problem():
         cursor = conn.cursor()
         
         # Check if user has permission to delete this problem
-        cursor.execute('SELECT inspector FROM mold_problems WHERE id = ?', (problem_id,))
+        cursor.execute('SELECT inspector, mold_id FROM mold_problems WHERE id = ?', (problem_id,))
         problem = cursor.fetchone()
         
         if not problem:
@@ -1771,11 +3275,118 @@ def delete_mold_problem():
         
         try:
             cursor.execute('DELETE FROM mold_problems WHERE id = ?', (problem_id,))
+            cursor.execute('UPDATE molds SET problem_count = MAX(problem_count - 1, 0) WHERE id = ?', (problem['mold_id'],))
+            bump_data_version(cursor, MOLDS_DATA_VERSION)
             conn.commit()
             return jsonify({'status': 'success', 'message': 'Проблемът е изтрит успешно'})
         except Exception as e:
             return jsonify({'status': 'error', 'message': f'Грешка при изтриване на проблема: {e}'})
 
+def build_molds_dashboard_snapshot(conn, page, per_page):
+    """Run the molds dashboard queries and return the template data for one page"""
+    cursor = conn.cursor()
+    
+    # Get total count for pagination
+    cursor.execute("SELECT COUNT(*) FROM molds")
+    total = cursor.fetchone()[0]
+    
+    # Calculate pagination info
+    total_pages = (total + per_page - 1) // per_page
+    has_prev = page > 1
+    has_next = page < total_pages
+    offset = (page - 1) * per_page
+    
+    # Forecasts are computed for all molds at once and reused until stale
+    ensure_mold_forecasts(conn)
+    
+    # Get molds with pagination (problem_count is kept up to date on write)
+    cursor.execute('''
+    SELECT m.id, m.mold_name, m.mold_number, m.total_cycles, m.maintenance_threshold, 
+           m.last_maintenance_date, m.status, m.created_date, m.specifications_pdf, p.product_name,
+           f.days_until_due, f.forecast_date, m.problem_count, m.maintenance_status
+    FROM molds m
+    JOIN products p ON m.product_id = p.id
+    LEFT JOIN mold_forecasts f ON f.mold_id = m.id
+    ORDER BY m.created_date DESC
+    LIMIT ? OFFSET ?
+    ''', (per_page, offset))
+    molds = [dict(row) for row in cursor.fetchall()]
+    
+    for mold in molds:
+        if mold['forecast_date']:
+            mold['forecast_date'] = convert_to_local_date(mold['forecast_date'])
+    
+    # Get current machine-mold assignments
+    cursor.execute('''
+    SELECT mma.machine_number, m.mold_name, m.mold_number, m.id as mold_id, p.product_name, 
+           mma.assigned_date, mma.assigned_by, mma.status
+    FROM machine_mold_assignments mma
+    JOIN molds m ON mma.mold_id = m.id
+    JOIN products p ON m.product_id = p.id
+    WHERE mma.status = 'active'
+    ORDER BY mma.assigned_date DESC
+    ''')
+    machine_assignments = [dict(row) for row in cursor.fetchall()]
+    
+    # Convert assignment dates to local format
+    for assignment in machine_assignments:
+        assignment['assigned_date'] = convert_to_local_date(assignment['assigned_date'])
+    
+    # Get recent machine activity from measurements
+    cursor.execute('''
+    SELECT mlp.machine_number, p.product_name, m.mold_name, m.mold_number, 
+           mlp.last_update, mlp.last_count
+    FROM machine_last_product mlp
+    JOIN products p ON mlp.last_product_id = p.id
+    LEFT JOIN molds m ON p.id = m.product_id
+    WHERE mlp.last_update IS NOT NULL
+    ORDER BY mlp.last_update DESC
+    LIMIT 10
+    ''')
+    recent_activity = [dict(row) for row in cursor.fetchall()]
+    
+    # Convert activity dates to local format
+    for activity in recent_activity:
+        if activity['last_update']:
+            activity['last_update'] = convert_to_local_date(activity['last_update'])
+    
+    # Get molds with recently added problems (max 5)
+    cursor.execute('''
+    SELECT m.id, m.mold_name, m.mold_number, p.product_name,
+           mp.problem_type, mp.report_date, mp.inspector,
+           mp.description
+    FROM molds m
+    JOIN products p ON m.product_id = p.id
+    JOIN mold_problems mp ON m.id = mp.mold_id
+    ORDER BY mp.report_date DESC
+    LIMIT 5
+    ''')
+    recent_problems = [dict(row) for row in cursor.fetchall()]
+    
+    # Convert problem dates to local format
+    for problem in recent_problems:
+        problem['report_date'] = convert_to_local_date(problem['report_date'])
+    
+    return {
+        'molds': molds,
+        'machine_assignments': machine_assignments,
+        'recent_activity': recent_activity,
+        'recent_problems': recent_problems,
+        'page': page,
+        'total_pages': total_pages,
+        'has_prev': has_prev,
+        'has_next': has_next,
+        'total': total
+    }
+
+# Per-worker cache of molds dashboard pages, valid while the 'molds' data
+# version is unchanged and the embedded forecasts are not stale. Shared by the
+# worker's threads (gthread), so it is only touched under its lock; at most
+# MOLDS_DASHBOARD_CACHED_PAGES pages are kept, the oldest is dropped first.
+MOLDS_DASHBOARD_CACHED_PAGES = 20
+_molds_dashboard_cache = {'version': None, 'built_at': None, 'pages': {}}
+_molds_dashboard_cache_lock = threading.Lock()
+
 @app.route('/molds_dashboard')
 def molds_dashboard():
     # Get pagination parameters only (keep existing filter system)
@@ -1784,94 +3395,28 @@ def molds_dashboard():
     
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        
-        # Get total count for pagination
-        cursor.execute("SELECT COUNT(DISTINCT m.id) FROM molds m")
-        total = cursor.fetchone()[0]
-        
-        # Calculate pagination info
-        total_pages = (total + per_page - 1) // per_page
-        has_prev = page > 1
-        has_next = page < total_pages
-        offset = (page - 1) * per_page
-        
-        # Get molds with pagination
-        cursor.execute('''
-        SELECT m.id, m.mold_name, m.mold_number, m.total_cycles, m.maintenance_threshold, 
-               m.last_maintenance_date, m.status, m.created_date, m.specifications_pdf, p.product_name,
-               COUNT(mp.id) as problem_count
-        FROM molds m
-        JOIN products p ON m.product_id = p.id
-        LEFT JOIN mold_problems mp ON m.id = mp.mold_id
-        GROUP BY m.id, m.mold_name, m.mold_number, m.total_cycles, m.maintenance_threshold, 
-                 m.last_maintenance_date, m.status, m.created_date, m.specifications_pdf, p.product_name
-        ORDER BY m.created_date DESC
-        LIMIT ? OFFSET ?
-        ''', (per_page, offset))
-        molds = [dict(row) for row in cursor.fetchall()]
-        
-        # Get current machine-mold assignments
-        cursor.execute('''
-        SELECT mma.machine_number, m.mold_name, m.mold_number, m.id as mold_id, p.product_name, 
-               mma.assigned_date, mma.assigned_by, mma.status
-        FROM machine_mold_assignments mma
-        JOIN molds m ON mma.mold_id = m.id
-        JOIN products p ON m.product_id = p.id
-        WHERE mma.status = 'active'
-        ORDER BY mma.assigned_date DESC
-        ''')
-        machine_assignments = [dict(row) for row in cursor.fetchall()]
-        
-        # Convert assignment dates to local format
-        for assignment in machine_assignments:
-            assignment['assigned_date'] = convert_to_local_date(assignment['assigned_date'])
-        
-        # Get recent machine activity from measurements
-        cursor.execute('''
-        SELECT mlp.machine_number, p.product_name, m.mold_name, m.mold_number, 
-               mlp.last_update, mlp.last_count
-        FROM machine_last_product mlp
-        JOIN products p ON mlp.last_product_id = p.id
-        LEFT JOIN molds m ON p.id = m.product_id
-        WHERE mlp.last_update IS NOT NULL
-        ORDER BY mlp.last_update DESC
-        LIMIT 10
-        ''')
-        recent_activity = [dict(row) for row in cursor.fetchall()]
-        
-        # Convert activity dates to local format
-        for activity in recent_activity:
-            if activity['last_update']:
-                activity['last_update'] = convert_to_local_date(activity['last_update'])
-        
-        # Get molds with recently added problems (max 5)
-        cursor.execute('''
-        SELECT m.id, m.mold_name, m.mold_number, p.product_name,
-               mp.problem_type, mp.report_date, mp.inspector,
-               mp.description
-        FROM molds m
-        JOIN products p ON m.product_id = p.id
-        JOIN mold_problems mp ON m.id = mp.mold_id
-        ORDER BY mp.report_date DESC
-        LIMIT 5
-        ''')
-        recent_problems = [dict(row) for row in cursor.fetchall()]
-        
-        # Convert problem dates to local format
-        for problem in recent_problems:
-            problem['report_date'] = convert_to_local_date(problem['report_date'])
-        
-    return render_template('molds_dashboard.html', 
-                         molds=molds, 
-                         machine_assignments=machine_assignments,
-                         recent_activity=recent_activity,
-                         recent_problems=recent_problems,
-                         role=session.get('role'),
-                         page=page,
-                         total_pages=total_pages,
-                         has_prev=has_prev,
-                         has_next=has_next,
-                         total=total)
+        version = get_data_version(cursor, MOLDS_DATA_VERSION)
+        # Only existing pages are cached: out-of-range numbers show the nearest one
+        cursor.execute("SELECT COUNT(*) FROM molds")
+        total_pages = (cursor.fetchone()[0] + per_page - 1) // per_page
+        page = min(max(page, 1), max(total_pages, 1))
+        with _molds_dashboard_cache_lock:
+            built_at = _molds_dashboard_cache['built_at']
+            if (_molds_dashboard_cache['version'] != version or built_at is None
+                    or time.monotonic() - built_at > FORECAST_MAX_AGE.total_seconds()):
+                _molds_dashboard_cache.update({'version': version, 'built_at': time.monotonic(), 'pages': {}})
+            snapshot = _molds_dashboard_cache['pages'].get(page)
+        
+        if snapshot is None:
+            snapshot = build_molds_dashboard_snapshot(conn, page, per_page)
+            with _molds_dashboard_cache_lock:
+                pages = _molds_dashboard_cache['pages']
+                if _molds_dashboard_cache['version'] == version:
+                    pages[page] = snapshot
+                    while len(pages) > MOLDS_DASHBOARD_CACHED_PAGES:
+                        del pages[next(iter(pages))]
+        
+    return render_template('molds_dashboard.html', role=session.get('role'), **snapshot)
 
 @app.route('/get_mold_problems/<int:mold_id>')
 def get_mold_problems(mold_id):
@@ -1908,6 +3453,71 @@ def get_mold_problems(mold_id):
             'problems': problems
         })
 
+@app.route('/mold_forecasts')
+def mold_forecasts():
+    limit = request.args.get('limit', 100, type=int)
+    
+    with get_db_connection() as conn:
+        if request.args.get('refresh') and session.get('role') == 'admin':
+            refresh_mold_forecasts(conn)
+        else:
+            ensure_mold_forecasts(conn)
+        cursor = conn.cursor()
+        # Soonest due first; molds with no recent production (no due date) last
+        cursor.execute('''
+        SELECT f.mold_id, m.mold_name, m.mold_number, p.product_name, m.total_cycles, m.maintenance_threshold,
+               f.cycles_per_day, f.cycles_remaining, f.days_until_due, f.forecast_date, f.computed_at
+        FROM mold_forecasts f
+        JOIN molds m ON f.mold_id = m.id
+        JOIN products p ON m.product_id = p.id
+        ORDER BY f.days_until_due IS NULL, f.days_until_due, m.mold_name
+        LIMIT ?
+        ''', (limit,))
+        forecasts = [dict(row) for row in cursor.fetchall()]
+    
+    for forecast in forecasts:
+        forecast['cycles_per_day'] = round(forecast['cycles_per_day'], 1)
+        if forecast['forecast_date']:
+            forecast['forecast_date'] = convert_to_local_date(forecast['forecast_date'])
+    
+    return jsonify({'status': 'success', 'forecasts': forecasts})
+
+@app.route('/get_mold_cycles/<int:mold_id>')
+def get_mold_cycles(mold_id):
+    weeks = request.args.get('weeks', 12, type=int)
+    since_date = (get_bulgarian_time() - timedelta(weeks=max(weeks, 1))).strftime('%Y-%m-%d')
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT id FROM molds WHERE id = ?', (mold_id,))
+        if not cursor.fetchone():
+            return jsonify({'status': 'error', 'message': 'Матрицата не е намерена'})
+
+        totals = get_mold_cycle_totals(cursor, mold_id)
+        last_reset = get_last_maintenance_event(cursor, mold_id)
+
+        # Cycles per machine per week for this mold, narrowed through the mold_id index
+        cursor.execute('''
+        SELECT strftime('%Y-%W', event_date) AS week, machine_number, SUM(delta) AS cycles
+        FROM mold_cycle_events
+        WHERE mold_id = ? AND source = 'measurement' AND event_date >= ?
+        GROUP BY week, machine_number
+        ORDER BY week DESC, machine_number
+        ''', (mold_id, since_date))
+        weekly_cycles = [dict(row) for row in cursor.fetchall()]
+
+    return jsonify({
+        'status': 'success',
+        'lifetime_cycles': totals['lifetime_cycles'],
+        'cycles_since_maintenance': totals['cycles_since_maintenance'],
+        'last_maintenance': {
+            'source': last_reset['source'],
+            'date': convert_to_local_date(last_reset['event_date'])
+        } if last_reset else None,
+        'weekly_cycles': weekly_cycles
+    })
+
 @app.route('/upload_mold_specifications', methods=['POST'])
 def upload_mold_specifications():
     if not session.get('user'):
@@ -1944,6 +3554,7 @@ def upload_mold_specifications():
         try:
             cursor.execute('UPDATE molds SET specifications_pdf = ? WHERE id = ?', 
                          (f'static/drawings/{unique_filename}', mold_id))
+            bump_data_version(cursor, MOLDS_DATA_VERSION)
             conn.commit()
             return jsonify({'status': 'success', 'message': 'Спецификациите са качени успешно'})
         except Exception as e:
@@ -1982,6 +3593,7 @@ def delete_mold_specifications():
             
             # Update database
             cursor.execute('UPDATE molds SET specifications_pdf = NULL WHERE id = ?', (mold_id,))
+            bump_data_version(cursor, MOLDS_DATA_VERSION)
             conn.commit()
             
             return jsonify({'status': 'success', 'message': 'Спецификациите са изтрити успешно'})
@@ -2046,6 +3658,26 @@ def complete_rework():
         conn.commit()
     return jsonify({'status': 'success', 'message': 'Ремонтът е отбелязан като завършен'})
 
+def warm_up():
+    """Compile every template and prime process-wide lookup tables before serving.
+
+    gunicorn calls this in the master (preloaded app, inherited by every fork)
+    and again after each fork, where only what is not loaded yet is compiled.
+    Returns (templates compiled, seconds).
+    """
+    started = time.perf_counter()
+    compiled = 0
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        try:
+            app.jinja_env.get_template(name)
+            compiled += 1
+        except TemplateError as e:
+            logger.warning(f"Template {name} failed to compile during warm-up: {e}")
+    # strptime builds its locale regexes and mimetypes reads the system type map on first use
+    datetime.strptime('2000-01-01 00:00:00', '%Y-%m-%d %H:%M:%S')
+    mimetypes.init()
+    return compiled, time.perf_counter() - started
+
 if __name__ == '__main__':
     init_db()
     host = os.environ.get('FLASK_HOST', '127.0.0.1')
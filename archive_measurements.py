@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Move measurements older than the archive horizon into per-year archive databases.
+
+    python archive_measurements.py                    # horizon from ARCHIVE_HORIZON_DAYS (365)
+    python archive_measurements.py --horizon-days 730 --batch-size 20000
+    python archive_measurements.py --dry-run
+
+Submissions (headers and their values) go to <ARCHIVE_DIR>/measurements_<year>.db,
+keeping their ids. Each batch is first committed to the archive (INSERT OR
+IGNORE) and only then deleted from the hot database, in short transactions, so measurement entry
+is never blocked for long. If the job is interrupted between the two steps,
+the next run finishes the move. Reports attach only the archive years their
+date range touches (see measurement_source in app.py).
+
+Meant to run periodically, e.g. nightly from cron.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import timedelta
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app import (ARCHIVE_DIR, ARCHIVE_HORIZON_DAYS, MEASUREMENT_TABLES, get_bulgarian_time, get_db_connection,
+                 init_db, local_epoch, measurement_archive_path)
+
+BATCH_SIZE = 2000  # submissions, ~10k measurements
+
+
+def ensure_archive_schema(archive_path):
+    """Create the archive's submission and value tables (init_db converts older archives)."""
+    archive = sqlite3.connect(archive_path)
+    try:
+        archive.execute("PRAGMA journal_mode=WAL")
+        for statement in MEASUREMENT_TABLES:
+            archive.execute(statement.format(schema='main'))
+        archive.commit()
+    finally:
+        archive.close()
+
+
+def archive_year(conn, year, cutoff, batch_size):
+    """Move one year's submissions older than cutoff; returns the number of values moved."""
+    path = measurement_archive_path(year)
+    ensure_archive_schema(path)
+    start = local_epoch(f"{year}-01-01")
+    end = min(local_epoch(f"{year + 1}-01-01"), local_epoch(cutoff))
+    in_range = "id <= ? AND measured_at >= ? AND measured_at < ?"
+    conn.isolation_level = None  # Explicit transaction control below
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    moved = 0
+    try:
+        while True:
+            row = conn.execute(
+                "SELECT MAX(id) FROM (SELECT id FROM main.measurement_submissions WHERE measured_at >= ? AND measured_at < ? ORDER BY id LIMIT ?)",
+                (start, end, batch_size)
+            ).fetchone()
+            if row[0] is None:
+                break
+            params = (row[0], start, end)
+            # 1. Copy headers and values into the archive and commit there first
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR IGNORE INTO archive.measurement_values (submission_id, dimension_id, measured_value) "
+                "SELECT v.submission_id, v.dimension_id, v.measured_value FROM main.measurement_values v "
+                f"WHERE v.submission_id IN (SELECT id FROM main.measurement_submissions WHERE {in_range})",
+                params
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO archive.measurement_submissions "
+                f"SELECT * FROM main.measurement_submissions WHERE {in_range}",
+                params
+            )
+            conn.execute("COMMIT")
+            # 2. Delete from the hot tables only what the archive now holds
+            archived = f"{in_range} AND EXISTS (SELECT 1 FROM archive.measurement_submissions a WHERE a.id = main.measurement_submissions.id)"
+            conn.execute("BEGIN IMMEDIATE")
+            deleted = conn.execute(
+                f"DELETE FROM main.measurement_values WHERE submission_id IN (SELECT id FROM main.measurement_submissions WHERE {archived})",
+                params
+            ).rowcount
+            conn.execute(f"DELETE FROM main.measurement_submissions WHERE {archived}", params)
+            conn.execute("COMMIT")
+            moved += deleted
+            print(f"  {year}: {moved:,} measurements", end='\r', flush=True)
+    finally:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        conn.execute("DETACH DATABASE archive")
+    print(f"  {year}: {moved:,} measurements moved to {path}")
+    return moved
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Archive old measurements into per-year databases.")
+    parser.add_argument("--horizon-days", type=int, default=ARCHIVE_HORIZON_DAYS,
+                        help="Measurements older than this many days are archived.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Submissions moved per transaction.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be moved.")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="VACUUM the hot database afterwards to shrink the file (blocks writers while it runs).")
+    args = parser.parse_args()
+
+    init_db()
+    cutoff = (get_bulgarian_time() - timedelta(days=args.horizon_days)).strftime('%Y-%m-%d')
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    conn = get_db_connection()
+    try:
+        years = conn.execute(
+            "SELECT strftime('%Y', measured_at, 'unixepoch') AS year, COUNT(*) FROM measurement_submissions "
+            "WHERE measured_at < ? GROUP BY year ORDER BY year",
+            (local_epoch(cutoff),)
+        ).fetchall()
+        if not years:
+            print(f"Nothing older than {cutoff} to archive.")
+            return
+        for year, count in years:
+            print(f"{year}: {count:,} submissions older than {cutoff}")
+        if args.dry_run:
+            return
+        total = sum(archive_year(conn, int(year), cutoff, args.batch_size) for year, _ in years)
+        print(f"Archived {total:,} measurements into {ARCHIVE_DIR}/")
+        if args.vacuum:
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Online backups of the SQLite database with the SQLite backup API.
+
+Safe to run while the app is writing. The copy is taken page by page from one
+consistent snapshot (in WAL mode the source keeps a read transaction open, so
+writers are never blocked and the backup never restarts). The loop pauses
+between steps to leave I/O for the app. Every copy is checked with
+PRAGMA integrity_check before it replaces the '.partial' name. Only the newest
+--keep backups are kept.
+
+    python backup_db.py                           # one backup into backups/ (cron)
+    python backup_db.py --interval 3600 --keep 48 # hourly, as a long-running process
+    python backup_db.py --output path/to/copy.db  # single copy to an exact path, no rotation
+
+    python backup_db.py --replica reports.db --interval 60  # read-only reporting replica
+
+gunicorn.conf.py starts the scheduled mode when BACKUP_INTERVAL is set, and the
+replica refresher when REPORT_REPLICA_PATH is set.
+"""
+
+import argparse
+import glob
+import logging
+import os
+import signal
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+logger = logging.getLogger("backup_db")
+
+DATABASE_PATH = os.environ.get("DATABASE_PATH", "quality_control.db")
+BACKUP_DIR = os.environ.get("BACKUP_DIR", "backups")
+# Pages copied per backup step (4 KB pages: 1024 pages = 4 MB per step)
+PAGES_PER_STEP = 1024
+# Pause between steps so the copy does not monopolise the disk
+STEP_PAUSE = 0.01  # seconds
+# Without WAL the snapshot cannot be held open; give up after this many restarts
+MAX_RESTARTS = 20
+
+
+class BackupError(Exception):
+    pass
+
+
+def backup_database(source_path, destination_path, pages=PAGES_PER_STEP, pause=STEP_PAUSE, quick_check=False):
+    """Copy source_path to destination_path online and verify the copy.
+
+    Returns a dict with the page count, duration and restart count.
+    Raises BackupError if the copy fails verification.
+    """
+    if os.path.exists(destination_path):
+        os.remove(destination_path)
+    source = sqlite3.connect(source_path, timeout=30, isolation_level=None)
+    destination = sqlite3.connect(destination_path)
+    started = time.monotonic()
+    restarts = 0
+    try:
+        wal = source.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+        if wal:
+            # Pin one snapshot for the whole copy; WAL readers never block writers
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+        last_remaining = None
+
+        def progress(status, remaining, total):
+            nonlocal last_remaining, restarts
+            # remaining jumps back up when a concurrent write restarted the copy
+            if last_remaining is not None and remaining > last_remaining:
+                restarts += 1
+                if restarts > MAX_RESTARTS:
+                    raise BackupError(f"backup restarted {restarts} times; the database is too busy without WAL")
+            last_remaining = remaining
+            if remaining and pause:
+                time.sleep(pause)
+
+        source.backup(destination, pages=pages, progress=progress)
+        if wal:
+            source.execute("COMMIT")
+        total_pages = destination.execute("PRAGMA page_count").fetchone()[0]
+
+        check = "quick_check" if quick_check else "integrity_check"
+        result = [row[0] for row in destination.execute(f"PRAGMA {check}").fetchall()]
+        if result != ["ok"]:
+            raise BackupError(f"{check} failed: {'; '.join(result[:5])}")
+    finally:
+        destination.close()
+        source.close()
+    return {"pages": total_pages, "seconds": round(time.monotonic() - started, 2), "restarts": restarts}
+
+
+def rotate_backups(backup_dir, stem, keep):
+    """Delete all but the newest `keep` verified backups."""
+    backups = sorted(glob.glob(os.path.join(backup_dir, f"{stem}_*.db")))
+    for path in backups[:-keep] if keep > 0 else []:
+        os.remove(path)
+        logger.info(f"Removed old backup {path}")
+
+
+def run_backup(source_path, backup_dir, keep, quick_check=False):
+    os.makedirs(backup_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    final_path = os.path.join(backup_dir, f"{stem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db")
+    partial_path = final_path + ".partial"
+    try:
+        stats = backup_database(source_path, partial_path, quick_check=quick_check)
+    except Exception:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    os.replace(partial_path, final_path)
+    logger.info(f"Backup {final_path}: {stats['pages']} pages in {stats['seconds']}s ({stats['restarts']} restarts)")
+    rotate_backups(backup_dir, stem, keep)
+    return final_path
+
+
+def refresh_replica(source_path, replica_path):
+    """Replace replica_path with a fresh snapshot of source_path.
+
+    The copy is switched to rollback-journal mode (so read-only connections
+    need no -wal/-shm files), stamped with its snapshot time (plant time) in replica_info
+    and renamed over the old replica; readers still open on the old file
+    finish on it undisturbed.
+    """
+    # Stamped in plant time, like every other time the app shows; imported
+    # here so plain backups keep running without the app's dependencies
+    from app import get_bulgarian_time_string
+
+    partial_path = replica_path + ".partial"
+    snapshot_at = get_bulgarian_time_string()
+    try:
+        stats = backup_database(source_path, partial_path, quick_check=True)
+        replica = sqlite3.connect(partial_path)
+        try:
+            replica.execute("PRAGMA journal_mode=DELETE")
+            replica.execute("CREATE TABLE IF NOT EXISTS replica_info (snapshot_at TEXT NOT NULL)")
+            replica.execute("DELETE FROM replica_info")
+            replica.execute("INSERT INTO replica_info (snapshot_at) VALUES (?)", (snapshot_at,))
+            replica.commit()
+        finally:
+            replica.close()
+    except Exception:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    os.replace(partial_path, replica_path)
+    logger.info(f"Replica {replica_path} as of {snapshot_at}: {stats['pages']} pages in {stats['seconds']}s")
+    return snapshot_at
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Online, verified backups of the SQLite database.")
+    parser.add_argument("--database", default=DATABASE_PATH, help="Database to back up.")
+    parser.add_argument("--backup-dir", default=BACKUP_DIR, help="Directory for rotated backups.")
+    parser.add_argument("--keep", type=int, default=int(os.environ.get("BACKUP_KEEP", 14)),
+                        help="Number of backups to keep.")
+    parser.add_argument("--interval", type=int, default=0,
+                        help="Seconds between backups; 0 takes one backup and exits.")
+    parser.add_argument("--output", help="Write a single verified copy to this exact path (no rotation).")
+    parser.add_argument("--quick-check", action="store_true",
+                        help="Verify with PRAGMA quick_check instead of the full integrity_check.")
+    parser.add_argument("--replica", help="Refresh this read-only reporting replica instead of taking backups.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    if not os.path.exists(args.database):
+        sys.exit(f"Database not found: {args.database}")
+
+    if args.replica:
+        if args.interval:
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            # A child of the gunicorn master: ignore the SIGUSR2 meant for the workers' memory reports
+            signal.signal(signal.SIGUSR2, signal.SIG_IGN)
+            logger.info(f"Refreshing replica {args.replica} from {args.database} every {args.interval}s")
+        while True:
+            try:
+                refresh_replica(args.database, args.replica)
+            except (BackupError, sqlite3.Error, OSError) as e:
+                if not args.interval:
+                    sys.exit(f"Replica refresh failed: {e}")
+                logger.error(f"Replica refresh failed: {e}")
+            if not args.interval:
+                return
+            time.sleep(args.interval)
+
+    if args.output:
+        try:
+            stats = backup_database(args.database, args.output, quick_check=args.quick_check)
+        except (BackupError, sqlite3.Error) as e:
+            sys.exit(f"Backup failed: {e}")
+        print(f"Database backed up to: {args.output} ({stats['pages']} pages, {stats['seconds']}s)")
+        return
+
+    if not args.interval:
+        try:
+            print(f"Database backed up to: {run_backup(args.database, args.backup_dir, args.keep, args.quick_check)}")
+        except (BackupError, sqlite3.Error) as e:
+            sys.exit(f"Backup failed: {e}")
+        return
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # A child of the gunicorn master: ignore the SIGUSR2 meant for the workers' memory reports
+    signal.signal(signal.SIGUSR2, signal.SIG_IGN)
+    logger.info(f"Backing up {args.database} every {args.interval}s into {args.backup_dir} (keeping {args.keep})")
+    while True:
+        try:
+            run_backup(args.database, args.backup_dir, args.keep, args.quick_check)
+        except (BackupError, sqlite3.Error, OSError) as e:
+            logger.error(f"Backup failed: {e}")
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Reproducible benchmark suite for the heaviest routes, run through the Flask test client.
+
+Build a database with generate_data.py first, then:
+    python benchmark.py --database bench_10k.db --output results.json
+    python benchmark.py --database bench_10k.db --save-baseline baseline_10k.json
+    python benchmark.py --database bench_10k.db --baseline baseline_10k.json
+
+The database is copied (SQLite backup API) to a temporary file before the run,
+so measurement posts never change the source. Each case runs once to warm up,
+then --repeat timed runs, then once more under tracemalloc for peak memory.
+With --baseline, any case whose median is more than --tolerance slower than the
+baseline is reported and the exit status is 1.
+
+Memory mode repeats the report and export cases instead and samples RSS and
+tracemalloc along the way. Traced growth beyond --memory-limit KB per 100
+requests (after warm-up) is reported as a leak and the exit status is 1; RSS
+growth is shown alongside, as allocator noise makes it unreliable over short
+runs:
+    python benchmark.py --database bench_10k.db --memory 500
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the main routes against a generated database.")
+    parser.add_argument("--database", required=True, help="Database built by generate_data.py (left unchanged).")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", help="Compare against a results file saved earlier.")
+    parser.add_argument("--save-baseline", help="Write the results to this file for later comparisons.")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown of the median before a case counts as a regression (0.25 = 25%%).")
+    parser.add_argument("--cases", help="Comma-separated subset of case names to run.")
+    parser.add_argument("--memory", type=int, default=0, metavar="N",
+                        help="Memory mode: run each case N times and report memory growth "
+                             "(default cases: reports_30d, export_excel_30d).")
+    parser.add_argument("--memory-limit", type=float, default=512,
+                        help="Allowed growth in KB per 100 requests in memory mode.")
+    return parser.parse_args()
+
+
+def copy_database(source, destination):
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(destination)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def build_cases(qc_app, client):
+    """Return {name: (run(iteration) -> response, before(iteration) or None)}."""
+    with qc_app.get_db_connection() as conn:
+        cursor = conn.cursor()
+        # The busiest product gives the worst-case report and export
+        cursor.execute("SELECT product_id FROM measurement_submissions GROUP BY product_id ORDER BY COUNT(*) DESC LIMIT 1")
+        busiest = cursor.fetchone()
+        if busiest is None:
+            sys.exit("The database has no measurements; build one with generate_data.py first.")
+        product_id = busiest['product_id']
+        cursor.execute("SELECT datetime(MAX(measured_at), 'unixepoch') FROM measurement_submissions")
+        last_date = datetime.strptime(cursor.fetchone()[0][:10], "%Y-%m-%d")
+        cursor.execute("SELECT id FROM dimensions WHERE product_id = ?", (product_id,))
+        dimension_ids = [row['id'] for row in cursor.fetchall()]
+        cursor.execute("SELECT product_name FROM products WHERE id = ?", (product_id,))
+        search_term = cursor.fetchone()['product_name'][:9]
+    conn.close()
+
+    report_form = {
+        'product_id': product_id,
+        'start_date': (last_date - timedelta(days=30)).strftime('%d-%m-%Y'),
+        'end_date': last_date.strftime('%d-%m-%Y'),
+        'report_type': 'detailed',
+    }
+
+    def post_measurement(iteration):
+        form = {
+            'product_id': product_id,
+            # A fresh machine per run, so duplicate prevention never kicks in
+            'machine_number': f'BENCH-{iteration}-{time.time_ns()}',
+            'count': 500,
+            'measurement_date': datetime.now().strftime('%d-%m-%Y'),
+            'shift': '1',
+        }
+        for dimension_id in dimension_ids:
+            form[f'measured_value_{dimension_id}'] = '10.0'
+        return client.post('/measurements', data=form)
+
+    def clear_dashboard_cache(iteration):
+        # Forces a rebuild exactly like a molds data version change would
+        qc_app._molds_dashboard_cache['built_at'] = None
+
+    return {
+        'measurements_post': (post_measurement, None),
+        'get_dimensions': (lambda i: client.get(f'/get_dimensions/{product_id}'), None),
+        'products_search': (lambda i: client.get('/products', query_string={'search': search_term}), None),
+        'reports_30d': (lambda i: client.post('/reports', data=report_form), None),
+        'export_excel_30d': (lambda i: client.post('/export_excel', data=report_form), None),
+        'molds_dashboard_cold': (lambda i: client.get('/molds_dashboard'), clear_dashboard_cache),
+        'molds_dashboard_warm': (lambda i: client.get('/molds_dashboard'), None),
+        'molds_list': (lambda i: client.get('/molds'), None),
+    }
+
+
+def run_case(run, before, repeat):
+    def call(iteration):
+        if before:
+            before(iteration)
+        start = time.perf_counter()
+        response = run(iteration)
+        elapsed = time.perf_counter() - start
+        response.close()
+        if response.status_code >= 400:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        return elapsed
+
+    call(0)  # warm-up
+    timings = [call(iteration) for iteration in range(1, repeat + 1)]
+
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        call(repeat + 1)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    timings_ms = [t * 1000 for t in timings]
+    return {
+        'median_ms': round(statistics.median(timings_ms), 3),
+        'p95_ms': round(percentile(timings_ms, 0.95), 3),
+        'min_ms': round(min(timings_ms), 3),
+        'max_ms': round(max(timings_ms), 3),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run_memory_case(run, before, iterations):
+    """Repeat a case, sampling RSS and traced memory; returns growth per 100 requests."""
+    from memory_profile import IGNORED_FILES, current_rss
+
+    def snapshot():
+        ignored = IGNORED_FILES + (os.path.abspath(__file__), sys.modules['memory_profile'].__file__)
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, name) for name in ignored])
+
+    def call(iteration):
+        if before:
+            before(iteration)
+        response = run(iteration)
+        response.close()
+        if response.status_code >= 400:
+            raise RuntimeError(f"HTTP {response.status_code}")
+
+    for iteration in range(3):  # warm-up: templates, lazy imports, first-use caches
+        call(iteration)
+    gc.collect()
+    tracemalloc.start(1)  # Sites are compared by line; deeper tracebacks only slow the run
+    try:
+        first_snapshot = snapshot()
+        step = max(1, iterations // 10)
+        samples = []
+        for iteration in range(1, iterations + 1):
+            call(iteration)
+            if iteration % step == 0 or iteration == iterations:
+                gc.collect()
+                samples.append((iteration, current_rss() or 0, tracemalloc.get_traced_memory()[0]))
+        last_snapshot = snapshot()
+    finally:
+        tracemalloc.stop()
+
+    # Growth between the first and last sample, so one-off allocations do not count
+    (first_i, first_rss, first_traced), (last_i, last_rss, last_traced) = samples[0], samples[-1]
+    span = max(1, last_i - first_i)
+    growth_sites = [stat for stat in last_snapshot.compare_to(first_snapshot, 'lineno') if stat.size_diff > 0][:10]
+    return {
+        'iterations': iterations,
+        'rss_start_kb': round(first_rss / 1024, 1),
+        'rss_end_kb': round(last_rss / 1024, 1),
+        'rss_growth_kb_per_100': round((last_rss - first_rss) / 1024 / span * 100, 1),
+        'traced_growth_kb_per_100': round((last_traced - first_traced) / 1024 / span * 100, 1),
+        'top_growth': [
+            {'site': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+             'size_diff_kb': round(stat.size_diff / 1024, 1), 'count_diff': stat.count_diff}
+            for stat in growth_sites
+        ],
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print(f"\n{'case':<24}{'baseline ms':>14}{'median ms':>12}{'change':>10}")
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before or 'median_ms' not in before or 'median_ms' not in result:
+            print(f"{name:<24}{'-':>14}{result.get('median_ms', '-'):>12}")
+            continue
+        change = result['median_ms'] / before['median_ms'] - 1 if before['median_ms'] else 0
+        flag = ''
+        if change > tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<24}{before['median_ms']:>14.2f}{result['median_ms']:>12.2f}{change:>+10.0%}{flag}")
+    return regressions
+
+
+def main() -> None:
+    args = parse_args()
+    if not os.path.exists(args.database):
+        sys.exit(f"{args.database} does not exist.")
+
+    workdir = tempfile.mkdtemp(prefix='qc_benchmark_')
+    database = os.path.join(workdir, 'quality_control.db')
+    copy_database(args.database, database)
+
+    # Configure the app before importing it: direct writes, no slow-query log
+    os.environ['DATABASE_PATH'] = database
+    os.environ['MEASUREMENT_WRITER_SOCKET'] = ''
+    os.environ['SLOW_QUERY_MS'] = '0'
+    os.environ['METRICS_DIR'] = os.path.join(workdir, 'metrics')
+    # Measure the routes themselves, not report cache hits
+    os.environ.setdefault('REPORT_CACHE_MAX_MB', '0')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as qc_app
+    logging.getLogger().setLevel(logging.WARNING)
+    qc_app.init_db()
+
+    client = qc_app.app.test_client()
+    login = client.post('/login', data={'username': 'admin', 'password': os.environ.get('ADMIN_PASSWORD', 'admin123')})
+    if login.status_code != 302:
+        sys.exit("Could not log in as admin (set ADMIN_PASSWORD if it differs from the default).")
+
+    cases = build_cases(qc_app, client)
+    default_cases = ['reports_30d', 'export_excel_30d'] if args.memory else list(cases)
+    selected = args.cases.split(',') if args.cases else default_cases
+
+    with qc_app.get_db_connection() as conn:
+        measurement_count = conn.execute("SELECT COUNT(*) FROM measurement_values").fetchone()[0]
+    conn.close()
+
+    results = {}
+    leaks = []
+    for name in selected:
+        run, before = cases[name]
+        try:
+            if args.memory:
+                results[name] = run_memory_case(run, before, args.memory)
+            else:
+                results[name] = run_case(run, before, args.repeat)
+        except Exception as e:
+            results[name] = {'error': str(e)}
+        result = results[name]
+        if 'error' in result:
+            summary = result['error']
+        elif args.memory:
+            if result['traced_growth_kb_per_100'] > args.memory_limit:
+                leaks.append(name)
+            summary = (f"RSS {result['rss_start_kb']:.0f} -> {result['rss_end_kb']:.0f} KB, "
+                       f"growth per 100 requests: RSS {result['rss_growth_kb_per_100']:+.1f} KB, "
+                       f"traced {result['traced_growth_kb_per_100']:+.1f} KB")
+        else:
+            summary = f"median {result['median_ms']:.2f} ms, p95 {result['p95_ms']:.2f} ms, peak {result['peak_memory_kb']:.0f} KB"
+        print(f"{name:<24}{summary}")
+        if args.memory and 'top_growth' in result:
+            for site in result['top_growth'][:5]:
+                print(f"{'':<24}  {site['size_diff_kb']:+9.1f} KB  {site['site']}")
+
+    report = {
+        'meta': {
+            'database': os.path.abspath(args.database),
+            'measurements': measurement_count,
+            'repeat': args.memory or args.repeat,
+            'mode': 'memory' if args.memory else 'timing',
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(),
+            'run_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'results': results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    exit_code = 1 if any('error' in result for result in results.values()) else 0
+    if leaks:
+        print(f"\nMemory growth beyond {args.memory_limit:.0f} KB per 100 requests: {', '.join(leaks)}")
+        exit_code = 1
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\nRegressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            exit_code = 1
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
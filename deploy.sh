@@ -153,23 +153,9 @@ cat > backup.sh << 'EOF'
 #!/bin/bash
 # Backup script for Quality Control Application
 
-BACKUP_DIR="backups"
-DATE=$(date +%Y%m%d_%H%M%S)
-DB_FILE="quality_control.db"
-
-if [ ! -d "$BACKUP_DIR" ]; then
-    mkdir -p "$BACKUP_DIR"
-fi
-
-if [ -f "$DB_FILE" ]; then
-    cp "$DB_FILE" "$BACKUP_DIR/${DB_FILE}_${DATE}"
-    echo "Database backed up to: $BACKUP_DIR/${DB_FILE}_${DATE}"
-    
-    # Keep only last 10 backups
-    ls -t "$BACKUP_DIR"/${DB_FILE}_* | tail -n +11 | xargs rm -f 2>/dev/null || true
-else
-    echo "Database file not found: $DB_FILE"
-fi
+# Online, verified backup into backups/, keeping the last 10
+source venv/bin/activate
+python backup_db.py --database quality_control.db --backup-dir backups --keep 10
 EOF
 
 chmod +x backup.sh
@@ -0,0 +1,62 @@
+"""downsample.py
+Reduce a long measurement series to a bounded number of points for charts.
+
+Both methods return the indices of the points to keep, in time order, so the
+chart still shows real measurements:
+
+- lttb: Largest-Triangle-Three-Buckets. One point per bucket, chosen to keep
+  the visual shape of the line (first and last points are always kept).
+- min_max: the lowest and highest value of every bucket, so no out-of-tolerance
+  extreme is ever dropped; twice the points per bucket, half the buckets.
+
+Buckets hold equal numbers of points. numpy is imported on first use only.
+"""
+
+METHODS = ('lttb', 'min_max')
+
+
+def lttb(x, y, threshold):
+    """Indices of threshold points of (x, y) chosen by Largest-Triangle-Three-Buckets"""
+    import numpy as np
+
+    length = len(x)
+    if threshold >= length or threshold < 3:
+        return np.arange(length)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Bucket i covers [edges[i], edges[i + 1]); the first and last points are buckets of their own
+    edges = (np.arange(threshold - 1) * (length - 2) / (threshold - 2)).astype(np.int64) + 1
+    edges[-1] = length - 1
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = length - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # The third triangle corner is the average of the next bucket (or the last point)
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else length
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(areas.argmax())
+        selected[bucket + 1] = previous
+    return selected
+
+
+def min_max(y, threshold):
+    """Indices of the minimum and maximum of threshold // 2 buckets of y, in order"""
+    import numpy as np
+
+    length = len(y)
+    buckets = threshold // 2
+    if threshold >= length or buckets < 1:
+        return np.arange(length)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(0, length, buckets + 1).astype(np.int64)
+    selected = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        chunk = y[start:end]
+        selected.append(start + int(chunk.argmin()))
+        selected.append(start + int(chunk.argmax()))
+    return np.unique(np.array(selected, dtype=np.int64))
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Script to recompute the maintenance forecasts for all molds.
+
+Meant to be run periodically (e.g. from cron) so the molds dashboard never has
+to compute forecasts during a request:
+    python forecast_molds.py [--window-days 30]
+"""
+
+import argparse
+import os
+import sys
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app import get_db_connection, init_db, refresh_mold_forecasts, FORECAST_WINDOW_DAYS
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recompute mold maintenance forecasts.")
+    parser.add_argument("--window-days", type=int, default=FORECAST_WINDOW_DAYS,
+                        help="Number of past days used to derive cycles per day.")
+    args = parser.parse_args()
+
+    init_db()
+    with get_db_connection() as conn:
+        count = refresh_mold_forecasts(conn, window_days=args.window_days)
+    print(f"Forecasts computed for {count} mold(s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Seeded generator for realistic synthetic databases, used by benchmark.py.
+
+The same --seed, --scale and --end-date always produce the same database:
+    python generate_data.py --scale 10k --database bench_10k.db
+    python generate_data.py --scale 1m --database bench_1m.db --seed 7
+    python generate_data.py --measurements 250000 --products 150 --database custom.db
+
+Each submission measures every dimension of one product on one machine, like a
+real inspector submission, so the measurement count is approximate (rounded
+up to whole submissions).
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# name: (measurements, products, machines, inspectors, days of history)
+SCALES = {
+    '10k': (10_000, 100, 20, 10, 90),
+    '1m': (1_000_000, 300, 40, 30, 365),
+    '10m': (10_000_000, 600, 60, 60, 730),
+}
+INSERT_CHUNK = 50_000
+SHIFTS = ('1', '2', '3')
+DIMENSION_NAMES = ('Дължина', 'Ширина', 'Височина', 'Диаметър', 'Дебелина', 'Радиус', 'Отвор', 'Стъпка', 'Ъгъл', 'Тегло')
+PROBLEM_TYPES = ('Износване', 'Пукнатина', 'Непълно пълнене', 'Мустаци', 'Деформация')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a seeded synthetic quality control database.")
+    parser.add_argument("--database", required=True, help="Path of the database to create (must not exist).")
+    parser.add_argument("--scale", choices=sorted(SCALES), default='10k',
+                        help="Preset size: measurements, products, machines and history length.")
+    parser.add_argument("--measurements", type=int, help="Override the number of measurements.")
+    parser.add_argument("--products", type=int, help="Override the number of products.")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed.")
+    parser.add_argument("--end-date", default="2026-01-01",
+                        help="Date of the newest measurement (YYYY-MM-DD); fixed so runs are reproducible.")
+    return parser.parse_args()
+
+
+def insert_measurements(cursor, headers, rows):
+    cursor.executemany(
+        "INSERT INTO measurement_submissions (id, product_id, machine_id, inspector_id, shift_id, count, measured_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        headers)
+    cursor.executemany("INSERT INTO measurement_values (submission_id, dimension_id, measured_value) VALUES (?, ?, ?)", rows)
+
+
+def main() -> None:
+    args = parse_args()
+    if os.path.exists(args.database):
+        sys.exit(f"{args.database} already exists; refusing to overwrite it.")
+
+    # app reads DATABASE_PATH at import time
+    os.environ['DATABASE_PATH'] = args.database
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app import get_db_connection, init_db, local_epoch, lookup_id, product_key
+
+    measurement_target, product_count, machine_count, inspector_count, history_days = SCALES[args.scale]
+    measurement_target = args.measurements or measurement_target
+    product_count = args.products or product_count
+    rng = random.Random(args.seed)
+    end_date = datetime.strptime(args.end_date, "%Y-%m-%d").replace(hour=23, minute=59)
+    machines = [f"M{number:02d}" for number in range(1, machine_count + 1)]
+    inspectors = [f"inspector{number:02d}" for number in range(1, inspector_count + 1)]
+    started = time.time()
+
+    init_db()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        # Bulk load: the file is thrown away if generation fails
+        cursor.execute("PRAGMA synchronous = OFF")
+        cursor.execute("PRAGMA journal_mode = MEMORY")
+
+        for username in inspectors:
+            cursor.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, 'user')",
+                           (username, uuid.UUID(int=rng.getrandbits(128)).hex))
+
+        # Products, dimensions and molds
+        products = []
+        for number in range(1, product_count + 1):
+            product_name, drawing_number = f"Продукт {number:04d}", f"DRW-{rng.randint(10000, 99999)}-{number}"
+            cursor.execute("INSERT INTO products (product_name, drawing_number, comments, product_key) VALUES (?, ?, ?, ?)",
+                           (product_name, drawing_number, rng.choice(['', '', 'Критичен размер', 'Нов клиент']),
+                            product_key(product_name, drawing_number)))
+            product_id = cursor.lastrowid
+            dimensions = []
+            for name in rng.sample(DIMENSION_NAMES, rng.randint(3, 8)):
+                nominal = round(rng.uniform(2, 250), 2)
+                tolerance = round(max(0.01, nominal * rng.uniform(0.002, 0.01)), 3)
+                cursor.execute(
+                    "INSERT INTO dimensions (product_id, dimension_name, nominal_value, tolerance_minus, tolerance_plus) VALUES (?, ?, ?, ?, ?)",
+                    (product_id, name, nominal, tolerance, tolerance))
+                dimensions.append((cursor.lastrowid, nominal, tolerance))
+            for mold_number in range(1, rng.choice([1, 1, 2]) + 1):
+                threshold = rng.choice([50000, 100000, 200000])
+                # Spread molds across ok / due soon / overdue
+                cycles = int(threshold * rng.choice([rng.uniform(0, 0.85), rng.uniform(0.9, 1.0), rng.uniform(1.0, 1.2)]))
+                cursor.execute(
+                    "INSERT INTO molds (product_id, mold_name, mold_number, total_cycles, maintenance_threshold, created_date) VALUES (?, ?, ?, ?, ?, ?)",
+                    (product_id, f"Матрица {number:04d}-{mold_number}", f"MF-{number:04d}-{mold_number}", cycles,
+                     threshold, (end_date - timedelta(days=history_days)).strftime('%Y-%m-%d %H:%M:%S')))
+                cursor.execute(
+                    "INSERT INTO mold_cycle_events (mold_id, machine_number, delta, source, event_date) VALUES (?, NULL, ?, 'baseline', ?)",
+                    (cursor.lastrowid, cycles, (end_date - timedelta(days=history_days)).strftime('%Y-%m-%d %H:%M:%S')))
+            products.append((product_id, dimensions))
+
+        # Measurements, one submission at a time in chronological order (ids grow
+        # with time, as in production)
+        machine_ids = {machine: lookup_id(cursor, 'machines', machine) for machine in machines}
+        inspector_ids = {inspector: lookup_id(cursor, 'inspectors', inspector) for inspector in inspectors}
+        shift_ids = {shift: lookup_id(cursor, 'shifts', shift) for shift in SHIFTS}
+        headers = []
+        rows = []
+        inserted = 0
+        last_per_machine = {}
+        start_date = end_date - timedelta(days=history_days)
+        average_dimensions = sum(len(dimensions) for _, dimensions in products) / len(products)
+        interval = history_days * 86400 / max(1, measurement_target / average_dimensions)
+        submission_number = 0
+        while inserted + len(rows) < measurement_target:
+            product_id, dimensions = rng.choice(products)
+            machine = rng.choice(machines)
+            inspector = rng.choice(inspectors)
+            offset = submission_number * interval + rng.uniform(0, interval)
+            moment = min(end_date, start_date + timedelta(seconds=offset))
+            submission_number += 1
+            iso_date = moment.strftime('%Y-%m-%d %H:%M:%S')
+            count = rng.randint(50, 2000)
+            shift = SHIFTS[moment.hour // 8]
+            # A fresh database: submission ids are handed out in order from 1
+            headers.append((submission_number, product_id, machine_ids[machine], inspector_ids[inspector],
+                            shift_ids[shift], count, local_epoch(iso_date)))
+            for dimension_id, nominal, tolerance in dimensions:
+                # About 3% of values fall outside tolerance
+                measured = round(rng.gauss(nominal, tolerance / 2.2), 3)
+                rows.append((submission_number, dimension_id, measured))
+            last_per_machine[machine] = (product_id, count, iso_date, submission_number)
+            if len(rows) >= INSERT_CHUNK:
+                insert_measurements(cursor, headers, rows)
+                inserted += len(rows)
+                headers, rows = [], []
+                print(f"  {inserted:,} measurements", end='\r', flush=True)
+        insert_measurements(cursor, headers, rows)
+        inserted += len(rows)
+        if inserted > INSERT_CHUNK:
+            print()
+
+        # Current state of each machine, as the measurement write path leaves it
+        for machine, (product_id, count, iso_date, submission_id) in sorted(last_per_machine.items()):
+            cursor.execute(
+                "INSERT INTO machine_last_product (machine_number, last_product_id, last_count, last_submission_id, last_update) VALUES (?, ?, ?, ?, ?)",
+                (machine, product_id, count, submission_id, iso_date))
+            cursor.execute(
+                "INSERT INTO machine_mold_assignments (machine_number, mold_id, assigned_date, assigned_by) SELECT ?, id, ?, 'generator' FROM molds WHERE product_id = ? ORDER BY id LIMIT 1",
+                (machine, iso_date, product_id))
+
+        # A handful of reported mold problems
+        cursor.execute("SELECT id FROM molds")
+        mold_ids = [row['id'] for row in cursor.fetchall()]
+        for mold_id in rng.sample(mold_ids, max(1, len(mold_ids) // 10)):
+            report_date = end_date - timedelta(days=rng.randrange(history_days))
+            cursor.execute(
+                "INSERT INTO mold_problems (mold_id, problem_type, description, inspector, report_date, status) VALUES (?, ?, ?, ?, ?, ?)",
+                (mold_id, rng.choice(PROBLEM_TYPES), 'Генериран запис', rng.choice(inspectors),
+                 report_date.strftime('%Y-%m-%d %H:%M:%S'), rng.choice(['open', 'resolved'])))
+        cursor.execute("UPDATE molds SET problem_count = (SELECT COUNT(*) FROM mold_problems WHERE mold_problems.mold_id = molds.id)")
+        conn.commit()
+        cursor.execute("ANALYZE")
+        conn.commit()
+    conn.close()
+
+    print(f"Generated {inserted:,} measurements, {product_count} products, {len(mold_ids)} molds and "
+          f"{machine_count} machines in {time.time() - started:.1f}s -> {args.database}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
 # Gunicorn configuration file
+import gc
 import multiprocessing
+import os
+import subprocess
+import sys
 
 # Server socket
 bind = "0.0.0.0:8000"
@@ -7,7 +11,9 @@ backlog = 2048
 
 # Worker processes
 workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
+# Threaded workers: a long-lived /live_feed stream holds one thread instead of a whole worker
+worker_class = "gthread"
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
 worker_connections = 1000
 timeout = 30
 keepalive = 2
@@ -16,6 +22,11 @@ keepalive = 2
 max_requests = 1000
 max_requests_jitter = 50
 
+# Import the app once in the master: workers, including those recycled by
+# max_requests, fork with it already loaded and share its memory copy-on-write.
+# Code changes need a full restart (update_server.sh stops and starts the service).
+preload_app = True
+
 # Logging
 accesslog = "-"
 errorlog = "-"
@@ -31,6 +42,90 @@ user = None
 group = None
 tmp_upload_dir = None
 
+# Measurement writes go through a single group-commit writer process
+# (measurement_writer.py); set MEASUREMENT_WRITER_SOCKET to an empty value to disable.
+# The default is app.DEFAULT_MEASUREMENT_WRITER_SOCKET, in a directory private to
+# the app user next to the database (gunicorn loads this file before the app).
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from report_cache import default_cache_dir
+os.environ.setdefault('MEASUREMENT_WRITER_SOCKET', os.path.join(
+    default_cache_dir(os.environ.get('DATABASE_PATH', 'quality_control.db'), 'writer'), 'measurement_writer.sock'))
+
+# Scheduled online backups (backup_db.py) every BACKUP_INTERVAL seconds; unset to disable
+BACKUP_INTERVAL = os.environ.get('BACKUP_INTERVAL', '')
+
+# Reporting replica (backup_db.py --replica) refreshed every REPORT_REPLICA_INTERVAL
+# seconds; reports read from it when REPORT_REPLICA_PATH is set
+REPORT_REPLICA_PATH = os.environ.get('REPORT_REPLICA_PATH', '')
+REPORT_REPLICA_INTERVAL = os.environ.get('REPORT_REPLICA_INTERVAL', '60')
+
+# Deleted products' measurement history is purged in batches (purge_products.py),
+# checking the queue every PRODUCT_PURGE_INTERVAL seconds; set empty to disable
+PRODUCT_PURGE_INTERVAL = os.environ.get('PRODUCT_PURGE_INTERVAL', '10')
+
+def on_starting(server):
+    import app as qc_app
+    # /metrics counters start from zero with every server start
+    from metrics import clear_metrics_dir
+    clear_metrics_dir(qc_app.app.config['METRICS_DIR'])
+    # Create and migrate the schema once, before anything else opens the
+    # database: a long migration must not race the helper processes
+    qc_app.init_db()
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    if os.environ['MEASUREMENT_WRITER_SOCKET']:
+        server.measurement_writer = subprocess.Popen(
+            [sys.executable, os.path.join(base_dir, 'measurement_writer.py')]
+        )
+    if BACKUP_INTERVAL:
+        server.backup_scheduler = subprocess.Popen(
+            [sys.executable, os.path.join(base_dir, 'backup_db.py'), '--interval', BACKUP_INTERVAL]
+        )
+    if REPORT_REPLICA_PATH:
+        server.replica_refresher = subprocess.Popen(
+            [sys.executable, os.path.join(base_dir, 'backup_db.py'),
+             '--replica', REPORT_REPLICA_PATH, '--interval', REPORT_REPLICA_INTERVAL]
+        )
+    if PRODUCT_PURGE_INTERVAL:
+        server.product_purger = subprocess.Popen(
+            [sys.executable, os.path.join(base_dir, 'purge_products.py'), '--interval', PRODUCT_PURGE_INTERVAL]
+        )
+
+def when_ready(server):
+    # Compile the templates once in the master so every fork inherits them
+    if server.cfg.preload_app:
+        import app as qc_app
+        compiled, seconds = qc_app.warm_up()
+        server.log.info(f"Warmed up {compiled} templates in {seconds * 1000:.0f} ms")
+
+def post_fork(server, worker):
+    # Before the worker accepts traffic; a no-op for what the master already loaded
+    import app as qc_app
+    qc_app.warm_up()
+
+def post_worker_init(worker):
+    # After gunicorn's own signal setup: SIGUSR2 to a worker dumps its memory report
+    # (memory_profile.py); the master keeps SIGUSR2 for binary upgrades
+    import app as qc_app
+    qc_app.app.extensions['memory_profile'].install_signal_handler()
+
+def pre_fork(server, worker):
+    # Keep the preloaded objects out of the workers' garbage collections, which
+    # would otherwise touch (and so copy) every shared page
+    gc.freeze()
+
+def child_exit(server, worker):
+    # Keep an exited worker's counts in the /metrics totals
+    import app as qc_app
+    from metrics import mark_process_dead
+    mark_process_dead(worker.pid, qc_app.app.config['METRICS_DIR'])
+
+def on_exit(server):
+    for name in ('measurement_writer', 'backup_scheduler', 'replica_refresher', 'product_purger'):
+        process = getattr(server, name, None)
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
 # SSL (uncomment and configure for HTTPS)
 # keyfile = "/path/to/keyfile"
 # certfile = "/path/to/certfile" 
\ No newline at end of file
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Load test that replays a shift-change burst against the app running under gunicorn.
+
+Boots gunicorn with gunicorn.conf.py on a local port, against a copy of a
+database built by generate_data.py. It then starts --users simulated
+inspectors at the same moment. Each one logs in and replays a weighted mix of
+measurement posts, dimension lookups, report views and Excel exports until
+--duration runs out:
+    python generate_data.py --scale 1m --database bench_1m.db
+    python load_test.py --database bench_1m.db --users 40 --duration 60
+    python load_test.py --database bench_1m.db --workers 4 --worker-class sync --no-writer
+    python load_test.py --database bench_1m.db --mix measurement=80,report=20 --output run.json
+
+It reports throughput, latency percentiles per request type, HTTP errors and
+client timeouts. It also counts the "database is locked" errors and WORKER
+TIMEOUT lines that gunicorn wrote to its log during the run.
+
+Everything the server writes (writer socket, metrics, admission slots, caches,
+logs) goes to a temporary work directory, and the backup, replica and purge
+helpers are not started, so a run never touches a production instance on the
+same host. The directory is removed afterwards unless --keep-workdir is given.
+"""
+
+import argparse
+import hashlib
+import http.cookiejar
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+
+LOAD_TEST_PASSWORD = 'loadtest123'
+# The measurements page answers 200 either way; this flash marks a failed save
+SAVE_ERROR_MARKER = 'Грешка при запазване'.encode()
+DEFAULT_MIX = 'measurement=50,dimensions=25,report=20,export=5'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Shift-change load test against gunicorn.")
+    parser.add_argument("--database", required=True, help="Database built by generate_data.py (left unchanged).")
+    parser.add_argument("--users", type=int, default=30, help="Simulated concurrent users.")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load after all users logged in.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Weighted request mix (default {DEFAULT_MIX}).")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Seconds each user waits between requests.")
+    parser.add_argument("--timeout", type=float, default=30, help="Client timeout per request, in seconds.")
+    parser.add_argument("--port", type=int, default=0, help="Local port for gunicorn (default: a free port).")
+    parser.add_argument("--workers", type=int, help="Override the gunicorn worker count.")
+    parser.add_argument("--worker-class", help="Override the gunicorn worker class (e.g. sync, gthread).")
+    parser.add_argument("--threads", type=int, help="Threads per gthread worker.")
+    parser.add_argument("--no-writer", action="store_true",
+                        help="Write measurements directly from the workers instead of the group-commit writer.")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for the request mix.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--keep-workdir", action="store_true",
+                        help="Keep the work directory (database copy, server log) after the run.")
+    return parser.parse_args()
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in ('measurement', 'dimensions', 'report', 'export'):
+            sys.exit(f"Unknown request type in --mix: {name}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def prepare_database(source, destination, users):
+    """Copy the database and add one login per simulated user; return the fixture data."""
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(destination)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+    dst.row_factory = sqlite3.Row
+    # Same hashing as app.hash_password
+    password_hash = hashlib.sha256(LOAD_TEST_PASSWORD.encode()).hexdigest()
+    for number in range(users):
+        dst.execute("INSERT OR REPLACE INTO users (username, password_hash, role) VALUES (?, ?, 'user')",
+                    (f'loadtest{number:03d}', password_hash))
+    dst.commit()
+    products = {}
+    for row in dst.execute("SELECT product_id, id FROM dimensions ORDER BY product_id, id"):
+        products.setdefault(row['product_id'], []).append(row['id'])
+    last_date = dst.execute("SELECT datetime(MAX(measured_at), 'unixepoch') FROM measurement_submissions").fetchone()[0]
+    dst.close()
+    if not products or not last_date:
+        sys.exit("The database has no products or measurements; build one with generate_data.py first.")
+    return products, datetime.strptime(last_date[:10], "%Y-%m-%d")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(args, workdir, database, port):
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    # Nothing shared with a production instance on this host: every directory
+    # inside workdir (private, from mkdtemp) and no helper processes but the writer
+    env.update({
+        'DATABASE_PATH': database,
+        'MEASUREMENT_WRITER_SOCKET': '' if args.no_writer else os.path.join(workdir, 'writer', 'writer.sock'),
+        'METRICS_DIR': os.path.join(workdir, 'metrics'),
+        'ADMISSION_DIR': os.path.join(workdir, 'admission'),
+        'MEMORY_PROFILE_DIR': os.path.join(workdir, 'memory'),
+        'REPORT_CACHE_DIR': os.path.join(workdir, 'cache', 'reports'),
+        'JINJA_CACHE_DIR': os.path.join(workdir, 'cache', 'templates'),
+        'SLOW_QUERY_LOG': os.path.join(workdir, 'slow_queries.log'),
+        'ARCHIVE_DIR': os.path.join(workdir, 'archive'),
+        'BACKUP_INTERVAL': '',
+        'REPORT_REPLICA_PATH': '',
+        'PRODUCT_PURGE_INTERVAL': '',
+    })
+    command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(repo_dir, 'gunicorn.conf.py'),
+               '--bind', f'127.0.0.1:{port}', '--pid', os.path.join(workdir, 'gunicorn.pid')]
+    if args.workers:
+        command += ['--workers', str(args.workers)]
+    if args.worker_class:
+        command += ['--worker-class', args.worker_class]
+    if args.threads:
+        command += ['--threads', str(args.threads)]
+    command.append('wsgi:app')
+    log_path = os.path.join(workdir, 'gunicorn.log')
+    log = open(log_path, 'w')
+    server = subprocess.Popen(command, cwd=repo_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    # Ready once a worker answers and, if enabled, the writer is listening
+    writer_socket = env['MEASUREMENT_WRITER_SOCKET']
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            log.close()
+            with open(log_path) as f:
+                sys.exit(f"gunicorn exited during startup:\n{f.read()}")
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/login', timeout=1).close()
+            if not writer_socket or os.path.exists(writer_socket):
+                return server, log, log_path
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    sys.exit("gunicorn did not start within 60 seconds.")
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    # A 302 after a POST is the success response; do not spend time following it
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class SimulatedUser:
+    def __init__(self, number, base_url, products, last_date, weights, rng, timeout):
+        self.username = f'loadtest{number:03d}'
+        self.base_url = base_url
+        self.products = products
+        self.last_date = last_date
+        self.kinds = list(weights)
+        self.weights = list(weights.values())
+        self.rng = rng
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect)
+        self.sent = 0
+
+    def request(self, path, form=None):
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        try:
+            with self.opener.open(self.base_url + path, data=data, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            # 3xx lands here because redirects are not followed
+            return e.code, e.read()
+
+    def login(self):
+        return self.request('/login', {'username': self.username, 'password': LOAD_TEST_PASSWORD})[0]
+
+    def next_request(self):
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        product_id = self.rng.choice(list(self.products))
+        self.sent += 1
+        if kind == 'measurement':
+            form = {
+                'product_id': product_id,
+                # One machine per submission keeps duplicate prevention out of the way
+                'machine_number': f'LT-{self.username}-{self.sent}',
+                'count': self.rng.randint(50, 2000),
+                'measurement_date': datetime.now().strftime('%d-%m-%Y'),
+                'shift': '1',
+            }
+            for dimension_id in self.products[product_id]:
+                form[f'measured_value_{dimension_id}'] = f'{self.rng.uniform(1, 200):.3f}'
+            return kind, '/measurements', form
+        if kind == 'dimensions':
+            return kind, f'/get_dimensions/{product_id}', None
+        form = {
+            'product_id': product_id,
+            'start_date': (self.last_date - timedelta(days=30)).strftime('%d-%m-%Y'),
+            'end_date': self.last_date.strftime('%d-%m-%Y'),
+            'report_type': 'detailed',
+        }
+        return kind, '/reports' if kind == 'report' else '/export_excel', form
+
+
+def run_user(user, start_barrier, duration, samples, lock, think_time):
+    login_status = user.login()
+    start_barrier.wait()
+    stop_at = time.monotonic() + duration
+    if login_status != 302:
+        with lock:
+            samples.append(('login', 0.0, 'login_failed'))
+        return
+    while time.monotonic() < stop_at:
+        kind, path, form = user.next_request()
+        start = time.perf_counter()
+        try:
+            status, body = user.request(path, form)
+            if status >= 400:
+                outcome = f'http_{status}'
+            elif kind == 'measurement' and SAVE_ERROR_MARKER in body:
+                outcome = 'save_error'
+            else:
+                outcome = 'ok'
+        except (socket.timeout, TimeoutError):
+            outcome = 'timeout'
+        except (urllib.error.URLError, OSError) as e:
+            outcome = 'timeout' if 'timed out' in str(e) else 'connection_error'
+        with lock:
+            samples.append((kind, time.perf_counter() - start, outcome))
+        if think_time:
+            time.sleep(think_time)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def summarize(samples, elapsed, log_text):
+    summary = {'by_type': {}}
+    groups = {}
+    for kind, duration, outcome in samples:
+        groups.setdefault(kind, []).append((duration, outcome))
+    groups['all'] = [(duration, outcome) for kind, duration, outcome in samples if kind != 'login']
+    for kind, entries in groups.items():
+        durations = [duration * 1000 for duration, outcome in entries if outcome == 'ok']
+        outcomes = {}
+        for _, outcome in entries:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        summary['by_type'][kind] = {
+            'requests': len(entries),
+            'throughput_rps': round(len(entries) / elapsed, 2) if elapsed else None,
+            'outcomes': outcomes,
+            **{f'p{int(q * 100)}_ms': round(percentile(durations, q), 2) if durations else None
+               for q in (0.5, 0.9, 0.95, 0.99)},
+            'max_ms': round(max(durations), 2) if durations else None,
+        }
+    summary['elapsed_s'] = round(elapsed, 2)
+    summary['database_locked_errors'] = log_text.count('database is locked')
+    summary['worker_timeouts'] = log_text.count('WORKER TIMEOUT')
+    return summary
+
+
+def print_summary(summary):
+    print(f"\n{'type':<13}{'requests':>9}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  outcomes")
+    for kind, row in summary['by_type'].items():
+        cells = [f"{row[key]:>9.1f}" if row[key] is not None else f"{'-':>9}"
+                 for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')]
+        print(f"{kind:<13}{row['requests']:>9}{''.join(cells)}  {row['outcomes']}")
+    print(f"\nelapsed {summary['elapsed_s']} s, 'database is locked' in server log: "
+          f"{summary['database_locked_errors']}, worker timeouts: {summary['worker_timeouts']}")
+
+
+def main() -> None:
+    args = parse_args()
+    if not os.path.exists(args.database):
+        sys.exit(f"{args.database} does not exist.")
+    weights = parse_mix(args.mix)
+
+    workdir = tempfile.mkdtemp(prefix='qc_load_test_')
+    try:
+        run(args, weights, workdir)
+    finally:
+        if args.keep_workdir:
+            print(f"work directory kept: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run(args, weights, workdir):
+    database = os.path.join(workdir, 'quality_control.db')
+    products, last_date = prepare_database(args.database, database, args.users)
+    port = args.port or free_port()
+    server, log, log_path = start_gunicorn(args, workdir, database, port)
+    print(f"gunicorn running on port {port}; {args.users} users for {args.duration:.0f}s, mix {weights}")
+
+    samples = []
+    lock = threading.Lock()
+    seed = random.Random(args.seed)
+    users = [SimulatedUser(number, f'http://127.0.0.1:{port}', products, last_date, weights,
+                           random.Random(seed.getrandbits(32)), args.timeout)
+             for number in range(args.users)]
+    # Everyone starts at once, like a shift change
+    start_barrier = threading.Barrier(args.users + 1)
+    threads = [threading.Thread(target=run_user, args=(user, start_barrier, args.duration, samples, lock, args.think_time),
+                                daemon=True) for user in users]
+    try:
+        for thread in threads:
+            thread.start()
+        start_barrier.wait()
+        started = time.monotonic()
+        for thread in threads:
+            thread.join(timeout=max(0.0, started + args.duration + args.timeout + 5 - time.monotonic()))
+        elapsed = time.monotonic() - started
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        log.close()
+
+    with open(log_path, errors='replace') as f:
+        log_text = f.read()
+    summary = summarize(samples, elapsed, log_text)
+    summary['config'] = {
+        'database': os.path.abspath(args.database), 'users': args.users, 'duration': args.duration,
+        'mix': weights, 'workers': args.workers, 'worker_class': args.worker_class, 'threads': args.threads,
+        'writer': not args.no_writer, 'think_time': args.think_time,
+    }
+    print_summary(summary)
+    if args.keep_workdir:
+        print(f"server log: {log_path}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Single-writer group-commit process for measurement submissions.
+
+Gunicorn workers send validated submissions as one JSON line over a Unix
+socket (MEASUREMENT_WRITER_SOCKET). The writer collects everything that
+arrives within a few milliseconds, saves the batch in one SQLite transaction
+(one savepoint per submission) and replies to each submitter with its own
+result line. Under contention, throughput then scales with batch size
+instead of with the number of commits.
+
+Usage:
+    python measurement_writer.py    # socket: MEASUREMENT_WRITER_SOCKET, or cache/writer/ next to the database
+
+The socket's directory must be private to the app user (created 0700, see
+report_cache.ensure_private_dir); otherwise the writer refuses to start, and
+workers only send to a socket that this user owns in such a directory.
+
+gunicorn.conf.py starts and stops this process automatically, after it has run
+init_db(); run by hand, it expects an initialized database.
+"""
+
+import json
+import logging
+import os
+import queue
+import signal
+import socketserver
+import sys
+import threading
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app import DEFAULT_MEASUREMENT_WRITER_SOCKET, get_db_connection, save_measurement_submissions
+from report_cache import ensure_private_dir
+
+logger = logging.getLogger("measurement_writer")
+
+SOCKET_PATH = os.environ.get("MEASUREMENT_WRITER_SOCKET") or DEFAULT_MEASUREMENT_WRITER_SOCKET
+# How long to keep collecting submissions after the first one arrives
+BATCH_WINDOW_SECONDS = float(os.environ.get("MEASUREMENT_WRITER_WINDOW_MS", 5)) / 1000
+BATCH_MAX_SIZE = int(os.environ.get("MEASUREMENT_WRITER_MAX_BATCH", 200))
+
+pending_submissions = queue.Queue()
+
+
+class PendingSubmission:
+    """A submission waiting for the writer thread, with the submitter's reply slot."""
+
+    def __init__(self, submission):
+        self.submission = submission
+        self.result = None
+        self.done = threading.Event()
+
+
+class SubmissionHandler(socketserver.StreamRequestHandler):
+    """Read JSON submissions line by line and answer each after its batch commits."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                pending = PendingSubmission(json.loads(line))
+            except ValueError:
+                self.wfile.write(json.dumps({'status': 'error', 'message': 'Invalid submission'}).encode() + b'\n')
+                continue
+            pending_submissions.put(pending)
+            pending.done.wait()
+            self.wfile.write(json.dumps(pending.result).encode() + b'\n')
+
+
+class SubmissionServer(socketserver.ThreadingUnixStreamServer):
+    # Shift change bursts: let every worker queue a connection at once
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def collect_batch():
+    """Block for the first submission, then gather more until the window closes."""
+    batch = [pending_submissions.get()]
+    deadline = time.monotonic() + BATCH_WINDOW_SECONDS
+    while len(batch) < BATCH_MAX_SIZE:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(pending_submissions.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def writer_loop():
+    conn = get_db_connection()
+    while True:
+        batch = collect_batch()
+        try:
+            results = save_measurement_submissions(conn, [pending.submission for pending in batch])
+        except Exception as e:
+            logger.error(f"Batch of {len(batch)} submissions failed: {e}")
+            results = [{'status': 'error', 'message': str(e)}] * len(batch)
+        logger.debug(f"Committed batch of {len(batch)} submissions")
+        for pending, result in zip(batch, results):
+            pending.result = result
+            pending.done.set()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    socket_dir = os.path.dirname(os.path.abspath(SOCKET_PATH))
+    if not ensure_private_dir(socket_dir):
+        logger.error(f"{socket_dir} is not private to this user; the measurement writer does not start")
+        sys.exit(1)
+    # Only this user can have left a file here: a stale socket of an earlier run
+    if os.path.lexists(SOCKET_PATH):
+        os.remove(SOCKET_PATH)
+
+    threading.Thread(target=writer_loop, name="measurement-writer", daemon=True).start()
+
+    server = SubmissionServer(SOCKET_PATH, SubmissionHandler)
+    os.chmod(SOCKET_PATH, 0o600)
+    # Exit through the finally block below so the socket file is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # A child of the gunicorn master: ignore the SIGUSR2 meant for the workers' memory reports
+    signal.signal(signal.SIGUSR2, signal.SIG_IGN)
+    logger.info(f"Measurement writer listening on {SOCKET_PATH}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(SOCKET_PATH):
+            os.remove(SOCKET_PATH)
+
+
+if __name__ == "__main__":
+    main()
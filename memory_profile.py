@@ -0,0 +1,201 @@
+"""memory_profile.py
+Per-worker memory diagnostics.
+
+Every request's change in resident memory (RSS, from /proc/self/statm) is
+added to its endpoint, both in this worker's report and in /metrics
+(qc_rss_growth_bytes_total), so growth can be traced to the routes that cause
+it; with threaded workers, concurrent requests share the growth they cause.
+With MEMORY_PROFILE_FRAMES > 0, tracemalloc also runs. Each report then lists
+the top allocation sites and the diff against the previous report's snapshot:
+what the requests served in between left behind.
+
+Reports come from the admin endpoint /diagnostics/memory (the worker that
+serves the request) or, for every worker at once, from SIGUSR2 sent to the
+workers. Each worker writes its report to MEMORY_PROFILE_DIR, which must be
+private to the app user (report_cache.ensure_private_dir):
+
+    pkill -USR2 -P "$(cat /tmp/quality_control_app.pid)"
+
+Send the signal to the workers only: SIGUSR2 to the gunicorn master starts a
+binary upgrade. The master's other children, the helpers started in
+gunicorn.conf.py (measurement writer, backups, replica, product purge), ignore
+SIGUSR2 so the command above leaves them running.
+"""
+
+import json
+import logging
+import os
+import signal
+import threading
+import time
+import tracemalloc
+
+from flask import g, request
+
+from report_cache import ensure_private_dir
+
+TOP_SITES = 25
+# Allocations made by the profiler itself and the import machinery are noise
+IGNORED_FILES = (tracemalloc.__file__, '<frozen importlib._bootstrap>', '<frozen importlib._bootstrap_external>', '<unknown>')
+
+logger = logging.getLogger('memory_profile')
+
+
+def current_rss():
+    """Resident set size of this process in bytes (None where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def statistic_to_dict(stat):
+    frame = stat.traceback[0]
+    return {
+        'site': f'{frame.filename}:{frame.lineno}',
+        'size_bytes': stat.size,
+        'count': stat.count,
+        'size_diff_bytes': getattr(stat, 'size_diff', None),
+        'count_diff': getattr(stat, 'count_diff', None),
+    }
+
+
+class MemoryProfiler:
+    def __init__(self, frames, dump_dir, registry=None):
+        self.frames = frames
+        self.dump_dir = dump_dir
+        self.registry = registry
+        self.lock = threading.Lock()
+        self.pid = None
+        self._reset()
+
+    def _reset(self):
+        # Called again after a fork: a worker reports its own requests only
+        self.pid = os.getpid()
+        self.started = time.time()
+        self.endpoints = {}
+        self.previous = None  # (time, snapshot) of the last report
+
+    def _check_process(self):
+        if self.pid != os.getpid():
+            self._reset()
+
+    def start(self):
+        if self.frames > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def record_request(self, endpoint, rss_before, rss_after):
+        growth = max(0, rss_after - rss_before)
+        with self.lock:
+            self._check_process()
+            stats = self.endpoints.setdefault(endpoint, {'requests': 0, 'rss_growth_bytes': 0, 'max_rss_bytes': 0})
+            stats['requests'] += 1
+            stats['rss_growth_bytes'] += growth
+            stats['max_rss_bytes'] = max(stats['max_rss_bytes'], rss_after)
+        if growth and self.registry is not None:
+            self.registry.inc('qc_rss_growth_bytes_total', (endpoint,), growth)
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, filename) for filename in IGNORED_FILES]
+        )
+
+    def report(self, limit=TOP_SITES):
+        """This worker's memory report; with tracemalloc, also the diff since the last report"""
+        with self.lock:
+            self._check_process()
+            endpoints = sorted(({'endpoint': name, **stats} for name, stats in self.endpoints.items()),
+                               key=lambda item: item['rss_growth_bytes'], reverse=True)
+        data = {
+            'pid': self.pid,
+            'taken_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'uptime_seconds': round(time.time() - self.started),
+            'rss_bytes': current_rss(),
+            'endpoints': endpoints,
+            'tracemalloc': None,
+        }
+        if not tracemalloc.is_tracing():
+            return data
+
+        snapshot = self._snapshot()
+        traced, peak = tracemalloc.get_traced_memory()
+        traced_memory = {
+            'traced_bytes': traced,
+            'peak_bytes': peak,
+            'top': [statistic_to_dict(stat) for stat in snapshot.statistics('lineno')[:limit]],
+            'diff_since': None,
+            'growth': [],
+        }
+        with self.lock:
+            previous, self.previous = self.previous, (data['taken_at'], snapshot)
+        if previous is not None:
+            traced_memory['diff_since'] = previous[0]
+            diff = [stat for stat in snapshot.compare_to(previous[1], 'lineno') if stat.size_diff > 0]
+            traced_memory['growth'] = [statistic_to_dict(stat) for stat in diff[:limit]]
+        data['tracemalloc'] = traced_memory
+        return data
+
+    def dump(self, limit=TOP_SITES):
+        """Write this worker's report to dump_dir; returns the file path"""
+        if not ensure_private_dir(self.dump_dir):
+            raise PermissionError(f"{self.dump_dir} is not private to this user")
+        data = self.report(limit)
+        path = os.path.join(self.dump_dir, f"{data['pid']}-{int(time.time() * 1000)}.json")
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+        return path
+
+    def install_signal_handler(self, signum=signal.SIGUSR2):
+        def handle(signum, frame):
+            try:
+                logger.info(f"Memory report written to {self.dump(TOP_SITES)}")
+            except Exception as e:
+                logger.error(f"Memory report failed: {e}")
+        signal.signal(signum, handle)
+
+
+def latest_dumps(dump_dir):
+    """Newest report file of each worker pid in dump_dir"""
+    latest = {}
+    if not ensure_private_dir(dump_dir):
+        return []
+    try:
+        names = sorted(os.listdir(dump_dir))
+    except FileNotFoundError:
+        return []
+    for name in names:
+        pid, _, rest = name.partition('-')
+        if rest.endswith('.json'):
+            latest[pid] = name
+    reports = []
+    for name in latest.values():
+        try:
+            with open(os.path.join(dump_dir, name)) as f:
+                reports.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return reports
+
+
+def init_app(app):
+    """Start tracemalloc if configured and record RSS growth per endpoint"""
+    profiler = MemoryProfiler(app.config.get('MEMORY_PROFILE_FRAMES', 0),
+                              app.config['MEMORY_PROFILE_DIR'],
+                              app.extensions.get('metrics'))
+    profiler.start()
+    app.extensions['memory_profile'] = profiler
+    if current_rss() is None:
+        return profiler
+
+    @app.before_request
+    def remember_rss():
+        g._memory_rss_before = current_rss()
+
+    @app.teardown_request
+    def record_rss(exc):
+        before = g.pop('_memory_rss_before', None)
+        if before is not None:
+            profiler.record_request(request.endpoint or 'unmatched', before, current_rss())
+
+    return profiler
@@ -0,0 +1,401 @@
+"""metrics.py
+Per-endpoint request, SQL and template metrics in Prometheus text format.
+
+Each process keeps its own counters in memory and writes them to
+``<METRICS_DIR>/<pid>-<start>.json`` at most once per FLUSH_INTERVAL. The
+/metrics view merges every file in the directory, so the numbers cover all
+gunicorn workers. When a worker exits, gunicorn's child_exit hook folds its
+file into ``dead.json`` (see mark_process_dead) so counters never go
+backwards.
+
+SQL statements are counted and timed by the cursor returned from
+InstrumentedConnection (used by get_db_connection); template render time comes
+from Flask's template signals.
+
+METRICS_DIR must be private to the app user (report_cache.ensure_private_dir),
+since every file in it is merged into /metrics; otherwise each process serves
+only its own counts.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+
+from report_cache import ensure_private_dir
+
+# Seconds between writes of this process' counters to its metrics file
+FLUSH_INTERVAL = 1.0
+DEAD_FILE = 'dead.json'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+
+# name: (type, label names, histogram buckets, help text)
+METRICS = {
+    'qc_http_requests_total': (
+        'counter', ('endpoint', 'method', 'status'), None, 'HTTP requests by endpoint, method and status code'),
+    'qc_http_request_duration_seconds': (
+        'histogram', ('endpoint',), LATENCY_BUCKETS, 'Request latency by endpoint'),
+    'qc_http_response_size_bytes': (
+        'histogram', ('endpoint',), SIZE_BUCKETS, 'Response body size by endpoint'),
+    'qc_sql_statements_total': (
+        'counter', ('endpoint',), None, 'SQL statements executed while serving the endpoint'),
+    'qc_sql_duration_seconds_total': (
+        'counter', ('endpoint',), None, 'Time spent executing SQL statements for the endpoint'),
+    'qc_template_render_seconds': (
+        'histogram', ('template',), LATENCY_BUCKETS, 'Jinja template render time'),
+    'qc_admission_wait_seconds': (
+        'histogram', ('lane',), LATENCY_BUCKETS, 'Time heavy requests waited for an admission slot'),
+    'qc_admission_rejected_total': (
+        'counter', ('lane',), None, 'Heavy requests rejected with 429 because their lane was full'),
+    'qc_report_cache_requests_total': (
+        'counter', ('kind', 'result'), None, 'Report cache lookups by kind (report, export) and result (hit, miss)'),
+    'qc_rss_growth_bytes_total': (
+        'counter', ('endpoint',), None, 'Resident memory growth observed while serving the endpoint'),
+}
+
+# Callables invoked as observer(sql, parameters, duration, connection) after every statement
+statement_observers = []
+
+
+class MetricsRegistry:
+    """In-process counters for one worker, periodically written to its metrics file."""
+
+    def __init__(self, directory):
+        # None: counts stay in this process (no private directory to share them in)
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.pid = None
+        self._reset()
+
+    def _reset(self):
+        # Called again after a fork so the child does not re-publish the parent's counts
+        self.pid = os.getpid()
+        self.path = os.path.join(self.directory, f'{self.pid}-{int(time.time() * 1000)}.json') if self.directory else None
+        self.values = {name: {} for name in METRICS}
+        self.dirty = False
+        self.flusher = None
+
+    def _check_process(self):
+        if self.pid != os.getpid():
+            self._reset()
+        if self.flusher is None:
+            self.flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            self.flusher.start()
+
+    def inc(self, name, labels, amount=1):
+        key = '\t'.join(str(label) for label in labels)
+        with self.lock:
+            self._check_process()
+            series = self.values[name]
+            series[key] = series.get(key, 0) + amount
+            self.dirty = True
+
+    def observe(self, name, labels, value):
+        key = '\t'.join(str(label) for label in labels)
+        buckets = METRICS[name][2]
+        with self.lock:
+            self._check_process()
+            series = self.values[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = {'buckets': [0] * (len(buckets) + 1), 'sum': 0, 'count': 0}
+            index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+            histogram['buckets'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+            self.dirty = True
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty or self.pid != os.getpid() or self.path is None:
+                return
+            payload = json.dumps(self.values)
+            self.dirty = False
+        write_json_atomic(self.path, payload)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+
+def write_json_atomic(path, payload):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def merge_values(total, values):
+    for name, series in values.items():
+        if name not in METRICS:
+            continue
+        merged = total.setdefault(name, {})
+        for key, value in series.items():
+            if isinstance(value, dict):
+                current = merged.setdefault(key, {'buckets': [0] * len(value['buckets']), 'sum': 0, 'count': 0})
+                current['buckets'] = [a + b for a, b in zip(current['buckets'], value['buckets'])]
+                current['sum'] += value['sum']
+                current['count'] += value['count']
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return total
+
+
+def collect(directory):
+    """Merge the metrics files of all live and exited workers."""
+    dead = read_json(os.path.join(directory, DEAD_FILE)) or {'files': [], 'values': {}}
+    total = merge_values({}, dead['values'])
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        # Files already folded into dead.json may linger for a moment before removal
+        if not name.endswith('.json') or name == DEAD_FILE or name in dead['files']:
+            continue
+        values = read_json(os.path.join(directory, name))
+        if values:
+            merge_values(total, values)
+    return total
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(label_names, key, extra=None):
+    pairs = list(zip(label_names, key.split('\t')))
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+
+def render_prometheus(values):
+    lines = []
+    for name, (metric_type, label_names, buckets, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for key, value in sorted(values.get(name, {}).items()):
+            if metric_type == 'histogram':
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ['+Inf'], value['buckets']):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{format_labels(label_names, key, ("le", str(bound)))} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(label_names, key)} {value["sum"]}')
+                lines.append(f'{name}_count{format_labels(label_names, key)} {value["count"]}')
+            else:
+                lines.append(f'{name}{format_labels(label_names, key)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def mark_process_dead(pid, directory):
+    """Fold an exited worker's counters into dead.json (gunicorn child_exit hook)."""
+    if not ensure_private_dir(directory):
+        return
+    dead_path = os.path.join(directory, DEAD_FILE)
+    prefix = f'{pid}-'
+    try:
+        names = [name for name in os.listdir(directory) if name.startswith(prefix) and name.endswith('.json')]
+    except FileNotFoundError:
+        return
+    if not names:
+        return
+    dead = read_json(dead_path) or {'files': [], 'values': {}}
+    for name in names:
+        values = read_json(os.path.join(directory, name))
+        if values:
+            merge_values(dead['values'], values)
+    # Keep only names whose files still exist, plus the ones removed below
+    dead['files'] = [name for name in dead['files'] if os.path.exists(os.path.join(directory, name))] + names
+    write_json_atomic(dead_path, json.dumps(dead))
+    for name in names:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+def clear_metrics_dir(directory):
+    """Start from zero when the server (re)starts."""
+    if not ensure_private_dir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith('.json') or name.endswith('.tmp'):
+            os.remove(os.path.join(directory, name))
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times every statement for the current request.
+
+    SQLite produces rows while they are fetched, so a statement's time runs
+    from execute() until its rows are used up: fetch calls add their time, and
+    a loop over the cursor counts from its first to its last row (including
+    the caller's per-row work; timing each row would cost more than the scan).
+    The statement is recorded when its result is exhausted, or when the cursor
+    runs another statement, is closed or is released.
+    """
+
+    _pending = None  # [sql, parameters, seconds so far] of a statement with rows left
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            record_statement(*pending, self.connection)
+
+    def _fetched(self, start, exhausted):
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - start
+            if exhausted:
+                self._finish()
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._pending = [sql, parameters, time.perf_counter() - start]
+            if self.description is None:  # No result rows (or the statement failed)
+                self._finish()
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_statement(sql, None, time.perf_counter() - start, self.connection)
+
+    def executescript(self, sql_script):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            record_statement(sql_script, None, time.perf_counter() - start, self.connection)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(start, len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, True)
+        return rows
+
+    def __iter__(self):
+        start = time.perf_counter()
+        exhausted = False
+        try:
+            # The rows themselves still come from the C iterator
+            yield from iter(super().__next__, None)
+            exhausted = True
+        finally:
+            self._fetched(start, exhausted)
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors (including conn.execute shortcuts) are instrumented."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def record_statement(sql, parameters, duration, connection=None):
+    if has_request_context():
+        g._metrics_sql_count = g.get('_metrics_sql_count', 0) + 1
+        g._metrics_sql_time = g.get('_metrics_sql_time', 0.0) + duration
+    for observer in statement_observers:
+        observer(sql, parameters, duration, connection)
+
+
+def init_app(app):
+    """Register the request hooks and template signals on the Flask app."""
+    directory = app.config['METRICS_DIR']
+    registry = MetricsRegistry(directory if ensure_private_dir(directory) else None)
+    app.extensions['metrics'] = registry
+
+    @app.before_request
+    def start_request_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        start = g.pop('_metrics_start', None)
+        if start is None:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        registry.observe('qc_http_request_duration_seconds', (endpoint,), time.perf_counter() - start)
+        registry.inc('qc_http_requests_total', (endpoint, request.method, response.status_code))
+        # Streamed responses (live feed, files without a length) have no known size
+        if response.content_length is not None:
+            registry.observe('qc_http_response_size_bytes', (endpoint,), response.content_length)
+        registry.inc('qc_sql_statements_total', (endpoint,), g.pop('_metrics_sql_count', 0))
+        registry.inc('qc_sql_duration_seconds_total', (endpoint,), g.pop('_metrics_sql_time', 0.0))
+        return response
+
+    def template_started(sender, template, context, **extra):
+        if has_request_context():
+            g.setdefault('_metrics_template_starts', []).append(time.perf_counter())
+
+    def template_finished(sender, template, context, **extra):
+        starts = g.get('_metrics_template_starts') if has_request_context() else None
+        if starts:
+            registry.observe('qc_template_render_seconds', (template.name,), time.perf_counter() - starts.pop())
+
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
+
+
+def render_latest(app):
+    """Prometheus text for all workers, including this process' latest counts."""
+    registry = app.extensions['metrics']
+    if registry.directory is None:
+        with registry.lock:
+            return render_prometheus(merge_values({}, registry.values))
+    registry.flush()
+    return render_prometheus(collect(registry.directory))
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Purge the measurement history of deleted products in the background.
+
+Deleting a product on the products page removes the product, its dimensions,
+molds and their small dependants at once and queues a job in
+product_deletions (see detach_product in app.py). This script works through
+the queue: the product's submissions (values first), then those in the
+per-year archive files (attached one at a time), and its molds' cycle ledger
+are deleted --batch-size rows per short transaction, with a pause between
+batches, so measurement entry never waits long for the write lock. Live rows
+go first: rows archive_measurements.py moves meanwhile are caught in the
+archives.
+Drawing files of the product are removed once no other product or mold
+refers to them. Progress is kept in product_deletions and shown on the
+products page (/product_deletions).
+
+    python purge_products.py                  # work through the queue once
+    python purge_products.py --interval 10    # long-running, checks the queue every 10 s
+
+gunicorn.conf.py runs init_db() and then starts the long-running mode unless
+PRODUCT_PURGE_INTERVAL is empty; run by hand, the script expects an
+initialized database. Every batch is idempotent, so a job interrupted by a
+restart simply continues on the next pass.
+"""
+
+import argparse
+import json
+import logging
+import os
+import signal
+import sqlite3
+import sys
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app import get_bulgarian_time_string, get_db_connection, measurement_archive_paths
+
+logger = logging.getLogger("purge_products")
+
+BATCH_SIZE = 1000  # submissions (their values go with them) or ledger rows per transaction
+# Pause between batches so waiting writers get the lock
+BATCH_PAUSE = 0.05  # seconds
+DRAWINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'drawings')
+CYCLE_LEDGER_TABLES = ('mold_cycle_events', 'mold_cycle_snapshots')
+
+
+def purge_submissions(conn, job, batch_size, pause, schema='main'):
+    """Delete the product's submissions and their values in schema, one batch per transaction"""
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        ids = [row[0] for row in conn.execute(
+            f"SELECT id FROM {schema}.measurement_submissions WHERE product_id=? LIMIT ?", (job['product_id'], batch_size))]
+        if not ids:
+            conn.rollback()
+            return
+        placeholders = ','.join('?' * len(ids))
+        conn.execute(f"DELETE FROM {schema}.measurement_values WHERE submission_id IN ({placeholders})", ids)
+        deleted = conn.execute(f"DELETE FROM {schema}.measurement_submissions WHERE id IN ({placeholders})", ids).rowcount
+        conn.execute("UPDATE product_deletions SET submissions_deleted = submissions_deleted + ? WHERE id=?",
+                     (deleted, job['id']))
+        conn.commit()
+        time.sleep(pause)
+
+
+def purge_archived_submissions(conn, job, batch_size, pause):
+    """Delete the product's submissions from every archive file, attached one at a time"""
+    for path in measurement_archive_paths():
+        conn.execute("ATTACH DATABASE ? AS purge_archive", (path,))
+        try:
+            purge_submissions(conn, job, batch_size, pause, 'purge_archive')
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute("DETACH DATABASE purge_archive")
+
+
+def purge_cycle_ledger(conn, mold_ids, batch_size, pause):
+    """Delete the cycle events and snapshots of the product's molds"""
+    if not mold_ids:
+        return
+    placeholders = ','.join('?' * len(mold_ids))
+    for table in CYCLE_LEDGER_TABLES:
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            deleted = conn.execute(f'''
+            DELETE FROM {table} WHERE id IN (
+                SELECT id FROM {table} WHERE mold_id IN ({placeholders}) LIMIT ?
+            )''', [*mold_ids, batch_size]).rowcount
+            conn.commit()
+            if deleted < batch_size:
+                break
+            time.sleep(pause)
+
+
+def remove_unused_files(conn, files):
+    """Remove the product's drawing files that no remaining product or mold refers to"""
+    referenced = set()
+    for row in conn.execute("SELECT drawing_path, drawing_path_2 FROM products UNION ALL SELECT specifications_pdf, NULL FROM molds"):
+        referenced.update(os.path.basename(path) for path in row if path)
+    removed = 0
+    for name in files:
+        path = os.path.join(DRAWINGS_DIR, name)
+        if name not in referenced and os.path.exists(path):
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def run_job(conn, job, batch_size=BATCH_SIZE, pause=BATCH_PAUSE):
+    conn.execute("UPDATE product_deletions SET status='running', error=NULL WHERE id=?", (job['id'],))
+    conn.commit()
+    started = time.time()
+    purge_submissions(conn, job, batch_size, pause)
+    purge_archived_submissions(conn, job, batch_size, pause)
+    purge_cycle_ledger(conn, json.loads(job['mold_ids']), batch_size, pause)
+    removed = remove_unused_files(conn, json.loads(job['files']))
+    conn.execute("UPDATE product_deletions SET status='done', finished_at=? WHERE id=?",
+                 (get_bulgarian_time_string(), job['id']))
+    conn.commit()
+    logger.info(f"Purged product {job['product_id']} ({job['product_name']}): {job['submissions_total']} submissions, "
+                f"{removed} drawing file(s) in {time.time() - started:.1f}s")
+
+
+def purge_pending(batch_size=BATCH_SIZE, pause=BATCH_PAUSE):
+    """Run every unfinished job; returns the number completed"""
+    conn = get_db_connection()
+    completed = 0
+    try:
+        jobs = conn.execute("SELECT * FROM product_deletions WHERE status != 'done' ORDER BY id").fetchall()
+        for job in jobs:
+            try:
+                run_job(conn, job, batch_size, pause)
+                completed += 1
+            except (sqlite3.Error, OSError) as e:
+                # Left unfinished: the next pass continues where this one stopped
+                if conn.in_transaction:
+                    conn.rollback()
+                logger.error(f"Purge of product {job['product_id']} failed: {e}")
+                try:
+                    conn.execute("UPDATE product_deletions SET error=? WHERE id=?", (str(e), job['id']))
+                    conn.commit()
+                except sqlite3.Error:
+                    pass
+    finally:
+        conn.close()
+    return completed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Purge the measurement history of deleted products.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="Submissions or ledger rows deleted per transaction.")
+    parser.add_argument("--pause", type=float, default=BATCH_PAUSE,
+                        help="Seconds to pause between batches.")
+    parser.add_argument("--interval", type=int, default=0,
+                        help="Seconds between queue checks; 0 works through the queue once and exits.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    if not args.interval:
+        print(f"Purged {purge_pending(args.batch_size, args.pause)} deleted product(s).")
+        return
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # A child of the gunicorn master: ignore the SIGUSR2 meant for the workers' memory reports
+    signal.signal(signal.SIGUSR2, signal.SIG_IGN)
+    logger.info(f"Checking for deleted products to purge every {args.interval}s")
+    while True:
+        purge_pending(args.batch_size, args.pause)
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
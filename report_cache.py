@@ -0,0 +1,143 @@
+"""report_cache.py
+Disk-backed cache for report results and Excel exports, shared by all workers.
+
+Entries are files in REPORT_CACHE_DIR named by a hash of the report parameters
+and the measurements data version of the product(s) they cover. Writers bump
+that version in the same transaction that changes the data, so a changed
+report simply gets a new key and stale entries are never read again; they age
+out through eviction.
+
+Eviction is LRU by size: every hit touches the file's mtime, and after each
+write the oldest files are removed until the directory fits in max_bytes.
+Hits and misses are counted per kind in /metrics
+(qc_report_cache_requests_total), from which the hit ratio follows.
+
+Cached files are served as they are, so the directory must belong to the app:
+it is created 0700 and refused (the cache stays off) if another user owns it
+or can write to it. The default lives next to the database, not in /tmp.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import stat
+import tempfile
+
+CACHE_SUBDIR = 'cache'
+
+logger = logging.getLogger('report_cache')
+
+
+def default_cache_dir(database_path, name):
+    """<directory of the database>/cache/<name>"""
+    return os.path.join(os.path.dirname(os.path.abspath(database_path)), CACHE_SUBDIR, name)
+
+
+def private_to_user(info):
+    """Whether an lstat() result is owned by this user and writable by nobody else"""
+    return info.st_uid == os.getuid() and not info.st_mode & 0o022
+
+
+def ensure_private_dir(path):
+    """Create path (0700) if needed; True if it is a directory only this user can write to.
+
+    Anything else (owned by another user, group/world writable, a symlink) is
+    refused, since files planted there would be trusted. Also used for the
+    metrics, admission, memory report and measurement writer directories.
+    """
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        info = os.lstat(path)
+    except OSError as e:
+        logger.warning(f"Directory {path} unavailable: {e}")
+        return False
+    if not stat.S_ISDIR(info.st_mode) or not private_to_user(info):
+        logger.warning(f"Directory {path} is not private to this user; not using it")
+        return False
+    if info.st_mode & 0o077:
+        os.chmod(path, 0o700)
+    return True
+
+
+class ReportCache:
+    def __init__(self, directory, max_bytes, registry=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.registry = registry
+        if self.max_bytes > 0 and not ensure_private_dir(directory):
+            self.max_bytes = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(kind, *parts):
+        """Stable key for a report kind and its parameters (data version included)"""
+        digest = hashlib.sha256(json.dumps([kind, *parts], default=str).encode('utf-8')).hexdigest()
+        return f'{kind}-{digest[:32]}'
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _count(self, key, result):
+        if self.registry is not None:
+            self.registry.inc('qc_report_cache_requests_total', (key.split('-', 1)[0], result))
+
+    def get(self, key):
+        """Cached bytes for key, or None"""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # Most recently used
+        except FileNotFoundError:  # Never written, or evicted by another worker
+            self._count(key, 'miss')
+            return None
+        self._count(key, 'hit')
+        return data
+
+    def put(self, key, data):
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith('.tmp-'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    # JSON helpers for cached report rows
+    def get_json(self, key):
+        data = self.get(key)
+        return json.loads(data) if data is not None else None
+
+    def put_json(self, key, value):
+        self.put(key, json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
@@ -22,12 +22,17 @@ DRAWINGS_DIR = Path("static") / "drawings"
 
 # SQL statements to clear necessary tables (order matters due to FK constraints)
 SQL_STATEMENTS = [
-    "DELETE FROM measurements;",
+    "DELETE FROM measurement_values;",
+    "DELETE FROM measurement_submissions;",
     "DELETE FROM dimensions;",
     "DELETE FROM machine_last_product;",
     "DELETE FROM machine_mold_assignments;",
+    "DELETE FROM mold_cycle_snapshots;",
+    "DELETE FROM mold_cycle_events;",
     "DELETE FROM molds;",
     "DELETE FROM products;",
+    # Product ids are reused; new versions keep cached reports of the old rows unreachable
+    "UPDATE data_versions SET version = version + 1 WHERE name LIKE 'measurements:%';",
 ]
 
 def confirm(question: str) -> bool:
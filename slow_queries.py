@@ -0,0 +1,183 @@
+"""slow_queries.py
+Opt-in slow-query recorder for the SQLite layer.
+
+When SLOW_QUERY_MS is set, every statement that takes longer than that many
+milliseconds (including the time its rows took to fetch, see
+metrics.InstrumentedCursor) is written as one JSON line to a log file shared
+by all workers. The line holds
+the SQL text, the shapes of the bound parameters (types and lengths, never the
+values), the duration, the Flask endpoint and the EXPLAIN QUERY PLAN output,
+taken on the statement's own connection so attached archives and the
+reporting replica are planned too.
+The admin page /slow_queries reads the newest entries back from that file, so
+it shows statements from every worker.
+
+The file is rotated by size across workers: each appends to whatever file
+is at SLOW_QUERY_LOG (reopening it after a rotation, as with logrotate), and
+only one process at a time, holding a lock file, renames a file that has
+grown too large.
+
+When SLOW_QUERY_MS is unset or 0, nothing is registered and the only cost is
+the empty observer loop in metrics.record_statement.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import deque
+from logging.handlers import WatchedFileHandler
+
+from flask import has_request_context, request
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows development server: a single process, no lock needed
+    fcntl = None
+
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+# Statements EXPLAIN QUERY PLAN has nothing useful to say about
+UNPLANNED_PREFIXES = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'PRAGMA', 'CREATE', 'ALTER', 'DROP', 'EXPLAIN',
+                      'ATTACH', 'DETACH')
+
+logger = logging.getLogger('slow_queries')
+
+
+def parameter_shapes(parameters):
+    """Describe bound parameters without leaking their values."""
+    if parameters is None:
+        return None
+
+    def shape(value):
+        if isinstance(value, (str, bytes)):
+            return f'{type(value).__name__}({len(value)})'
+        return type(value).__name__
+
+    if isinstance(parameters, dict):
+        return {name: shape(value) for name, value in parameters.items()}
+    return [shape(value) for value in parameters]
+
+
+def explain_query_plan(database, sql, parameters, connection=None):
+    """Return the plan rows as indented text, or an error note."""
+    if sql.lstrip().upper().startswith(UNPLANNED_PREFIXES):
+        return None
+    explain = f'EXPLAIN QUERY PLAN {sql}'
+    parameters = parameters if parameters is not None else ()
+    rows = None
+    if connection is not None:
+        # The statement's own connection knows its attached archives (or is the
+        # reporting replica). A plain cursor: the EXPLAIN is never recorded, and
+        # it reads no rows, so the caller's transaction stays as it was.
+        try:
+            rows = sqlite3.Cursor(connection).execute(explain, parameters).fetchall()
+        except sqlite3.Error:
+            rows = None  # Closed, or released in another thread
+    if rows is None:
+        # A separate, uninstrumented read-only connection to the main database
+        conn = sqlite3.connect(f'file:{database}?mode=ro', uri=True, timeout=1)
+        try:
+            rows = conn.execute(explain, parameters).fetchall()
+        except sqlite3.Error as e:
+            return f'(EXPLAIN QUERY PLAN failed: {e})'
+        finally:
+            conn.close()
+    depth = {0: 0}
+    lines = []
+    for node_id, parent_id, _, detail in rows:
+        depth[node_id] = depth.get(parent_id, 0) + 1
+        lines.append('  ' * (depth[node_id] - 1) + detail)
+    return '\n'.join(lines)
+
+
+class SharedRotatingFileHandler(WatchedFileHandler):
+    """Size-rotated log file that several processes append to.
+
+    RotatingFileHandler rotates by its own process's count, so with several
+    workers each one renames the file under the others. Here the size is
+    checked on the file itself, a lock file serializes the rename, and every
+    process reopens the new file on its next write (WatchedFileHandler).
+    """
+
+    def __init__(self, filename, max_bytes, backup_count):
+        super().__init__(filename, encoding='utf-8')
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+    def emit(self, record):
+        super().emit(record)
+        try:
+            if os.stat(self.baseFilename).st_size >= self.max_bytes:
+                self.rotate_shared()
+        except OSError:
+            pass
+
+    def rotate_shared(self):
+        with open(self.baseFilename + '.lock', 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another process may have rotated while we waited for the lock
+            if os.stat(self.baseFilename).st_size < self.max_bytes:
+                return
+            for index in range(self.backup_count - 1, 0, -1):
+                source = f'{self.baseFilename}.{index}'
+                if os.path.exists(source):
+                    os.replace(source, f'{self.baseFilename}.{index + 1}')
+            os.replace(self.baseFilename, f'{self.baseFilename}.1')
+
+
+class SlowQueryRecorder:
+    """Statement observer that logs anything slower than the threshold."""
+
+    def __init__(self, database, threshold_ms):
+        self.database = database
+        self.threshold = threshold_ms / 1000
+
+    def __call__(self, sql, parameters, duration, connection=None):
+        if duration < self.threshold:
+            return
+        entry = {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'pid': os.getpid(),
+            'endpoint': (request.endpoint or 'unmatched') if has_request_context() else None,
+            'duration_ms': round(duration * 1000, 2),
+            'sql': ' '.join(sql.split()),
+            'parameters': parameter_shapes(parameters),
+            'plan': explain_query_plan(self.database, sql, parameters, connection),
+        }
+        logger.warning(json.dumps(entry, ensure_ascii=False))
+
+
+def read_recent(log_path, limit=200):
+    """Newest-first entries from the current log file."""
+    try:
+        with open(log_path, encoding='utf-8') as f:
+            lines = deque(f, maxlen=limit)
+    except FileNotFoundError:
+        return []
+    entries = []
+    for line in reversed(lines):
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            continue
+    return entries
+
+
+def init_app(app, database):
+    """Register the recorder if SLOW_QUERY_MS is configured."""
+    threshold_ms = app.config.get('SLOW_QUERY_MS', 0)
+    if not threshold_ms:
+        return
+    log_path = app.config['SLOW_QUERY_LOG']
+    os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+    handler = SharedRotatingFileHandler(log_path, LOG_MAX_BYTES, LOG_BACKUP_COUNT)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.WARNING)
+    logger.propagate = False
+    metrics.statement_observers.append(SlowQueryRecorder(database, threshold_ms))
@@ -0,0 +1,143 @@
+"""sqlite_session.py
+Server-side Flask sessions stored in the application's SQLite database.
+
+The cookie only carries a signed session id; the session data lives in the
+``sessions`` table (created by ``init_db``). Rows are written only when the
+session is modified, so with throttled activity tracking most requests do no
+session I/O beyond a primary-key lookup.
+
+Enable with the SESSION_STORE=sqlite environment variable.
+"""
+
+import hashlib
+import secrets
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+# Expired rows are purged once every PURGE_EVERY session writes per process
+PURGE_EVERY = 500
+
+
+class SQLiteSession(CallbackDict, SessionMixin):
+    """Session dict that remembers its id and whether it was modified."""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        # Id the session had before regenerate(); its row is deleted on save
+        self.stale_sid = None
+
+    def regenerate(self):
+        """Move the session to a fresh id (on login, against session fixation)"""
+        if not self.new and self.stale_sid is None:
+            self.stale_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.new = True
+        self.modified = True
+
+
+class SQLiteSessionInterface(SessionInterface):
+    """Store session data in SQLite and keep only a signed id in the cookie."""
+
+    session_class = SQLiteSession
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, connect):
+        # connect: zero-argument callable returning a sqlite3 connection
+        self.connect = connect
+        self._writes = 0
+
+    def _get_signer(self, app):
+        if not app.secret_key:
+            return None
+        return Signer(app.secret_key, salt="sqlite-session",
+                      key_derivation="hmac", digest_method=hashlib.sha256)
+
+    def _delete(self, sid):
+        conn = self.connect()
+        try:
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def open_session(self, app, request):
+        signer = self._get_signer(app)
+        if signer is None:
+            return None
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = signer.unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            if sid:
+                conn = self.connect()
+                try:
+                    row = conn.execute(
+                        "SELECT data, expiry FROM sessions WHERE sid = ?", (sid,)
+                    ).fetchone()
+                finally:
+                    conn.close()
+                if row and row[1] > time.time():
+                    return self.session_class(self.serializer.loads(row[0]), sid=sid)
+        return self.session_class(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if session.stale_sid:
+            self._delete(session.stale_sid)
+            session.stale_sid = None
+
+        # Emptied session (logout / timeout): drop the row and the cookie
+        if not session:
+            if session.modified:
+                if not session.new:
+                    self._delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+            return
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        expires = self.get_expiration_time(app, session)
+        expiry = expires.timestamp() if expires else time.time() + app.permanent_session_lifetime.total_seconds()
+        conn = self.connect()
+        try:
+            conn.execute(
+                """
+                INSERT INTO sessions (sid, data, expiry) VALUES (?, ?, ?)
+                ON CONFLICT(sid) DO UPDATE SET data = excluded.data, expiry = excluded.expiry
+                """,
+                (session.sid, self.serializer.dumps(dict(session)), int(expiry))
+            )
+            self._writes += 1
+            if self._writes % PURGE_EVERY == 0:
+                conn.execute("DELETE FROM sessions WHERE expiry < ?", (int(time.time()),))
+            conn.commit()
+        finally:
+            conn.close()
+
+        response.set_cookie(name, self._get_signer(app).sign(session.sid).decode(),
+                            expires=expires, httponly=httponly, domain=domain, path=path,
+                            secure=secure, samesite=samesite)
+        response.vary.add("Cookie")
@@ -0,0 +1,115 @@
+"""tabular_import.py
+Read uploaded .xlsx / .csv lists (customer characteristic lists, product
+lists) into plain rows for the bulk imports.
+
+Workbooks are streamed with openpyxl in read-only mode, so a large list never
+has to fit in memory as a whole workbook; openpyxl is imported on first use
+only. CSV files may be UTF-8 (with or without BOM) or Windows-1251 and use
+',', ';' or tab as separator, as Excel writes them with Bulgarian regional
+settings.
+
+The first non-empty row is the header. Columns are found by any of their
+aliases (case and surrounding whitespace are ignored) and every row comes back
+as a dict of the canonical column names plus 'line', its line in the file.
+"""
+
+import csv
+import io
+import os
+
+MAX_IMPORT_ROWS = int(os.environ.get('MAX_IMPORT_ROWS', 5000))
+CSV_DELIMITERS = ',;\t'
+
+
+class TabularImportError(ValueError):
+    """The file cannot be read as a list; the message is shown to the user."""
+
+
+def normalize_header(value):
+    return ' '.join(str(value or '').split()).lower()
+
+
+def parse_number(value):
+    """Float from a cell: numbers as they are, text with a decimal comma too."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    text = str(value or '').strip().replace('\u00a0', '').replace(' ', '')  # Thousands separators
+    if not text:
+        raise ValueError('empty')
+    if ',' in text and '.' not in text:
+        text = text.replace(',', '.')
+    return float(text)
+
+
+def _xlsx_rows(stream):
+    from openpyxl import load_workbook
+    try:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except Exception as e:  # openpyxl raises several types for broken files
+        raise TabularImportError(f'Файлът не може да бъде прочетен като Excel: {e}')
+    try:
+        worksheet = workbook.worksheets[0]
+        for values in worksheet.iter_rows(values_only=True):
+            yield list(values)
+    finally:
+        workbook.close()
+
+
+def _csv_rows(stream):
+    data = stream.read()
+    for encoding in ('utf-8-sig', 'cp1251'):
+        try:
+            text = data.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise TabularImportError('Неразпознато кодиране на CSV файла (очаква се UTF-8 или Windows-1251)')
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=CSV_DELIMITERS)
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.reader(io.StringIO(text), dialect)
+
+
+def read_table(file_storage, columns, required):
+    """Rows of an uploaded .xlsx or .csv file.
+
+    columns maps canonical names to header aliases; required lists the ones
+    that must be present. Raises TabularImportError for unreadable files,
+    missing columns or more than MAX_IMPORT_ROWS rows.
+    """
+    filename = (file_storage.filename or '').lower()
+    if filename.endswith('.xlsx') or filename.endswith('.xlsm'):
+        source = _xlsx_rows(file_storage.stream)
+    elif filename.endswith('.csv') or filename.endswith('.txt'):
+        source = _csv_rows(file_storage.stream)
+    else:
+        raise TabularImportError('Поддържат се само .xlsx и .csv файлове')
+
+    aliases = {normalize_header(alias): name for name, names in columns.items() for alias in (name, *names)}
+    positions = None
+    rows = []
+    for line, values in enumerate(source, start=1):
+        if not any(value not in (None, '') and str(value).strip() for value in values):
+            continue
+        if positions is None:
+            positions = {}
+            for index, value in enumerate(values):
+                name = aliases.get(normalize_header(value))
+                if name and name not in positions:
+                    positions[name] = index
+            missing = [name for name in required if name not in positions]
+            if missing:
+                raise TabularImportError(f"Липсващи колони: {', '.join(missing)}")
+            continue
+        if len(rows) >= MAX_IMPORT_ROWS:
+            raise TabularImportError(f'Файлът има повече от {MAX_IMPORT_ROWS} реда')
+        row = {'line': line}
+        for name, index in positions.items():
+            value = values[index] if index < len(values) else None
+            row[name] = value.strip() if isinstance(value, str) else value
+        rows.append(row)
+    if positions is None:
+        raise TabularImportError('Файлът е празен')
+    return rows
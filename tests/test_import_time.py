@@ -0,0 +1,57 @@
+"""
+Cold-start budget for importing the app.
+
+Workers are recycled every ~1000 requests, and measurement_writer.py and the
+utility scripts import app.py too, so import cost is paid constantly. Heavy
+libraries must only be loaded on the code paths that use them, and the whole
+import must stay within IMPORT_BUDGET_MS (override with QC_IMPORT_BUDGET_MS on
+slow machines).
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_BUDGET_MS = float(os.environ.get('QC_IMPORT_BUDGET_MS', 500))
+# Loaded lazily: openpyxl/Pillow by /export_excel, numpy by the mold forecasts
+HEAVY_MODULES = ('pandas', 'numpy', 'openpyxl', 'PIL')
+
+
+@pytest.fixture
+def app_env(tmp_path):
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_PATH': str(tmp_path / 'quality_control.db'),
+        'METRICS_DIR': str(tmp_path / 'metrics'),
+        'ADMISSION_DIR': str(tmp_path / 'admission'),
+        'REPORT_CACHE_DIR': str(tmp_path / 'report_cache'),
+        'SLOW_QUERY_MS': '0',
+    })
+    return env
+
+
+def run_python(code, env, *flags):
+    result = subprocess.run([sys.executable, *flags, '-c', code], cwd=REPO_ROOT, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result
+
+
+def test_heavy_modules_not_imported(app_env):
+    code = f"import json, sys, app; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    loaded = json.loads(run_python(code, app_env).stdout.strip().splitlines()[-1])
+    assert loaded == [], f"imported at start-up: {loaded}"
+
+
+def test_import_time_within_budget(app_env):
+    # Best of three runs, so a busy machine does not fail the test on its own
+    timings = []
+    for _ in range(3):
+        stderr = run_python('import app', app_env, '-X', 'importtime').stderr
+        line = next(line for line in reversed(stderr.splitlines()) if line.rstrip().endswith('| app'))
+        timings.append(int(line.split('|')[1]) / 1000)
+    assert min(timings) <= IMPORT_BUDGET_MS, f"import app took {min(timings):.0f} ms (budget {IMPORT_BUDGET_MS:.0f} ms)"
@@ -0,0 +1,142 @@
+"""
+Concurrency tests for the measurement write path.
+
+Many connections submit measurements for the same machine at once. Every
+submission switches the machine to a new product, so each one must credit the
+previous product's mold exactly once. A lost or doubled read of
+machine_last_product shows up as a mismatch in the cycle ledger.
+"""
+
+import sqlite3
+import threading
+
+import pytest
+
+import app as qc_app
+
+THREADS = 8
+SUBMISSIONS_PER_THREAD = 25
+MACHINE = 'M1'
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    path = str(tmp_path / 'quality_control.db')
+    monkeypatch.setattr(qc_app, 'DATABASE', path)
+    qc_app.init_db()
+
+    conn = qc_app.get_db_connection()
+    for index in range(THREADS * SUBMISSIONS_PER_THREAD):
+        product_id = conn.execute(
+            "INSERT INTO products (product_name, drawing_number) VALUES (?, ?)",
+            (f'P{index}', f'D{index}')
+        ).lastrowid
+        conn.execute(
+            "INSERT INTO dimensions (product_id, dimension_name, nominal_value, tolerance_minus, tolerance_plus) VALUES (?, 'L', 10, 0.1, 0.1)",
+            (product_id,)
+        )
+        conn.execute(
+            "INSERT INTO molds (product_id, mold_name, mold_number, created_date) VALUES (?, ?, ?, '2026-01-01 00:00:00')",
+            (product_id, f'Mold {index}', f'MF{index}')
+        )
+    conn.commit()
+    conn.close()
+    return path
+
+
+def make_submission(conn, product_id, count):
+    dimension_id = conn.execute("SELECT id FROM dimensions WHERE product_id = ?", (product_id,)).fetchone()['id']
+    return {
+        'product_id': product_id,
+        'machine_number': MACHINE,
+        'count': count,
+        'iso_date': qc_app.get_bulgarian_time_string(),
+        'shift': '1',
+        'inspector': 'tester',
+        'values': [[dimension_id, 10.0]],
+    }
+
+
+def test_concurrent_submissions_lose_no_cycles(database):
+    conn = qc_app.get_db_connection()
+    product_ids = [row['id'] for row in conn.execute("SELECT id FROM products ORDER BY id")]
+    submissions = [make_submission(conn, product_id, 10 + index) for index, product_id in enumerate(product_ids)]
+    conn.close()
+
+    results = []
+    errors = []
+    start = threading.Barrier(THREADS)
+
+    def worker(chunk):
+        worker_conn = qc_app.get_db_connection()
+        start.wait()
+        try:
+            for submission in chunk:
+                results.extend(qc_app.save_measurement_submissions(worker_conn, [submission]))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            worker_conn.close()
+
+    threads = [
+        threading.Thread(target=worker, args=(submissions[i::THREADS],))
+        for i in range(THREADS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert [result['status'] for result in results] == ['saved'] * len(submissions)
+
+    conn = qc_app.get_db_connection()
+    credited = conn.execute(
+        "SELECT COALESCE(SUM(delta), 0) FROM mold_cycle_events WHERE source = 'measurement'"
+    ).fetchone()[0]
+    pending = conn.execute(
+        "SELECT last_count FROM machine_last_product WHERE machine_number = ?", (MACHINE,)
+    ).fetchone()['last_count']
+    # Every count is either credited to a mold or still pending on the machine
+    assert credited + pending == sum(submission['count'] for submission in submissions)
+
+    # ...and no mold was credited twice
+    doubled = conn.execute(
+        "SELECT COUNT(*) FROM (SELECT mold_id FROM mold_cycle_events WHERE source = 'measurement' GROUP BY mold_id HAVING COUNT(*) > 1)"
+    ).fetchone()[0]
+    assert doubled == 0
+
+    assert conn.execute("SELECT COUNT(*) FROM measurements").fetchone()[0] == len(submissions)
+    assert conn.execute(
+        "SELECT COUNT(*) FROM machine_mold_assignments WHERE machine_number = ? AND status = 'active'", (MACHINE,)
+    ).fetchone()[0] == 1
+
+    last_submission_id = conn.execute(
+        "SELECT last_submission_id FROM machine_last_product WHERE machine_number = ?", (MACHINE,)
+    ).fetchone()[0]
+    assert last_submission_id == conn.execute("SELECT MAX(id) FROM measurement_submissions").fetchone()[0]
+    conn.close()
+
+
+def test_locked_database_is_retried(database):
+    conn = qc_app.get_db_connection()
+    submission = make_submission(conn, 1, 10)
+    conn.close()
+
+    # Hold the write lock briefly from another connection
+    blocker = sqlite3.connect(database, isolation_level=None, check_same_thread=False)
+    blocker.execute("BEGIN IMMEDIATE")
+    release = threading.Timer(0.2, blocker.execute, args=("COMMIT",))
+    release.start()
+
+    # No busy timeout: only the retry loop can wait for the lock
+    writer = sqlite3.connect(database, timeout=0)
+    writer.row_factory = sqlite3.Row
+    try:
+        results = qc_app.save_measurement_submissions(writer, [submission])
+    finally:
+        release.join()
+        writer.close()
+        blocker.close()
+
+    assert results[0]['status'] == 'saved'
@@ -0,0 +1,130 @@
+"""
+Conversion of the old one-row-per-value measurements table.
+
+init_db turns a legacy measurements table into submission headers and value
+rows. Rows of one submission share a header that keeps the id of their first
+row, a dimension measured twice in one group goes to a second header, ids of
+deleted rows are never reused, and machine_last_product follows its row to
+the new header.
+"""
+
+import logging
+
+import pytest
+
+import app as qc_app
+
+LEGACY_MEASUREMENTS = '''
+CREATE TABLE measurements (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id INTEGER NOT NULL,
+    dimension_id INTEGER NOT NULL,
+    measured_value REAL NOT NULL,
+    measurement_date TEXT NOT NULL,
+    machine_number TEXT,
+    count INTEGER,
+    inspector TEXT,
+    shift TEXT,
+    submission_id TEXT
+)
+'''
+# id, dimension, value, date, submission_id
+LEGACY_ROWS = [
+    # One submission older than the submission_id column
+    (1, 'A', 10.0, '2024-01-02 08:00:00', None),
+    (2, 'B', 20.0, '2024-01-02 08:00:00', None),
+    # A measured twice in one group: the second A starts a second header
+    (3, 'A', 10.1, '2024-01-02 09:00:00', None),
+    (4, 'A', 10.2, '2024-01-02 09:00:00', None),
+    (5, 'B', 20.1, '2024-01-02 09:00:00', None),
+    # Grouped by submission_id
+    (6, 'A', 10.3, '2024-01-03 08:00:00', 'sub-1'),
+    (7, 'B', 20.3, '2024-01-03 08:00:00', 'sub-1'),
+    (8, 'A', 10.4, 'yesterday', None),
+    # Deleted before the migration; their ids must not come back
+    (9, 'A', 10.5, '2024-01-04 08:00:00', None),
+    (10, 'A', 10.6, '2024-01-04 09:00:00', None),
+]
+
+
+@pytest.fixture
+def legacy_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(qc_app, 'DATABASE', str(tmp_path / 'quality_control.db'))
+    qc_app.init_db()
+
+    conn = qc_app.get_db_connection()
+    product_id = conn.execute(
+        "INSERT INTO products (product_name, drawing_number) VALUES ('P', 'D')"
+    ).lastrowid
+    dimension_ids = {}
+    for name in ('A', 'B'):
+        dimension_ids[name] = conn.execute(
+            "INSERT INTO dimensions (product_id, dimension_name, nominal_value, tolerance_minus, tolerance_plus) VALUES (?, ?, 10, 0.1, 0.1)",
+            (product_id, name)
+        ).lastrowid
+    # Back to the old layout
+    conn.execute("DROP VIEW measurements")
+    conn.execute("DROP TABLE measurement_values")
+    conn.execute("DROP TABLE measurement_submissions")
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'measurement_submissions'")
+    conn.execute(LEGACY_MEASUREMENTS)
+    conn.executemany(
+        "INSERT INTO measurements (id, product_id, dimension_id, measured_value, measurement_date, machine_number, count, inspector, shift, submission_id) "
+        "VALUES (?, ?, ?, ?, ?, 'M1', 5, 'tester', '1', ?)",
+        [(row_id, product_id, dimension_ids[dimension], value, date, submission_id)
+         for row_id, dimension, value, date, submission_id in LEGACY_ROWS]
+    )
+    conn.execute("DELETE FROM measurements WHERE id IN (9, 10)")
+    conn.execute(
+        "INSERT INTO machine_last_product (machine_number, last_product_id, last_count, last_submission_id, last_update) "
+        "VALUES ('M1', ?, 5, 7, '2024-01-03 08:00:00')", (product_id,)
+    )
+    conn.commit()
+    conn.close()
+    return dimension_ids
+
+
+def test_legacy_measurements_are_converted(legacy_database, caplog):
+    dimension_ids = legacy_database
+    with caplog.at_level(logging.WARNING, logger=qc_app.logger.name):
+        qc_app.init_db()
+
+    conn = qc_app.get_db_connection()
+    assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'measurements'").fetchone()[0] == 'view'
+
+    headers = {row['id']: row['measured_at'] for row in conn.execute("SELECT id, measured_at FROM measurement_submissions")}
+    assert headers == {
+        1: qc_app.local_epoch('2024-01-02 08:00:00'),
+        3: qc_app.local_epoch('2024-01-02 09:00:00'),
+        4: qc_app.local_epoch('2024-01-02 09:00:00'),
+        6: qc_app.local_epoch('2024-01-03 08:00:00'),
+        8: 0,
+    }
+    values = {
+        (row['submission_id'], row['dimension_id']): row['measured_value']
+        for row in conn.execute("SELECT submission_id, dimension_id, measured_value FROM measurement_values")
+    }
+    a, b = dimension_ids['A'], dimension_ids['B']
+    assert values == {
+        (1, a): 10.0, (1, b): 20.0,
+        (3, a): 10.1, (3, b): 20.1,
+        (4, a): 10.2,
+        (6, a): 10.3, (6, b): 20.3,
+        (8, a): 10.4,
+    }
+    # The view gives back the entered text and the interned names
+    row = conn.execute("SELECT * FROM measurements WHERE submission_id = 1 AND dimension_id = ?", (a,)).fetchone()
+    assert (row['measurement_date'], row['machine_number'], row['inspector'], row['shift']) == \
+        ('2024-01-02 08:00:00', 'M1', 'tester', '1')
+
+    # Row 7 belonged to the submission headed by row 6
+    assert conn.execute("SELECT last_submission_id FROM machine_last_product WHERE machine_number = 'M1'").fetchone()[0] == 6
+    # Ids 9 and 10 were handed out before; the next submission gets 11
+    new_id = conn.execute(
+        "INSERT INTO measurement_submissions (product_id, measured_at) VALUES (1, 0)"
+    ).lastrowid
+    assert new_id == 11
+    conn.rollback()
+    conn.close()
+
+    assert any('unreadable measurement_date (first id 8)' in record.getMessage() for record in caplog.records)
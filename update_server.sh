@@ -45,7 +45,12 @@ mkdir -p "$BACKUP_DIR"
 
 # Backup critical data
 print_status "Backing up database..."
-cp quality_control.db "$BACKUP_DIR/quality_control.db"
+# Online backup API copy, verified with integrity_check (a plain cp can capture
+# a torn file while the app is writing)
+if ! python3 backup_db.py --database quality_control.db --output "$BACKUP_DIR/quality_control.db"; then
+    print_error "Database backup failed - aborting update"
+    exit 1
+fi
 
 print_status "Backing up uploaded files..."
 if [ -d "static/drawings" ]; then